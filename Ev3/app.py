@@ -1,50 +1,138 @@
+import time
+from inicio import TiemposInicio
+
+# Se crea antes de las demás importaciones para medir también su costo
+tiempos_inicio = TiemposInicio()
+
 import customtkinter as ctk
 from tkinter import messagebox, ttk, filedialog
+import importlib
 import json
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from database import get_session, engine, Base
+from database import SessionLocal
+from migraciones import inicializar_base_datos
 from crud.cliente_crud import ClienteCRUD
 from crud.ingrediente_crud import IngredienteCRUD
 from crud.menu_crud import MenuCRUD
 from crud.pedido_crud import PedidoCRUD
-from graficos import GraficosEstadisticos
+from tareas import TareaSegundoPlano, ServicioDatos
+from tabla_virtual import TablaVirtual
+from monitor_cambios import MonitorCambios
+from cache import cache_lecturas
 
 # Configuración del tema y apariencia de la interfaz gráfica
 ctk.set_appearance_mode("System")  # Adaptarse al tema del sistema
 ctk.set_default_color_theme("blue")  # Esquema de colores azul
 
-# Inicializar estructura de base de datos
-Base.metadata.create_all(bind=engine)
+# matplotlib y graficos no se importan aquí: se cargan al abrir la pestaña Gráficos
+tiempos_inicio.marcar("importaciones")
+
 class App(ctk.CTk):
     """Aplicación principal del sistema de gestión de restaurante."""
     
     def __init__(self):
         """Inicializa la ventana principal y todos los módulos de la aplicación."""
         super().__init__()
+        self._arranque_informado = False
 
         # Configuración de ventana principal
         self.title("Sistema de Gestión - Restaurante")
         self.geometry("1024x768")
 
-        # Crear contenedor de pestañas para organización modular
-        self.tabview = ctk.CTkTabview(self)
-        self.tabview.pack(pady=20, padx=20, fill="both", expand=True)
+        # Las consultas corren en un grupo de hilos para no congelar la ventana
+        self.datos = ServicioDatos(self, al_cambiar_pendientes=self.mostrar_estado_carga)
+        self.protocol("WM_DELETE_WINDOW", self.cerrar)
 
-        # Inicializar pestañas de funcionalidades
-        self.tab_clientes = self.tabview.add("Clientes")
-        self.crear_formulario_cliente(self.tab_clientes)
+        # Barra de estado: indica cuando hay consultas en curso
+        self.label_estado = ctk.CTkLabel(self, text="", anchor="w")
+        self.label_estado.pack(side="bottom", fill="x", padx=25)
 
-        self.tab_ingredientes = self.tabview.add("Ingredientes")
-        self.crear_formulario_ingrediente(self.tab_ingredientes)
+        tiempos_inicio.marcar("ventana")
 
-        self.tab_menus = self.tabview.add("Menús")
-        self.crear_formulario_menu(self.tab_menus)
+        # Crear contenedor de pestañas para organización modular
+        self.tabview = ctk.CTkTabview(self, command=self.al_cambiar_pestana)
+        self.tabview.pack(pady=20, padx=20, fill="both", expand=True)
+
+        # Las pestañas se agregan vacías; su contenido se construye la primera vez que se abren
+        self.constructores_pestanas = {
+            "Clientes": self.crear_formulario_cliente,
+            "Ingredientes": self.crear_formulario_ingrediente,
+            "Menús": self.crear_formulario_menu,
+            "Pedidos": self.crear_formulario_pedido,
+            "Gráficos": self.crear_formulario_graficos,
+        }
+        self.pestanas_construidas = set()
+        for nombre in self.constructores_pestanas:
+            self.tabview.add(nombre)
+        self.al_cambiar_pestana()
+        tiempos_inicio.marcar(f"pestaña {self.tabview.get()}")
+
+        # Qué refrescar en cada pestaña cuando otra terminal modifica una tabla
+        self.refrescos_pestanas = {
+            "Clientes": {"Clientes": self.cargar_clientes},
+            "Ingredientes": {"Ingredientes": self.cargar_ingredientes},
+            "Menús": {"Menus": self.cargar_menus},
+            "Pedidos": {"Pedidos": self.cargar_pedidos, "Clientes": self.cargar_clientes_pedido,
+                        "Menus": self.cargar_menus_pedido, "Ingredientes": self.cargar_menus_pedido,
+                        "RecetaIngredientes": self.cargar_menus_pedido, "RecetasPlanas": self.cargar_menus_pedido},
+        }
+        self.refrescos_pendientes = {}  # pestaña -> refrescos para cuando se vuelva a abrir
+        self.monitor = MonitorCambios(self, self.al_cambiar_tablas,
+                                      al_error=self.avisar_error("Error al revisar cambios en la base"))
+        self.monitor.iniciar()
+
+    def al_cambiar_pestana(self):
+        """Construye la pestaña seleccionada si es la primera vez que se abre."""
+        nombre = self.tabview.get()
+        if nombre in self.pestanas_construidas:
+            # Aplica los cambios llegados mientras la pestaña estaba oculta
+            for refrescar in self.refrescos_pendientes.pop(nombre, ()):
+                refrescar()
+            return
+        self.pestanas_construidas.add(nombre)
+        inicio = time.perf_counter()
+        self.constructores_pestanas[nombre](self.tabview.tab(nombre))
+        tiempos_inicio.mostrar(f"Pestaña {nombre} construida en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+
+    def mostrar_estado_carga(self, pendientes: int):
+        """Muestra en la barra de estado si hay consultas en curso."""
+        self.label_estado.configure(text=f"Cargando... ({pendientes} en curso)" if pendientes else "")
+        if not pendientes and not self._arranque_informado:
+            # Llegaron los primeros datos: termina el arranque
+            self._arranque_informado = True
+            tiempos_inicio.marcar("primera página de datos")
+            tiempos_inicio.mostrar(tiempos_inicio.informe())
+
+    def avisar_error(self, prefijo: str = None):
+        """Crea el callback de error que muestra el mensaje al usuario."""
+        def mostrar(error):
+            messagebox.showerror("Error", f"{prefijo}: {error}" if prefijo else str(error))
+        return mostrar
+
+    def al_cambiar_tablas(self, tablas):
+        """Refresca la pestaña visible si muestra alguna de las tablas que cambiaron.
+
+        Las demás pestañas ya construidas quedan anotadas y se refrescan al abrirlas;
+        cada refresco pide solo las filas modificadas.
+        """
+        # Lo que otra terminal cambió no pasó por los eventos de este proceso
+        cache_lecturas.invalidar_tablas(tablas)
+
+        visible = self.tabview.get()
+        for pestana in self.pestanas_construidas:
+            refrescos = {refrescar for tabla, refrescar in self.refrescos_pestanas.get(pestana, {}).items()
+                         if tabla in tablas}
+            if pestana == visible:
+                for refrescar in refrescos:
+                    refrescar()
+            elif refrescos:
+                self.refrescos_pendientes.setdefault(pestana, set()).update(refrescos)
+
+    def cerrar(self):
+        """Detiene el servicio de datos y el monitor de cambios antes de cerrar la ventana."""
+        self.monitor.detener()
+        self.datos.cerrar()
+        self.destroy()
 
-        self.tab_pedidos = self.tabview.add("Pedidos")
-        self.crear_formulario_pedido(self.tab_pedidos)
-        
-        self.tab_graficos = self.tabview.add("Gráficos")
-        self.crear_formulario_graficos(self.tab_graficos)
     # Módulo de gestión de clientes
     def crear_formulario_cliente(self, parent):
         """Crea interfaz completa para gestión de clientes."""
@@ -75,35 +163,20 @@ class App(ctk.CTk):
         frame_inferior = ctk.CTkFrame(parent)
         frame_inferior.pack(pady=10, padx=10, fill="both", expand=True)
 
-        # Tabla para mostrar clientes registrados
-        self.treeview_clientes = ttk.Treeview(frame_inferior, columns=("ID", "RUT", "Nombre", "Correo"), show="headings")
-        self.treeview_clientes.heading("ID", text="ID")
-        self.treeview_clientes.heading("RUT", text="RUT")
-        self.treeview_clientes.heading("Nombre", text="Nombre")
-        self.treeview_clientes.heading("Correo", text="Correo")
-        self.treeview_clientes.column("ID", width=50)
-        self.treeview_clientes.column("Correo", width=200)
-        self.treeview_clientes.pack(pady=10, padx=10, fill="both", expand=True)
+        # Tabla para mostrar clientes registrados (se carga por páginas al desplazarse)
+        self.tabla_clientes = TablaVirtual(
+            frame_inferior, self.datos, "clientes",
+            [("ID", "id", 50), ("RUT", "rut", 120), ("Nombre", "nombre", 200), ("Correo", "correo", 200)],
+            ClienteCRUD.listar_clientes, ClienteCRUD.cambios_clientes
+        )
+        self.tabla_clientes.pack(pady=10, padx=10, fill="both", expand=True)
 
         # Cargar datos iniciales
         self.cargar_clientes()
 
-        self.cargar_clientes()
-
     def cargar_clientes(self):
-        """Actualiza la tabla de clientes con datos de la base de datos."""
-        db = next(get_session())
-        # Limpiar tabla antes de cargar nuevos datos
-        self.treeview_clientes.delete(*self.treeview_clientes.get_children())
-        try:
-            clientes = ClienteCRUD.obtener_todos_clientes(db)
-            # Insertar cada cliente en la tabla
-            for cliente in clientes:
-                self.treeview_clientes.insert("", "end", values=(cliente.id, cliente.rut, cliente.nombre, cliente.correo or ""))
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar clientes: {e}")
-        finally:
-            db.close()
+        """Actualiza la tabla de clientes con los cambios de la base de datos."""
+        self.tabla_clientes.actualizar()
 
     def crear_cliente(self):
         """Procesa la creación de un nuevo cliente con validación de campos."""
@@ -113,62 +186,55 @@ class App(ctk.CTk):
         correo = self.entry_correo_cliente.get().strip()
         
         if rut and nombre:
-            db = next(get_session())
-            try:
-                ClienteCRUD.crear_cliente(db, rut, nombre, correo if correo else None)
+            def creado(_):
                 messagebox.showinfo("Éxito", "Cliente creado correctamente.")
                 self.cargar_clientes()  # Actualizar tabla
                 # Limpiar campos después de creación exitosa
                 self.entry_rut.delete(0, 'end')
                 self.entry_nombre_cliente.delete(0, 'end')
                 self.entry_correo_cliente.delete(0, 'end')
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-            finally:
-                db.close()
+
+            self.datos.ejecutar(
+                lambda db: ClienteCRUD.crear_cliente(db, rut, nombre, correo if correo else None),
+                creado, self.avisar_error()
+            )
         else:
             messagebox.showwarning("Campos Vacíos", "Por favor, ingrese RUT y nombre.")
 
     def actualizar_cliente(self):
-        selected = self.treeview_clientes.selection()
-        if not selected:
+        cliente_id = self.tabla_clientes.id_seleccionado()
+        if cliente_id is None:
             messagebox.showwarning("Selección", "Seleccione un cliente.")
             return
-        cliente_id = self.treeview_clientes.item(selected)["values"][0]
         rut = self.entry_rut.get().strip()
         nombre = self.entry_nombre_cliente.get().strip()
         correo = self.entry_correo_cliente.get().strip()
         
-        db = next(get_session())
-        try:
-            ClienteCRUD.actualizar_cliente(
+        def actualizado(_):
+            messagebox.showinfo("Éxito", "Cliente actualizado.")
+            self.cargar_clientes()
+
+        self.datos.ejecutar(
+            lambda db: ClienteCRUD.actualizar_cliente(
                 db, cliente_id, 
                 rut if rut else None, 
                 nombre if nombre else None,
                 correo if correo else None
-            )
-            messagebox.showinfo("Éxito", "Cliente actualizado.")
-            self.cargar_clientes()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+            ),
+            actualizado, self.avisar_error()
+        )
 
     def eliminar_cliente(self):
-        selected = self.treeview_clientes.selection()
-        if not selected:
+        cliente_id = self.tabla_clientes.id_seleccionado()
+        if cliente_id is None:
             messagebox.showwarning("Selección", "Seleccione un cliente.")
             return
-        cliente_id = self.treeview_clientes.item(selected)["values"][0]
-        db = next(get_session())
-        try:
-            ClienteCRUD.eliminar_cliente(db, cliente_id)
+
+        def eliminado(_):
             messagebox.showinfo("Éxito", "Cliente eliminado.")
             self.cargar_clientes()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+
+        self.datos.ejecutar(lambda db: ClienteCRUD.eliminar_cliente(db, cliente_id), eliminado, self.avisar_error())
     # Módulo de gestión de ingredientes
     def crear_formulario_ingrediente(self, parent):
         """Crea interfaz para gestión de inventario de ingredientes."""
@@ -203,32 +269,35 @@ class App(ctk.CTk):
         ctk.CTkButton(frame_superior, text="Eliminar", command=self.eliminar_ingrediente).grid(row=1, column=2, pady=10, padx=5)
         ctk.CTkButton(frame_superior, text="Refrescar", command=self.cargar_ingredientes).grid(row=1, column=3, pady=10, padx=5)
         # Botón para importación masiva desde archivo CSV
-        ctk.CTkButton(frame_superior, text="Cargar CSV", command=self.cargar_csv_ingredientes).grid(row=1, column=4, pady=10, padx=5)
+        self.boton_cargar_csv = ctk.CTkButton(frame_superior, text="Cargar CSV", command=self.cargar_csv_ingredientes)
+        self.boton_cargar_csv.grid(row=1, column=4, pady=10, padx=5)
+
+        # Avance de la importación CSV (se ejecuta en segundo plano)
+        self.tarea_csv = None
+        self.progreso_csv = ctk.CTkProgressBar(frame_superior, width=300)
+        self.progreso_csv.grid(row=2, column=0, columnspan=3, pady=(0, 10), padx=10, sticky="w")
+        self.progreso_csv.set(0)
+        self.label_progreso_csv = ctk.CTkLabel(frame_superior, text="")
+        self.label_progreso_csv.grid(row=2, column=3, columnspan=2, pady=(0, 10), padx=5, sticky="w")
+        self.boton_cancelar_csv = ctk.CTkButton(
+            frame_superior, text="Cancelar carga", command=self.cancelar_carga_csv, state="disabled"
+        )
+        self.boton_cancelar_csv.grid(row=2, column=5, pady=(0, 10), padx=5)
 
         frame_inferior = ctk.CTkFrame(parent)
         frame_inferior.pack(pady=10, padx=10, fill="both", expand=True)
 
-        self.treeview_ingredientes = ttk.Treeview(frame_inferior, columns=("ID", "Nombre", "Stock", "Unidad"), show="headings")
-        self.treeview_ingredientes.heading("ID", text="ID")
-        self.treeview_ingredientes.heading("Nombre", text="Nombre")
-        self.treeview_ingredientes.heading("Stock", text="Stock")
-        self.treeview_ingredientes.heading("Unidad", text="Unidad")
-        self.treeview_ingredientes.column("ID", width=50)
-        self.treeview_ingredientes.pack(pady=10, padx=10, fill="both", expand=True)
+        self.tabla_ingredientes = TablaVirtual(
+            frame_inferior, self.datos, "ingredientes",
+            [("ID", "id", 50), ("Nombre", "nombre", 200), ("Stock", "stock", 120), ("Unidad", "unidad", 120)],
+            IngredienteCRUD.listar_ingredientes, IngredienteCRUD.cambios_ingredientes
+        )
+        self.tabla_ingredientes.pack(pady=10, padx=10, fill="both", expand=True)
 
         self.cargar_ingredientes()
 
     def cargar_ingredientes(self):
-        db = next(get_session())
-        self.treeview_ingredientes.delete(*self.treeview_ingredientes.get_children())
-        try:
-            ingredientes = IngredienteCRUD.obtener_todos_ingredientes(db)
-            for ing in ingredientes:
-                self.treeview_ingredientes.insert("", "end", values=(ing.id, ing.nombre, ing.stock, ing.unidad))
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar ingredientes: {e}")
-        finally:
-            db.close()
+        self.tabla_ingredientes.actualizar()
 
     def crear_ingrediente(self):
         nombre = self.entry_nombre_ingrediente.get().strip()
@@ -236,65 +305,68 @@ class App(ctk.CTk):
         unidad = self.combo_unidad.get().strip()
 
         if nombre and stock and unidad:
-            db = next(get_session())
-            try:
-                IngredienteCRUD.crear_ingrediente(db, nombre, float(stock), unidad)
+            def creado(_):
                 messagebox.showinfo("Éxito", "Ingrediente creado.")
                 self.cargar_ingredientes()
                 # Limpiar campos
                 self.entry_nombre_ingrediente.delete(0, 'end')
                 self.entry_stock.delete(0, 'end')
                 self.combo_unidad.set("gramos")
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-            finally:
-                db.close()
+
+            try:
+                stock = float(stock)
+            except ValueError:
+                messagebox.showerror("Error", "El stock debe ser un número.")
+                return
+            self.datos.ejecutar(
+                lambda db: IngredienteCRUD.crear_ingrediente(db, nombre, stock, unidad),
+                creado, self.avisar_error()
+            )
         else:
             messagebox.showwarning("Campos Vacíos", "Complete todos los campos.")
 
 
     def actualizar_ingrediente(self):
-        selected = self.treeview_ingredientes.selection()
-        if not selected:
+        ing_id = self.tabla_ingredientes.id_seleccionado()
+        if ing_id is None:
             messagebox.showwarning("Selección", "Seleccione un ingrediente.")
             return
-
-        ing_id = self.treeview_ingredientes.item(selected)["values"][0]
         nombre = self.entry_nombre_ingrediente.get().strip()
         stock = self.entry_stock.get().strip()
         unidad = self.combo_unidad.get().strip()
 
-        db = next(get_session())
         try:
-            IngredienteCRUD.actualizar_ingrediente(
+            stock = float(stock) if stock else None
+        except ValueError:
+            messagebox.showerror("Error", "El stock debe ser un número.")
+            return
+
+        def actualizado(_):
+            messagebox.showinfo("Éxito", "Ingrediente actualizado.")
+            self.cargar_ingredientes()
+
+        self.datos.ejecutar(
+            lambda db: IngredienteCRUD.actualizar_ingrediente(
                 db, ing_id,
                 nombre if nombre else None,
-                float(stock) if stock else None,
+                stock,
                 unidad if unidad else None
-            )
-            messagebox.showinfo("Éxito", "Ingrediente actualizado.")
-            self.cargar_ingredientes()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+            ),
+            actualizado, self.avisar_error()
+        )
 
 
     def eliminar_ingrediente(self):
-        selected = self.treeview_ingredientes.selection()
-        if not selected:
+        ing_id = self.tabla_ingredientes.id_seleccionado()
+        if ing_id is None:
             messagebox.showwarning("Selección", "Seleccione un ingrediente.")
             return
-        ing_id = self.treeview_ingredientes.item(selected)["values"][0]
-        db = next(get_session())
-        try:
-            IngredienteCRUD.eliminar_ingrediente(db, ing_id)
+
+        def eliminado(_):
             messagebox.showinfo("Éxito", "Ingrediente eliminado.")
             self.cargar_ingredientes()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+
+        self.datos.ejecutar(lambda db: IngredienteCRUD.eliminar_ingrediente(db, ing_id), eliminado, self.avisar_error())
 
     # Menús
     def crear_formulario_menu(self, parent):
@@ -320,33 +392,59 @@ class App(ctk.CTk):
         ctk.CTkButton(frame_superior, text="Crear", command=self.crear_menu).grid(row=3, column=0, pady=10, padx=5)
         ctk.CTkButton(frame_superior, text="Eliminar", command=self.eliminar_menu).grid(row=3, column=1, pady=10, padx=5)
         ctk.CTkButton(frame_superior, text="Refrescar", command=self.cargar_menus).grid(row=3, column=2, pady=10, padx=5)
+        ctk.CTkButton(frame_superior, text="Importar catálogo", command=self.importar_catalogo_menus).grid(row=3, column=3, pady=10, padx=5)
+        ctk.CTkButton(frame_superior, text="Exportar catálogo", command=self.exportar_catalogo_menus).grid(row=3, column=4, pady=10, padx=5)
 
         frame_inferior = ctk.CTkFrame(parent)
         frame_inferior.pack(pady=10, padx=10, fill="both", expand=True)
 
-        self.treeview_menus = ttk.Treeview(frame_inferior, columns=("ID", "Nombre", "Precio", "Categoría", "Disponible"), show="headings")
-        self.treeview_menus.heading("ID", text="ID")
-        self.treeview_menus.heading("Nombre", text="Nombre")
-        self.treeview_menus.heading("Precio", text="Precio")
-        self.treeview_menus.heading("Categoría", text="Categoría")
-        self.treeview_menus.heading("Disponible", text="Disponible")
-        self.treeview_menus.column("ID", width=50)
-        self.treeview_menus.pack(pady=10, padx=10, fill="both", expand=True)
+        self.tabla_menus = TablaVirtual(
+            frame_inferior, self.datos, "menus",
+            [("ID", "id", 50), ("Nombre", "nombre", 200), ("Precio", "precio", 100),
+             ("Categoría", "categoria", 150), ("Disponible", "disponible", 100)],
+            MenuCRUD.listar_menus, MenuCRUD.cambios_menus,
+            formatear=lambda fila: fila[:4] + (("Sin stock" if fila[5] else "Sí") if fila[4] else "No",)
+        )
+        self.tabla_menus.pack(pady=10, padx=10, fill="both", expand=True)
 
         self.cargar_menus()
 
     def cargar_menus(self):
-        db = next(get_session())
-        self.treeview_menus.delete(*self.treeview_menus.get_children())
-        try:
-            menus = MenuCRUD.obtener_todos_menus(db)
-            for menu in menus:
-                disp = "Sí" if menu.disponible else "No"
-                self.treeview_menus.insert("", "end", values=(menu.id, menu.nombre, menu.precio, menu.categoria, disp))
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar menús: {e}")
-        finally:
-            db.close()
+        self.tabla_menus.actualizar()
+
+    def importar_catalogo_menus(self):
+        """Crea o actualiza menús, con sus recetas, desde un CSV o JSON lines."""
+        archivo = filedialog.askopenfilename(
+            title="Seleccionar catálogo de menús",
+            filetypes=[("CSV o JSON lines", "*.csv *.jsonl *.ndjson"), ("All files", "*.*")]
+        )
+        if not archivo:
+            return
+
+        def importado(resultados):
+            mensaje = f"Menús importados: {resultados['exitosos']}\nErrores: {resultados['errores']}\n"
+            if resultados['archivo_errores']:
+                mensaje += f"Detalle de errores en: {resultados['archivo_errores']}\n"
+            mensaje += "\n" + "\n".join(f"• {msg}" for msg in resultados['mensajes'][:10])
+            messagebox.showinfo("Importar catálogo", mensaje)
+            self.cargar_menus()
+
+        self.datos.ejecutar(lambda db: MenuCRUD.cargar_desde_archivo(db, archivo), importado, self.avisar_error())
+
+    def exportar_catalogo_menus(self):
+        """Guarda todos los menús con sus recetas en el formato que lee la importación."""
+        archivo = filedialog.asksaveasfilename(
+            title="Exportar catálogo de menús", defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON lines", "*.jsonl")]
+        )
+        if not archivo:
+            return
+
+        self.datos.ejecutar(
+            lambda db: MenuCRUD.exportar_a_archivo(db, archivo),
+            lambda total: messagebox.showinfo("Exportar catálogo", f"{total} menús exportados a {archivo}"),
+            self.avisar_error()
+        )
 
     def crear_menu(self):
         nombre = self.entry_nombre_menu.get().strip()
@@ -355,44 +453,44 @@ class App(ctk.CTk):
         receta_str = self.entry_receta.get().strip()
         
         if nombre and precio:
-            db = next(get_session())
             try:
                 receta = None
                 if receta_str:
                     receta = json.loads(receta_str)  # Convierte string JSON a dict
-                
-                MenuCRUD.crear_menu(db, nombre, float(precio), categoria, True, receta)
+                precio = float(precio)
+            except json.JSONDecodeError:
+                messagebox.showerror("Error", "Formato de receta inválido. Use JSON: {\"ingrediente\": cantidad}")
+                return
+            except ValueError:
+                messagebox.showerror("Error", "El precio debe ser un número.")
+                return
+
+            def creado(_):
                 messagebox.showinfo("Éxito", "Menú creado.")
                 self.cargar_menus()
                 self.entry_nombre_menu.delete(0, 'end')
                 self.entry_precio.delete(0, 'end')
                 self.entry_categoria.delete(0, 'end')
-                self.entry_descripcion_menu.delete(0, 'end')
                 self.entry_receta.delete(0, 'end')
-            except json.JSONDecodeError:
-                messagebox.showerror("Error", "Formato de receta inválido. Use JSON: {\"ingrediente\": cantidad}")
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-            finally:
-                db.close()
+
+            self.datos.ejecutar(
+                lambda db: MenuCRUD.crear_menu(db, nombre, "", precio, categoria, True, receta),
+                creado, self.avisar_error()
+            )
         else:
             messagebox.showwarning("Campos Vacíos", "Ingrese nombre y precio.")
 
     def eliminar_menu(self):
-        selected = self.treeview_menus.selection()
-        if not selected:
+        menu_id = self.tabla_menus.id_seleccionado()
+        if menu_id is None:
             messagebox.showwarning("Selección", "Seleccione un menú.")
             return
-        menu_id = self.treeview_menus.item(selected)["values"][0]
-        db = next(get_session())
-        try:
-            MenuCRUD.eliminar_menu(db, menu_id)
+
+        def eliminado(_):
             messagebox.showinfo("Éxito", "Menú eliminado.")
             self.cargar_menus()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+
+        self.datos.ejecutar(lambda db: MenuCRUD.eliminar_menu(db, menu_id), eliminado, self.avisar_error())
 
     # Pedidos
         # Pedidos
@@ -433,10 +531,11 @@ class App(ctk.CTk):
             command=self.cargar_listas_pedido
         ).grid(row=0, column=4, pady=5, padx=5)
 
-        ctk.CTkButton(
+        self.boton_crear_pedido = ctk.CTkButton(
             frame_superior, text="Crear Pedido",
             command=self.crear_pedido
-        ).grid(row=0, column=5, pady=5, padx=5)
+        )
+        self.boton_crear_pedido.grid(row=0, column=5, pady=5, padx=5)
 
         # ---- Frame medio: carrito de items del pedido ----
         frame_carrito = ctk.CTkFrame(parent)
@@ -464,27 +563,31 @@ class App(ctk.CTk):
         frame_inferior = ctk.CTkFrame(parent)
         frame_inferior.pack(pady=10, padx=10, fill="both", expand=True)
 
-        self.treeview_pedidos = ttk.Treeview(
-            frame_inferior,
-            columns=("ID", "Cliente", "Fecha", "Total", "Items"),
-            show="headings"
+        # Los pedidos se cargan por páginas a medida que se desplaza la tabla,
+        # del más reciente al más antiguo salvo que se ordene por otra columna
+        self.tabla_pedidos = TablaVirtual(
+            frame_inferior, self.datos, "pedidos",
+            [("ID", "id", 50), ("Cliente", "cliente", 150), ("Fecha", "fecha", 150),
+             ("Total", "total", 80), ("Items", "items", 100)],
+            lambda db, limite, despues_de, orden, descendente: PedidoCRUD.listar_pedidos(
+                db, limite, despues_de, orden=orden, descendente=descendente
+            ),
+            PedidoCRUD.cambios_pedidos,
+            formatear=lambda pedido: (
+                pedido.id,
+                pedido.cliente,
+                pedido.fecha.strftime("%Y-%m-%d %H:%M"),
+                f"${pedido.total}",
+                f"{pedido.cantidad_items} menú(s)"  # Cantidad total de menús guardada en el pedido
+            ),
+            orden="fecha", descendente=True
         )
-        self.treeview_pedidos.heading("ID", text="ID")
-        self.treeview_pedidos.heading("Cliente", text="Cliente")
-        self.treeview_pedidos.heading("Fecha", text="Fecha")
-        self.treeview_pedidos.heading("Total", text="Total")
-        self.treeview_pedidos.heading("Items", text="Items")
-
-        self.treeview_pedidos.column("ID", width=50)
-        self.treeview_pedidos.column("Cliente", width=150)
-        self.treeview_pedidos.column("Fecha", width=150)
-        self.treeview_pedidos.column("Total", width=80)
-        self.treeview_pedidos.column("Items", width=100)
-
-        self.treeview_pedidos.pack(pady=10, padx=10, fill="both", expand=True)
+        self.tabla_pedidos.pack(pady=10, padx=10, fill="both", expand=True)
 
         # Carrito en memoria: lista de dicts {menu_id, nombre, cantidad}
         self.carrito_items = []
+        # Menús del ComboBox: {menu_id: (nombre, porciones posibles o None si no tiene receta)}
+        self.menus_pedido = {}
 
         # Cargar combos con clientes y menús disponibles
         self.cargar_listas_pedido()
@@ -492,32 +595,50 @@ class App(ctk.CTk):
         self.cargar_pedidos()
 
     def cargar_listas_pedido(self):
-            """Carga clientes y menús disponibles en los ComboBox."""
-            db = next(get_session())
-            try:
-                # Cargar clientes
-                clientes = ClienteCRUD.obtener_todos_clientes(db)
-                if clientes:
-                    valores_clientes = [f"{c.id} - {c.nombre}" for c in clientes]
-                    self.combo_clientes.configure(values=valores_clientes)
-                    self.combo_clientes.set(valores_clientes[0])
-                else:
-                    self.combo_clientes.configure(values=["No hay clientes"])
-                    self.combo_clientes.set("No hay clientes")
-
-                # Cargar menús disponibles
-                menus = MenuCRUD.obtener_menus_disponibles(db)
-                if menus:
-                    valores_menus = [f"{m.id} - {m.nombre} (${m.precio})" for m in menus]
-                    self.combo_menus.configure(values=valores_menus)
-                    self.combo_menus.set(valores_menus[0])
-                else:
-                    self.combo_menus.configure(values=["No hay menús disponibles"])
-                    self.combo_menus.set("No hay menús disponibles")
-            except Exception as e:
-                messagebox.showerror("Error", f"Error al cargar listas: {e}")
-            finally:
-                db.close()
+        """Carga clientes y menús disponibles en los ComboBox."""
+        self.cargar_clientes_pedido()
+        self.cargar_menus_pedido()
+
+    def cargar_clientes_pedido(self):
+        """Carga los clientes en el ComboBox de pedidos."""
+        def consultar(db):
+            return [f"{c.id} - {c.nombre}" for c in ClienteCRUD.obtener_todos_clientes(db)]
+
+        def mostrar(valores_clientes):
+            if valores_clientes:
+                self.combo_clientes.configure(values=valores_clientes)
+                self.combo_clientes.set(valores_clientes[0])
+            else:
+                self.combo_clientes.configure(values=["No hay clientes"])
+                self.combo_clientes.set("No hay clientes")
+
+        self.datos.ejecutar(consultar, mostrar, self.avisar_error("Error al cargar clientes"), clave="clientes_pedido")
+
+    def cargar_menus_pedido(self):
+        """Carga los menús disponibles con las porciones que alcanzan a prepararse con el stock."""
+        def consultar(db):
+            from consumo import MotorConsumo  # numpy se importa al abrir Pedidos, no al arrancar
+            porciones = MotorConsumo.porciones_posibles(db)
+            return [(m.id, m.nombre, m.precio, porciones.get(m.id)) for m in MenuCRUD.obtener_menus_disponibles(db)]
+
+        def mostrar(menus):
+            self.menus_pedido = {menu_id: (nombre, porciones) for menu_id, nombre, _, porciones in menus}
+            # Los menús sin stock suficiente quedan al final y marcados
+            valores_menus = [
+                f"{menu_id} - {nombre} (${precio})" + ("" if porciones is None else f" · {porciones} porc.")
+                for menu_id, nombre, precio, porciones in menus if porciones != 0
+            ] + [
+                f"{menu_id} - {nombre} (${precio}) · sin stock"
+                for menu_id, nombre, precio, porciones in menus if porciones == 0
+            ]
+            if valores_menus:
+                self.combo_menus.configure(values=valores_menus)
+                self.combo_menus.set(valores_menus[0])
+            else:
+                self.combo_menus.configure(values=["No hay menús disponibles"])
+                self.combo_menus.set("No hay menús disponibles")
+
+        self.datos.ejecutar(consultar, mostrar, self.avisar_error("Error al cargar menús"), clave="menus_pedido")
 
     def actualizar_treeview_carrito(self):
         """Refresca la tabla visual del carrito con los items actuales."""
@@ -561,6 +682,15 @@ class App(ctk.CTk):
             messagebox.showerror("Error", "No se pudo interpretar el menú seleccionado.")
             return
 
+        # No se agregan más porciones de las que alcanza el stock
+        nombre_menu, porciones = self.menus_pedido.get(menu_id, (nombre_menu, None))
+        en_carrito = sum(item["cantidad"] for item in self.carrito_items if item["menu_id"] == menu_id)
+        if porciones is not None and en_carrito + cantidad > porciones:
+            messagebox.showwarning(
+                "Stock", f"Con el stock actual alcanza para {porciones} porción(es) de '{nombre_menu}'."
+            )
+            return
+
         # Ver si el menú ya está en el carrito -> acumular cantidad
         for item in self.carrito_items:
             if item["menu_id"] == menu_id:
@@ -587,31 +717,8 @@ class App(ctk.CTk):
 
 
     def cargar_pedidos(self):
-        """Carga todos los pedidos en la tabla, mostrando la cantidad total de menús."""
-        db = next(get_session())
-        # Limpiar la tabla
-        self.treeview_pedidos.delete(*self.treeview_pedidos.get_children())
-        try:
-            pedidos = PedidoCRUD.obtener_todos_pedidos(db)
-            for pedido in pedidos:
-                # Sumar todas las cantidades de los items del pedido
-                total_cantidades = sum(item.cantidad for item in pedido.items)
-                items_text = f"{total_cantidades} menú(s)"
-
-                self.treeview_pedidos.insert(
-                    "", "end",
-                    values=(
-                        pedido.id,
-                        pedido.cliente.nombre,
-                        pedido.fecha.strftime("%Y-%m-%d %H:%M"),
-                        f"${pedido.total}",
-                        items_text
-                    )
-                )
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar pedidos: {e}")
-        finally:
-            db.close()
+        """Actualiza la tabla de pedidos con los cambios de la base de datos."""
+        self.tabla_pedidos.actualizar()
 
 
     def crear_pedido(self):
@@ -636,44 +743,48 @@ class App(ctk.CTk):
             messagebox.showerror("Error", "No se pudo interpretar el cliente seleccionado.")
             return
 
-        db = next(get_session())
-        try:
-            # Adaptar carrito al formato esperado por PedidoCRUD
-            items_payload = [
-                {"menu_id": item["menu_id"], "cantidad": item["cantidad"]}
-                for item in self.carrito_items
-            ]
+        # Adaptar carrito al formato esperado por PedidoCRUD
+        items_payload = [
+            {"menu_id": item["menu_id"], "cantidad": item["cantidad"]}
+            for item in self.carrito_items
+        ]
 
-            PedidoCRUD.crear_pedido(db, cliente_id, items_payload)
+        def creado(_):
+            self.boton_crear_pedido.configure(state="normal")
             messagebox.showinfo("Éxito", "Pedido creado correctamente.")
 
-            # Limpiar carrito y refrescar pedidos
+            # Limpiar carrito y refrescar pedidos y porciones (el stock cambió)
             self.vaciar_carrito()
             self.cargar_pedidos()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+            self.cargar_menus_pedido()
+
+        def fallo(error):
+            self.boton_crear_pedido.configure(state="normal")
+            messagebox.showerror("Error", str(error))
+
+        # Evita crear el mismo pedido dos veces mientras se guarda
+        self.boton_crear_pedido.configure(state="disabled")
+        self.datos.ejecutar(lambda db: PedidoCRUD.crear_pedido(db, cliente_id, items_payload), creado, fallo)
 
 
     def eliminar_pedido(self):
-        selected = self.treeview_pedidos.selection()
-        if not selected:
+        pedido_id = self.tabla_pedidos.id_seleccionado()
+        if pedido_id is None:
             messagebox.showwarning("Selección", "Seleccione un pedido.")
             return
-        pedido_id = self.treeview_pedidos.item(selected)["values"][0]
-        db = next(get_session())
-        try:
-            PedidoCRUD.eliminar_pedido(db, pedido_id)
+
+        def eliminado(_):
             messagebox.showinfo("Éxito", "Pedido eliminado.")
             self.cargar_pedidos()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+
+        self.datos.ejecutar(lambda db: PedidoCRUD.eliminar_pedido(db, pedido_id), eliminado, self.avisar_error())
     
     def cargar_csv_ingredientes(self):
-        """Permite importar ingredientes masivamente desde archivo CSV."""
+        """Importa ingredientes desde CSV en segundo plano, mostrando el avance."""
+        if self.tarea_csv is not None and self.tarea_csv.en_curso:
+            messagebox.showwarning("Carga CSV", "Ya hay una importación en curso.")
+            return
+
         # Diálogo para selección de archivo
         archivo = filedialog.askopenfilename(
             title="Seleccionar archivo CSV",
@@ -682,32 +793,81 @@ class App(ctk.CTk):
         
         if not archivo:
             return
+
+        def importar(control):
+            # El hilo usa su propia sesión: las sesiones no se comparten entre hilos
+            db = SessionLocal()
+            try:
+                total = IngredienteCRUD.contar_filas_csv(archivo)
+                return IngredienteCRUD.cargar_desde_csv(
+                    db, archivo,
+                    al_avanzar=lambda avance: control.informar(total=total, **avance)
+                )
+            finally:
+                db.close()
+
+        self.progreso_csv.set(0)
+        self.label_progreso_csv.configure(text="Iniciando importación...")
+        self.boton_cargar_csv.configure(state="disabled")
+        self.boton_cancelar_csv.configure(state="normal")
+        self.tarea_csv = TareaSegundoPlano(
+            self, importar,
+            al_progreso=self.mostrar_progreso_csv,
+            al_terminar=self.terminar_carga_csv,
+            al_error=self.error_carga_csv
+        ).iniciar()
+
+    def mostrar_progreso_csv(self, avance):
+        """Actualiza la barra y el texto de avance de la importación."""
+        filas = avance['exitosos'] + avance['errores']
+        if avance['total']:
+            self.progreso_csv.set(min(filas / avance['total'], 1.0))
+        self.label_progreso_csv.configure(
+            text=f"{filas}/{avance['total']} filas · {avance['filas_por_segundo']:.0f} filas/s · "
+                 f"{avance['errores']} errores"
+        )
+
+    def cancelar_carga_csv(self):
+        """Pide detener la importación; los lotes ya guardados se conservan."""
+        if self.tarea_csv is not None and self.tarea_csv.en_curso:
+            self.tarea_csv.cancelar()
+            self.boton_cancelar_csv.configure(state="disabled")
+            self.label_progreso_csv.configure(text="Cancelando...")
+
+    def _restablecer_carga_csv(self):
+        self.boton_cargar_csv.configure(state="normal")
+        self.boton_cancelar_csv.configure(state="disabled")
+
+    def terminar_carga_csv(self, resultados):
+        """Muestra el resumen de la importación al terminar o cancelarse."""
+        self._restablecer_carga_csv()
+        self.progreso_csv.set(0 if resultados['cancelado'] else 1)
+        self.label_progreso_csv.configure(text=resultados['mensajes'][-1])
+
+        # Generar mensaje informativo con estadísticas
+        mensaje = "Carga cancelada:\n" if resultados['cancelado'] else "Carga completada:\n"
+        mensaje += f" Exitosos: {resultados['exitosos']}\n"
+        mensaje += f"  Errores: {resultados['errores']}\n"
+        mensaje += f"  Velocidad: {resultados['filas_por_segundo']:.0f} filas/s\n\n"
+        if resultados['archivo_errores']:
+            mensaje += f"Detalle de errores en: {resultados['archivo_errores']}\n\n"
         
-        db = next(get_session())
-        try:
-            # Procesar archivo CSV
-            resultados = IngredienteCRUD.cargar_desde_csv(db, archivo)
-            
-            # Generar mensaje informativo con estadísticas
-            mensaje = f"Carga completada:\n"
-            mensaje += f" Exitosos: {resultados['exitosos']}\n"
-            mensaje += f"  Errores: {resultados['errores']}\n\n"
-            
-            if resultados['mensajes']:
-                mensaje += "Detalles:\n"
-                # Mostrar solo los primeros 10 mensajes
-                for msg in resultados['mensajes'][:10]:
-                    mensaje += f"• {msg}\n"
-                if len(resultados['mensajes']) > 10:
-                    mensaje += f"... y {len(resultados['mensajes']) - 10} más"
-            
-            messagebox.showinfo("Carga CSV", mensaje)
-            self.cargar_ingredientes()
-            
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-        finally:
-            db.close()
+        if resultados['mensajes']:
+            mensaje += "Detalles:\n"
+            # Mostrar solo los primeros 10 mensajes
+            for msg in resultados['mensajes'][:10]:
+                mensaje += f"• {msg}\n"
+            if len(resultados['mensajes']) > 10:
+                mensaje += f"... y {len(resultados['mensajes']) - 10} más"
+        
+        messagebox.showinfo("Carga CSV", mensaje)
+        self.cargar_ingredientes()
+
+    def error_carga_csv(self, error):
+        self._restablecer_carga_csv()
+        self.label_progreso_csv.configure(text="La importación falló")
+        messagebox.showerror("Error", str(error))
+        self.cargar_ingredientes()
 
     def crear_formulario_graficos(self, parent):
         """Crea módulo de visualización de estadísticas y gráficos."""
@@ -756,29 +916,40 @@ class App(ctk.CTk):
             font=("Arial", 12)
         )
         self.label_info_grafico.pack(pady=50)
+
+        # matplotlib tarda en importarse: se carga en segundo plano mientras se elige el gráfico
+        self.datos.ejecutar(lambda db: importlib.import_module("graficos"), clave="importar_graficos")
     
     def generar_grafico(self):
         """Procesa la solicitud de generación y muestra el gráfico correspondiente."""
         # Limpiar área de visualización anterior
         for widget in self.frame_grafico.winfo_children():
             widget.destroy()
+        ctk.CTkLabel(self.frame_grafico, text="Generando gráfico...", font=("Arial", 12)).pack(pady=50)
         
         tipo_grafico = self.combo_graficos.get()
-        db = next(get_session())
-        
-        try:
-            fig = None
-            error = None
-            
-            # Generar gráfico según tipo seleccionado
+        periodo = self.combo_periodo.get()
+
+        def generar(db):
+            from graficos import GraficosEstadisticos
+            # La figura se arma en el hilo de trabajo; solo el dibujo en pantalla va en Tk
             if tipo_grafico == "Ventas por Fecha":
-                periodo = self.combo_periodo.get()
-                fig, error = GraficosEstadisticos.graficar_ventas_por_fecha(db, periodo)
+                return GraficosEstadisticos.graficar_ventas_por_fecha(db, periodo)
             elif tipo_grafico == "Menús Más Vendidos":
-                fig, error = GraficosEstadisticos.graficar_distribucion_menus(db)
+                return GraficosEstadisticos.graficar_distribucion_menus(db)
             elif tipo_grafico == "Uso de Ingredientes":
-                fig, error = GraficosEstadisticos.graficar_uso_ingredientes(db)
-            
+                return GraficosEstadisticos.graficar_uso_ingredientes(db)
+            return None, None
+
+        self.datos.ejecutar(generar, self.mostrar_grafico, self.avisar_error("Error al generar gráfico"), clave="grafico")
+
+    def mostrar_grafico(self, resultado):
+        """Reemplaza el contenido del área de gráficos con la figura o el mensaje de error."""
+        for widget in self.frame_grafico.winfo_children():
+            widget.destroy()
+        fig, error = resultado
+
+        try:
             # Manejar resultado de generación de gráfico
             if error:
                 # Mostrar mensaje de error o falta de datos
@@ -791,6 +962,7 @@ class App(ctk.CTk):
                 label_error.pack(pady=50)
             elif fig:
                 # Integrar gráfico de matplotlib en la interfaz
+                from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
                 canvas = FigureCanvasTkAgg(fig, master=self.frame_grafico)
                 canvas.draw()
                 canvas.get_tk_widget().pack(fill="both", expand=True)
@@ -804,12 +976,14 @@ class App(ctk.CTk):
                 label_error.pack(pady=50)
                 
         except Exception as e:
-            messagebox.showerror("Erreor", f"Error al generar gráfico: {str(e)}")
-        finally:
-            db.close()
+            messagebox.showerror("Error", f"Error al generar gráfico: {str(e)}")
 
 # Punto de entrada de la aplicación
 if __name__ == "__main__":
+    # Inicializar estructura de base de datos y aplicar migraciones pendientes
+    inicializar_base_datos()
+    tiempos_inicio.marcar("esquema y migraciones")
+
     # Crear e iniciar la aplicación gráfica
     app = App()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Mide el rendimiento de PedidoCRUD.crear_pedido con varias terminales de caja
+escribiendo a la vez y un proceso leyendo los gráficos, comparando la
+configuración anterior del motor (sin PRAGMAs ni reintentos) contra el perfil
+"concurrente" (WAL, synchronous=NORMAL, busy_timeout) con reintentos.
+
+Uso (desde la carpeta Ev3):
+    python benchmarks/bench_concurrencia.py [segundos] [cajas]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+import database
+from models import Cliente, Ingrediente, Menu, RecetaIngrediente, RecetaPlana
+from migraciones import inicializar_base_datos
+
+CANTIDAD_MENUS = 10
+CANTIDAD_INGREDIENTES = 12
+
+ESCENARIOS = [
+    # (nombre, perfil de PRAGMAs, reintentos)
+    ("antes: sin PRAGMAs, sin reintentos", "basico", 0),
+    ("después: perfil concurrente + reintentos", "concurrente", 5),
+]
+
+
+def preparar_base(url: str, perfil: str, cajas: int):
+    """Crea el esquema y los datos base con el perfil indicado."""
+    motor = database.crear_motor(url, perfil)
+    inicializar_base_datos(motor)
+    with motor.begin() as conexion:
+        conexion.execute(insert(Cliente.__table__), [
+            {"rut": f"{i}-K", "nombre": f"Caja {i}"} for i in range(1, cajas + 1)
+        ])
+        conexion.execute(insert(Ingrediente.__table__), [
+            {"nombre": f"Ingrediente {i}", "stock": 1e12, "unidad": "gramos"}
+            for i in range(1, CANTIDAD_INGREDIENTES + 1)
+        ])
+        conexion.execute(insert(Menu.__table__), [
+            {"nombre": f"Menú {i}", "precio": 1000.0 * i, "disponible": 1}
+            for i in range(1, CANTIDAD_MENUS + 1)
+        ])
+        conexion.execute(insert(RecetaIngrediente.__table__), [
+            {"menu_id": m, "ingrediente_id": (m + k) % CANTIDAD_INGREDIENTES + 1, "cantidad": 10.0}
+            for m in range(1, CANTIDAD_MENUS + 1) for k in range(3)
+        ])
+        # Sin subrecetas la receta aplanada es la misma
+        conexion.execute(insert(RecetaPlana.__table__).from_select(
+            ["menu_id", "ingrediente_id", "cantidad"],
+            select(RecetaIngrediente.menu_id, RecetaIngrediente.ingrediente_id, RecetaIngrediente.cantidad)
+        ))
+    motor.dispose()
+
+
+def caja(url, perfil, reintentos, cliente_id, segundos, resultados):
+    """Terminal de caja: crea pedidos de tres líneas hasta que se acabe el tiempo."""
+    from crud.pedido_crud import PedidoCRUD
+
+    database.REINTENTOS_MAXIMOS = reintentos
+    motor = database.crear_motor(url, perfil)
+    db = sessionmaker(bind=motor, autoflush=False)()
+    exitosos, fallidos, latencias = 0, 0, []
+    fin = time.perf_counter() + segundos
+    n = 0
+    while time.perf_counter() < fin:
+        items = [{"menu_id": (n + k) % CANTIDAD_MENUS + 1, "cantidad": 1 + k} for k in range(3)]
+        inicio = time.perf_counter()
+        try:
+            PedidoCRUD.crear_pedido(db, cliente_id, items)
+            exitosos += 1
+            latencias.append(time.perf_counter() - inicio)
+        except Exception:
+            fallidos += 1
+        n += 1
+    db.close()
+    motor.dispose()
+    resultados.put(("caja", exitosos, fallidos, latencias))
+
+
+def graficos(url, perfil, segundos, resultados):
+    """Usuario revisando gráficos: repite las consultas de ventas y distribución."""
+    from graficos import GraficosEstadisticos
+
+    motor = database.crear_motor(url, perfil)
+    db = sessionmaker(bind=motor)()
+    lecturas, fallidas = 0, 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        try:
+            GraficosEstadisticos.obtener_ventas_por_fecha(db, "diario")
+            GraficosEstadisticos.obtener_distribucion_menus(db)
+            db.rollback()  # Terminar la transacción de lectura
+            lecturas += 1
+        except Exception:
+            db.rollback()
+            fallidas += 1
+    db.close()
+    motor.dispose()
+    resultados.put(("graficos", lecturas, fallidas, []))
+
+
+def ejecutar(nombre, perfil, reintentos, segundos, cajas):
+    with tempfile.TemporaryDirectory() as carpeta:
+        url = f"sqlite:///{os.path.join(carpeta, 'bench.db')}"
+        preparar_base(url, perfil, cajas)
+
+        resultados = mp.Queue()
+        procesos = [
+            mp.Process(target=caja, args=(url, perfil, reintentos, i, segundos, resultados))
+            for i in range(1, cajas + 1)
+        ]
+        procesos.append(mp.Process(target=graficos, args=(url, perfil, segundos, resultados)))
+        for proceso in procesos:
+            proceso.start()
+        datos = [resultados.get() for _ in procesos]
+        for proceso in procesos:
+            proceso.join()
+
+    exitosos = sum(d[1] for d in datos if d[0] == "caja")
+    fallidos = sum(d[2] for d in datos if d[0] == "caja")
+    lecturas = sum(d[1] for d in datos if d[0] == "graficos")
+    latencias = sorted(l for d in datos for l in d[3])
+    p95 = latencias[int(len(latencias) * 0.95)] * 1000 if latencias else 0.0
+
+    print(f"\n{nombre}")
+    print(f"  Pedidos creados:   {exitosos:8d}  ({exitosos / segundos:8.1f} pedidos/s)")
+    print(f"  Pedidos fallidos:  {fallidos:8d}")
+    print(f"  Latencia p95:      {p95:8.1f} ms")
+    print(f"  Lecturas gráficos: {lecturas:8d}")
+
+
+def main():
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    cajas = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    print(f"{cajas} cajas + 1 lector de gráficos durante {segundos:.0f} s")
+    for nombre, perfil, reintentos in ESCENARIOS:
+        ejecutar(nombre, perfil, reintentos, segundos, cajas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compara el cálculo de uso de ingredientes recorriendo pedidos en Python
+contra el motor vectorizado de consumo.MotorConsumo.
+
+Uso (desde la carpeta Ev3):
+    python benchmarks/bench_consumo.py [cantidad_pedidos]
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from models import Cliente, Ingrediente, Menu, RecetaIngrediente, RecetaPlana, Pedido, ItemPedido
+from crud.ventas_crud import VentasDiariasCRUD
+from consumo import MotorConsumo
+
+
+def poblar(db, cantidad_pedidos: int, cantidad_menus: int = 60, cantidad_ingredientes: int = 40):
+    """Crea un historial sintético de pedidos con inserciones masivas."""
+    random.seed(42)
+    nombres = [f"Ingrediente {i}" for i in range(cantidad_ingredientes)]
+    db.execute(insert(Ingrediente.__table__), [
+        {"nombre": nombre, "stock": 1e9, "unidad": "gramos"} for nombre in nombres
+    ])
+    db.execute(insert(Menu.__table__), [
+        {"nombre": f"Menú {i}", "precio": 1000.0 + i, "disponible": 1}
+        for i in range(cantidad_menus)
+    ])
+    db.execute(insert(RecetaIngrediente.__table__), [
+        {"menu_id": menu_id, "ingrediente_id": ingrediente_id, "cantidad": round(random.uniform(1, 200), 2)}
+        for menu_id in range(1, cantidad_menus + 1)
+        for ingrediente_id in random.sample(range(1, cantidad_ingredientes + 1), random.randint(2, 8))
+    ])
+    # Sin subrecetas la receta aplanada es la misma
+    db.execute(insert(RecetaPlana.__table__).from_select(
+        ["menu_id", "ingrediente_id", "cantidad"],
+        select(RecetaIngrediente.menu_id, RecetaIngrediente.ingrediente_id, RecetaIngrediente.cantidad)
+    ))
+    db.execute(insert(Cliente.__table__), [{"rut": "1-9", "nombre": "Cliente"}])
+
+    inicio = datetime(2024, 1, 1)
+    db.execute(insert(Pedido.__table__), [
+        {"cliente_id": 1, "fecha": inicio + timedelta(minutes=5 * i), "estado": "Completado",
+         "total": 0.0, "cantidad_items": 0}
+        for i in range(cantidad_pedidos)
+    ])
+    items = []
+    for pedido_id in range(1, cantidad_pedidos + 1):
+        for menu_id in random.sample(range(1, cantidad_menus + 1), random.randint(1, 3)):
+            items.append({"pedido_id": pedido_id, "menu_id": menu_id,
+                          "cantidad": random.randint(1, 4), "precio_unitario": 1000.0})
+    db.execute(insert(ItemPedido.__table__), items)
+    db.commit()
+    VentasDiariasCRUD.reconstruir(db)
+    return len(items)
+
+
+def uso_con_bucles(db):
+    """Implementación anterior: recorre pedidos, items y recetas en Python."""
+    uso_ingredientes = {}
+    for pedido in db.query(Pedido).all():
+        for item in pedido.items:
+            menu = item.menu
+            if menu and menu.receta:
+                for ingrediente, cantidad_por_menu in menu.receta.items():
+                    uso_ingredientes[ingrediente] = (
+                        uso_ingredientes.get(ingrediente, 0.0) + cantidad_por_menu * item.cantidad
+                    )
+    return dict(sorted(uso_ingredientes.items(), key=lambda x: x[1], reverse=True))
+
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    cantidad_pedidos = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        motor = create_engine(f"sqlite:///{os.path.join(carpeta, 'bench.db')}")
+        Base.metadata.create_all(bind=motor)
+        Sesion = sessionmaker(bind=motor, autoflush=False)
+
+        db = Sesion()
+        cantidad_items = poblar(db, cantidad_pedidos)
+        db.close()
+        print(f"Pedidos: {cantidad_pedidos}, items: {cantidad_items}")
+
+        db = Sesion()
+        antes, t_bucles = medir(uso_con_bucles, db)
+        db.close()
+
+        db = Sesion()
+        despues, t_motor = medir(MotorConsumo.consumo_ingredientes, db)
+        db.close()
+
+        iguales = antes.keys() == despues.keys() and all(
+            abs(antes[k] - despues[k]) <= 1e-6 * max(1.0, abs(antes[k])) for k in antes
+        )
+        print(f"Bucles Python:      {t_bucles * 1000:10.1f} ms")
+        print(f"Motor vectorizado:  {t_motor * 1000:10.1f} ms  ({t_bucles / t_motor:.0f}x)")
+        print(f"Resultados iguales: {iguales}")
+        motor.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compara la importación de ingredientes desde CSV con una consulta por fila
+(implementación anterior) contra IngredienteCRUD.cargar_desde_csv por lotes,
+con uno o más procesos de lectura.
+
+Uso (desde la carpeta Ev3):
+    python benchmarks/bench_csv.py [cantidad_filas] [procesos,separados,por,coma]
+
+La implementación anterior solo se mide hasta 200.000 filas.
+"""
+
+import os
+import sys
+import csv
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+from database import crear_motor
+from models import Ingrediente
+from migraciones import inicializar_base_datos
+from crud.ingrediente_crud import IngredienteCRUD
+
+
+def escribir_catalogo(archivo: str, cantidad_filas: int):
+    """Catálogo de proveedor: la mitad de los nombres se repite para forzar actualizaciones."""
+    with open(archivo, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["nombre", "stock", "unidad"])
+        for i in range(cantidad_filas):
+            if i % 1000 == 999:
+                escritor.writerow([f"Producto {i}", "sin stock", "kg"])
+            else:
+                escritor.writerow([f"Producto {i % (cantidad_filas // 2)}", f"{i % 97 + 1}.5", "kg"])
+
+
+def cargar_con_consultas(db, archivo: str) -> int:
+    """Implementación anterior: un SELECT por fila y un solo commit al final."""
+    exitosos = 0
+    with open(archivo, "r", encoding="utf-8-sig") as file:
+        for fila in csv.DictReader(file):
+            try:
+                valores = IngredienteCRUD._validar_fila_csv(fila)
+            except ValueError:
+                continue
+            existente = db.query(Ingrediente).filter(Ingrediente.nombre == valores["nombre"]).first()
+            if existente:
+                existente.stock = valores["stock"]
+                existente.unidad = valores["unidad"]
+            else:
+                db.add(Ingrediente(**valores))
+                db.flush()  # Para que las filas repetidas encuentren el ingrediente
+            exitosos += 1
+    db.commit()
+    return exitosos
+
+
+def medir(nombre: str, funcion, *args, **kwargs):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    duracion = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, duracion, pico
+
+
+def main():
+    cantidad_filas = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    lista_procesos = (
+        [int(p) for p in sys.argv[2].split(",")] if len(sys.argv) > 2
+        else sorted({1, os.cpu_count() or 1})
+    )
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        archivo = os.path.join(carpeta, "catalogo.csv")
+        escribir_catalogo(archivo, cantidad_filas)
+        print(f"Filas del CSV: {cantidad_filas}  (núcleos disponibles: {os.cpu_count()})")
+
+        escenarios = []
+        if cantidad_filas <= 200_000:
+            escenarios.append(("Consulta por fila", cargar_con_consultas, {}))
+        for procesos in lista_procesos:
+            escenarios.append((f"Upsert por lotes, {procesos} proceso(s)", IngredienteCRUD.cargar_desde_csv,
+                               {"archivo_errores": os.path.join(carpeta, "errores.csv"),
+                                "procesos": procesos}))
+
+        for nombre, funcion, kwargs in escenarios:
+            motor = crear_motor(f"sqlite:///{os.path.join(carpeta, str(len(os.listdir(carpeta))) + '.db')}")
+            inicializar_base_datos(motor)
+            db = sessionmaker(bind=motor, autoflush=False)()
+            _, duracion, pico = medir(nombre, funcion, db, archivo, **kwargs)
+            total = db.query(func.count(Ingrediente.id)).scalar()
+            db.close()
+            motor.dispose()
+            print(f"{nombre}: {duracion * 1000:10.1f} ms  {cantidad_filas / duracion:10.0f} filas/s  "
+                  f"memoria pico {pico / 1e6:6.1f} MB  ingredientes {total}")
+
+
+if __name__ == "__main__":
+    main()
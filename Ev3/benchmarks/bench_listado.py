@@ -0,0 +1,97 @@
+"""
+Compara la carga de la pestaña Pedidos: todos los pedidos como objetos ORM con
+cliente perezoso (implementación anterior) contra PedidoCRUD.listar_pedidos
+con paginación por cursor.
+
+Uso (desde la carpeta Ev3):
+    python benchmarks/bench_listado.py [cantidad_pedidos]
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import sessionmaker
+from database import crear_motor
+from models import Cliente, Pedido
+from migraciones import inicializar_base_datos
+from crud.pedido_crud import PedidoCRUD
+
+TAMANO_PAGINA = 200
+
+
+def poblar(db, cantidad_pedidos: int, cantidad_clientes: int = 2000):
+    """Crea clientes y un historial de pedidos con inserciones masivas."""
+    random.seed(7)
+    db.execute(insert(Cliente.__table__), [
+        {"rut": f"{i}-K", "nombre": f"Cliente {i}"} for i in range(1, cantidad_clientes + 1)
+    ])
+    inicio = datetime(2020, 1, 1)
+    lote = 50_000
+    for desde in range(0, cantidad_pedidos, lote):
+        db.execute(insert(Pedido.__table__), [
+            {"cliente_id": random.randint(1, cantidad_clientes),
+             "fecha": inicio + timedelta(minutes=3 * i), "estado": "Completado",
+             "total": 1000.0, "cantidad_items": 1}
+            for i in range(desde, min(desde + lote, cantidad_pedidos))
+        ])
+    db.commit()
+
+
+def filas_con_objetos(db):
+    """Implementación anterior de App.cargar_pedidos (sin el Treeview)."""
+    return [
+        (p.id, p.cliente.nombre, p.fecha.strftime("%Y-%m-%d %H:%M"), f"${p.total}", p.cantidad_items)
+        for p in PedidoCRUD.obtener_todos_pedidos(db)
+    ]
+
+
+def medir(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    cantidad_pedidos = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        motor = crear_motor(f"sqlite:///{os.path.join(carpeta, 'bench.db')}")
+        inicializar_base_datos(motor)
+        Sesion = sessionmaker(bind=motor, autoflush=False)
+
+        db = Sesion()
+        poblar(db, cantidad_pedidos)
+        db.close()
+        print(f"Pedidos: {cantidad_pedidos}")
+
+        db = Sesion()
+        todas, t_todas = medir(filas_con_objetos, db)
+        db.close()
+        print(f"Todos los pedidos (ORM + cliente):  {t_todas * 1000:10.1f} ms  ({len(todas)} filas)")
+
+        db = Sesion()
+        primera, t_primera = medir(PedidoCRUD.listar_pedidos, db, TAMANO_PAGINA)
+        print(f"Primera página ({TAMANO_PAGINA}):              {t_primera * 1000:10.1f} ms")
+
+        # Página a mitad del historial, usando como cursor un pedido intermedio
+        medio = db.execute(
+            select(Pedido.fecha, Pedido.id).where(Pedido.id == cantidad_pedidos // 2)
+        ).one()
+        _, t_media = medir(PedidoCRUD.listar_pedidos, db, TAMANO_PAGINA, despues_de=tuple(medio))
+        print(f"Página a mitad del historial:       {t_media * 1000:10.1f} ms")
+
+        _, t_cliente = medir(PedidoCRUD.listar_pedidos, db, TAMANO_PAGINA, cliente_id=1)
+        print(f"Primera página de un cliente:       {t_cliente * 1000:10.1f} ms")
+        db.close()
+        motor.dispose()
+
+
+if __name__ == "__main__":
+    main()
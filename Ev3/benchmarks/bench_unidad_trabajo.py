@@ -0,0 +1,79 @@
+"""
+Compara una secuencia de operaciones CRUD con un commit por operación
+(comportamiento de siempre) contra la misma secuencia dentro de
+`unidad_de_trabajo`, que la confirma con un solo commit.
+
+Uso (desde la carpeta Ev3):
+    python benchmarks/bench_unidad_trabajo.py [cantidad_operaciones] [perfil,perfil]
+
+Por defecto mide 10.000 operaciones con los perfiles "concurrente" y "basico".
+"""
+
+import os
+import sys
+import time
+import tempfile
+from contextlib import nullcontext
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import sessionmaker
+from database import crear_motor, SesionRestaurante, unidad_de_trabajo
+from models import Cliente, Ingrediente
+from migraciones import inicializar_base_datos
+from crud.cliente_crud import ClienteCRUD
+from crud.ingrediente_crud import IngredienteCRUD
+
+
+def operaciones(db, cantidad: int):
+    """40% clientes nuevos, 30% ingredientes nuevos y 30% ajustes de stock."""
+    clientes = cantidad * 4 // 10
+    ingredientes = cantidad * 3 // 10
+    ajustes = cantidad - clientes - ingredientes
+    for i in range(clientes):
+        ClienteCRUD.crear_cliente(db, f"{i:08d}-B", f"Cliente {i}")
+    ids = [IngredienteCRUD.crear_ingrediente(db, f"Ingrediente {i}", 1000.0, "kg").id
+           for i in range(ingredientes)]
+    for i in range(ajustes):
+        IngredienteCRUD.actualizar_stock(db, ids[i % len(ids)], -1.0)
+
+
+def medir(carpeta: str, perfil: str, cantidad: int, agrupar: bool):
+    motor = crear_motor(f"sqlite:///{os.path.join(carpeta, str(len(os.listdir(carpeta))) + '.db')}",
+                        perfil=perfil)
+    inicializar_base_datos(motor)
+    commits = []
+    event.listen(motor, "commit", lambda conexion: commits.append(1))
+    db = sessionmaker(bind=motor, autoflush=False, class_=SesionRestaurante)()
+
+    commits.clear()  # Solo cuentan los de las operaciones
+    inicio = time.perf_counter()
+    with unidad_de_trabajo(db) if agrupar else nullcontext():
+        operaciones(db, cantidad)
+    duracion = time.perf_counter() - inicio
+
+    filas = db.query(func.count(Cliente.id)).scalar() + db.query(func.count(Ingrediente.id)).scalar()
+    db.close()
+    motor.dispose()
+    return duracion, len(commits), filas
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    perfiles = sys.argv[2].split(",") if len(sys.argv) > 2 else ["concurrente", "basico"]
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        print(f"Operaciones por escenario: {cantidad}")
+        for perfil in perfiles:
+            duraciones = {}
+            for agrupar, nombre in ((False, "Commit por operación"), (True, "Unidad de trabajo")):
+                duracion, commits, filas = medir(carpeta, perfil, cantidad, agrupar)
+                duraciones[agrupar] = duracion
+                print(f"[{perfil}] {nombre}: {duracion * 1000:10.1f} ms  "
+                      f"{cantidad / duracion:8.0f} op/s  commits {commits:6d}  filas {filas}")
+            print(f"[{perfil}] Aceleración: {duraciones[False] / duraciones[True]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Caché de lecturas de la capa CRUD (búsquedas de un objeto por id o por nombre).
+
+Guarda copias desconectadas de los objetos leídos y entrega a cada sesión que
+las pide una instancia propia, unida sin consultar la base. Se
+invalida sola: los eventos de escritura de SQLAlchemy anotan qué filas (o
+tablas completas, en los UPDATE/DELETE masivos) cambió cada sesión y al hacer
+commit se descartan las entradas afectadas. Los cambios de otras terminales
+llegan por `invalidar_tablas` (ver MonitorCambios) y, en el peor caso, por el
+vencimiento de cada entrada.
+
+Solo se guardan búsquedas de un objeto: armar instancias desde la caché
+cuesta más por fila que traerlas de SQLite, así que con listas no conviene.
+
+Configuración por variables de entorno:
+    RESTAURANTE_CACHE            "0" la desactiva (por defecto activa)
+    RESTAURANTE_CACHE_CAPACIDAD  máximo de entradas antes de desalojar la menos usada
+    RESTAURANTE_CACHE_TTL        segundos de vigencia de cada entrada
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from database import Base
+
+CACHE_ACTIVA = os.environ.get("RESTAURANTE_CACHE", "1") != "0"
+CAPACIDAD_CACHE = int(os.environ.get("RESTAURANTE_CACHE_CAPACIDAD", "1000"))
+TTL_CACHE = float(os.environ.get("RESTAURANTE_CACHE_TTL", "30"))
+
+
+def _copia_desconectada(objeto):
+    """Copia las columnas de un objeto persistente en una instancia nueva, sin sesión."""
+    mapper = inspect(objeto).mapper
+    copia = mapper.class_manager.new_instance()
+    for columna in mapper.column_attrs:
+        set_committed_value(copia, columna.key, getattr(objeto, columna.key))
+    make_transient_to_detached(copia)
+    return copia
+
+
+def _adjuntar(db: Session, copia):
+    """Une a la sesión una copia nueva de lo guardado; si la sesión ya tiene ese objeto, manda el suyo."""
+    existente = db.identity_map.get(inspect(copia).key)
+    if existente is not None:
+        return existente
+    # Cada sesión recibe su propia instancia: add() de un objeto desconectado no consulta la base
+    # y resulta bastante más barato que merge(load=False)
+    nueva = _copia_desconectada(copia)
+    db.add(nueva)
+    return nueva
+
+
+class CacheLecturas:
+    """Caché LRU con vencimiento, compartida por todos los hilos del proceso.
+
+    Las claves son tuplas cuyo primer elemento es el nombre de la tabla y el
+    segundo el tipo de búsqueda; las de tipo "id" llevan el id en el tercero y
+    solo se invalidan cuando cambia esa fila. Las demás (p. ej. por nombre) se
+    invalidan con cualquier cambio en su tabla.
+    """
+
+    def __init__(self, capacidad: int = CAPACIDAD_CACHE, ttl: float = TTL_CACHE,
+                 activa: bool = CACHE_ACTIVA):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.activa = activa
+        self._entradas = OrderedDict()  # clave -> (vence, valor)
+        self._generaciones: Dict[str, int] = {}  # tabla -> invalidaciones, para descartar lecturas en carrera
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+
+    def leer(self, db: Session, clave: Tuple[Hashable, ...], consultar: Callable[[], Any]):
+        """Retorna el resultado guardado para `clave` o lo obtiene con `consultar()`.
+
+        `consultar` debe retornar un objeto mapeado o None.
+        """
+        if not self.activa:
+            return consultar()
+
+        tabla = clave[0]
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            acierto = entrada is not None and entrada[0] > time.monotonic()
+            if acierto:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+            else:
+                if entrada is not None:
+                    del self._entradas[clave]  # Vencida
+                self.fallos += 1
+                generacion = self._generaciones.get(tabla, 0)
+
+        if acierto:
+            # También se guardan los None: una búsqueda sin resultado no vuelve a consultar
+            return self._restaurar(db, entrada[1])
+
+        valor = consultar()
+        if not db.info.get("cache_invalidar"):
+            # Con escrituras sin confirmar en la sesión (p. ej. en una unidad de trabajo)
+            # lo leído podría deshacerse: no se guarda
+            self._guardar(clave, tabla, generacion, _copia_desconectada(valor) if valor is not None else None)
+        return valor
+
+    def _restaurar(self, db: Session, guardado):
+        return _adjuntar(db, guardado) if guardado is not None else None
+
+    def _guardar(self, clave, tabla: str, generacion: int, copia):
+        with self._lock:
+            # Si la tabla cambió mientras se consultaba, el resultado puede estar viejo
+            if self._generaciones.get(tabla, 0) != generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, copia)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, tabla: str, ids: Iterable[Any] = None):
+        """Descarta las entradas de la tabla afectadas por cambios en `ids` (o en toda la tabla)."""
+        ids = None if ids is None else set(ids)
+        with self._lock:
+            self._generaciones[tabla] = self._generaciones.get(tabla, 0) + 1
+            for clave in [clave for clave in self._entradas if clave[0] == tabla]:
+                if ids is None or clave[1] != "id" or clave[2] in ids:
+                    del self._entradas[clave]
+                    self.invalidaciones += 1
+
+    def invalidar_tablas(self, tablas: Iterable[str]):
+        for tabla in tablas:
+            self.invalidar(tabla)
+
+    def limpiar(self):
+        """Vacía la caché y reinicia los contadores."""
+        with self._lock:
+            self._entradas.clear()
+            self.aciertos = self.fallos = self.desalojos = self.invalidaciones = 0
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos,
+                    "desalojos": self.desalojos, "invalidaciones": self.invalidaciones}
+
+
+# Caché usada por los CRUD
+cache_lecturas = CacheLecturas()
+
+
+# --- Invalidación automática -------------------------------------------------
+# Cada sesión anota qué filas escribió ({tabla: ids, o None si fue la tabla
+# completa}). Se invalida al terminar cada flush, para que una lectura en
+# carrera no guarde el valor viejo, y de nuevo al hacer commit, cuando el
+# cambio ya es visible para las demás sesiones.
+
+def _anotar(session: Session, tabla: str, fila_id=None):
+    pendientes = session.info.setdefault("cache_invalidar", {})
+    if fila_id is None:
+        pendientes[tabla] = None
+    elif tabla not in pendientes:
+        pendientes[tabla] = {fila_id}
+    elif pendientes[tabla] is not None:
+        pendientes[tabla].add(fila_id)
+
+
+def _invalidar_pendientes(pendientes: dict):
+    for tabla, ids in pendientes.items():
+        cache_lecturas.invalidar(tabla, ids)
+
+
+def _al_escribir_fila(mapper, conexion, objeto):
+    session = object_session(objeto)
+    if session is not None:
+        clave = mapper.primary_key_from_instance(objeto)
+        _anotar(session, mapper.local_table.name, clave[0] if len(clave) == 1 else None)
+
+
+for _evento in ("after_insert", "after_update", "after_delete"):
+    event.listen(Base, _evento, _al_escribir_fila, propagate=True)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _invalidar_al_escribir(session, contexto):
+    _invalidar_pendientes(session.info.get("cache_invalidar", {}))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _al_ejecutar_sentencia(estado):
+    # Un INSERT/UPDATE/DELETE masivo no dice qué filas tocó: se invalida la tabla completa
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        tabla = getattr(estado.statement, "table", None)
+        if tabla is not None:
+            _anotar(estado.session, tabla.name)
+            cache_lecturas.invalidar(tabla.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_al_confirmar(session):
+    _invalidar_pendientes(session.info.pop("cache_invalidar", {}))
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendientes(session):
+    session.info.pop("cache_invalidar", None)
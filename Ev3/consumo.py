@@ -0,0 +1,249 @@
+import math
+import threading
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from models import Menu, Ingrediente, RecetaPlana, VentaDiaria, VersionTabla
+from crud.ventas_crud import VentasDiariasCRUD
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+
+class MatrizRecetas:
+    """Matriz dispersa menús × ingredientes construida una sola vez desde las recetas.
+
+    Se guarda en formato de coordenadas (fila, columna, valor): cada entrada es
+    la cantidad de un ingrediente usada por una porción de un menú. Las
+    columnas se identifican por nombre de ingrediente o por id, según cómo se
+    construya.
+    """
+
+    def __init__(self, menu_ids: List[int], ingredientes: List,
+                 filas: np.ndarray, columnas: np.ndarray, valores: np.ndarray):
+        self.menu_ids = menu_ids
+        self.ingredientes = ingredientes
+        self.indice_menu = {menu_id: i for i, menu_id in enumerate(menu_ids)}
+        self.indice_ingrediente = {ingrediente: j for j, ingrediente in enumerate(ingredientes)}
+        self.filas = filas
+        self.columnas = columnas
+        self.valores = valores
+
+        # Entradas agrupadas por menú (orden estable) y dónde empieza cada grupo,
+        # para reducir por fila con np.minimum.reduceat
+        orden = np.argsort(filas, kind="stable")
+        self._filas_ordenadas = filas[orden]
+        self._columnas_ordenadas = columnas[orden]
+        self._valores_ordenados = valores[orden]
+        cambios = np.flatnonzero(self._filas_ordenadas[1:] != self._filas_ordenadas[:-1]) + 1
+        self._inicios = np.concatenate(([0], cambios)) if len(filas) else np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def desde_filas(cls, menu_ids: Iterable[int], entradas: Iterable) -> "MatrizRecetas":
+        """Construye la matriz desde tripletas (menu_id, nombre_ingrediente, cantidad)."""
+        menu_ids = list(menu_ids)
+        indice_menu = {menu_id: i for i, menu_id in enumerate(menu_ids)}
+        ingredientes, indice_ingrediente = [], {}
+        filas, columnas, valores = [], [], []
+        for menu_id, nombre, cantidad in entradas:
+            fila = indice_menu.get(menu_id)
+            if fila is None:
+                continue
+            columna = indice_ingrediente.get(nombre)
+            if columna is None:
+                columna = indice_ingrediente[nombre] = len(ingredientes)
+                ingredientes.append(nombre)
+            filas.append(fila)
+            columnas.append(columna)
+            valores.append(cantidad)
+        return cls(
+            menu_ids, ingredientes,
+            np.array(filas, dtype=np.int64),
+            np.array(columnas, dtype=np.int64),
+            np.array(valores, dtype=np.float64)
+        )
+
+    def vector_menus(self, cantidades: Dict[int, float]) -> np.ndarray:
+        """Convierte {menu_id: cantidad} en un vector alineado con las filas de la matriz."""
+        vector = np.zeros(len(self.menu_ids), dtype=np.float64)
+        for menu_id, cantidad in cantidades.items():
+            fila = self.indice_menu.get(menu_id)
+            if fila is not None:
+                vector[fila] = cantidad
+        return vector
+
+    def vector_ingredientes(self, cantidades: Dict) -> np.ndarray:
+        """Convierte {ingrediente: cantidad} en un vector alineado con las columnas de la matriz."""
+        vector = np.zeros(len(self.ingredientes), dtype=np.float64)
+        for ingrediente, cantidad in cantidades.items():
+            columna = self.indice_ingrediente.get(ingrediente)
+            if columna is not None:
+                vector[columna] = cantidad
+        return vector
+
+    def porciones(self, stock: np.ndarray) -> np.ndarray:
+        """Porciones enteras que alcanzan para cada menú: mín(stock / cantidad) sobre su receta.
+
+        Los menús sin receta quedan en infinito (no dependen del stock).
+        """
+        resultado = np.full(len(self.menu_ids), np.inf)
+        if len(self._inicios):
+            razones = stock[self._columnas_ordenadas] / self._valores_ordenados
+            resultado[self._filas_ordenadas[self._inicios]] = np.minimum.reduceat(razones, self._inicios)
+        # El margen evita perder una porción por redondeo (0.6 / 0.2 = 2.9999...)
+        return np.floor(np.maximum(resultado, 0.0) + 1e-9)
+
+    def consumo(self, vector_menus: np.ndarray) -> np.ndarray:
+        """Producto matriz-vector (recetaᵀ · cantidades): consumo por ingrediente."""
+        return np.bincount(
+            self.columnas,
+            weights=self.valores * vector_menus[self.filas],
+            minlength=len(self.ingredientes)
+        )
+
+
+class MotorConsumo:
+    """Calcula el consumo de ingredientes combinando recetas y ventas agregadas."""
+
+    @staticmethod
+    def construir_matriz(db: Session, por_id: bool = False) -> MatrizRecetas:
+        """Carga los menús y las filas de receta aplanada (subrecetas incluidas) y arma la matriz.
+
+        Con `por_id` las columnas son ids de ingrediente y no hace falta el JOIN;
+        así la matriz no cambia si solo se modifica un ingrediente.
+        """
+        menu_ids = db.execute(select(Menu.id).order_by(Menu.id)).scalars().all()
+        if por_id:
+            entradas = db.execute(
+                select(RecetaPlana.menu_id, RecetaPlana.ingrediente_id, RecetaPlana.cantidad)
+            ).all()
+        else:
+            entradas = db.execute(
+                select(RecetaPlana.menu_id, Ingrediente.nombre, RecetaPlana.cantidad)
+                .join(Ingrediente, Ingrediente.id == RecetaPlana.ingrediente_id)
+            ).all()
+        return MatrizRecetas.desde_filas(menu_ids, entradas)
+
+    @staticmethod
+    def porciones_posibles(db: Session) -> Dict[int, Optional[int]]:
+        """Porciones de cada menú que se pueden preparar con el stock actual.
+
+        Trae todos los menús actuales; None indica un menú sin receta, sin
+        límite de porciones. Ver PorcionesMenus para la caché.
+        """
+        return porciones_menus.calcular(db)
+
+    @staticmethod
+    def cantidades_por_menu(db: Session, desde: Optional[date] = None,
+                            hasta: Optional[date] = None,
+                            menu_id: Optional[int] = None) -> Dict[int, float]:
+        """Unidades vendidas por menú, agregadas en SQL desde el resumen diario."""
+        consulta = (
+            select(VentaDiaria.menu_id, func.sum(VentaDiaria.cantidad))
+            .where(*VentasDiariasCRUD.filtros_rango_fechas(VentaDiaria.fecha, desde, hasta))
+            .group_by(VentaDiaria.menu_id)
+        )
+        if menu_id is not None:
+            consulta = consulta.where(VentaDiaria.menu_id == menu_id)
+        return {mid: float(cantidad or 0) for mid, cantidad in db.execute(consulta).all()}
+
+    @staticmethod
+    def consumo_ingredientes(db: Session, desde: Optional[date] = None,
+                             hasta: Optional[date] = None,
+                             menu_id: Optional[int] = None,
+                             matriz: Optional[MatrizRecetas] = None) -> Dict[str, float]:
+        """Consumo total por ingrediente, opcionalmente por rango de fechas y por menú.
+
+        Se puede entregar una `matriz` ya construida para reutilizarla entre consultas.
+        """
+        if matriz is None:
+            matriz = MotorConsumo.construir_matriz(db)
+        cantidades = MotorConsumo.cantidades_por_menu(db, desde, hasta, menu_id)
+        consumo = matriz.consumo(matriz.vector_menus(cantidades))
+
+        uso = {
+            nombre: float(total)
+            for nombre, total in zip(matriz.ingredientes, consumo)
+            if total != 0
+        }
+        return dict(sorted(uso.items(), key=lambda x: x[1], reverse=True))
+
+
+class PorcionesMenus:
+    """Caché de las porciones posibles por menú, invalidada por las versiones de las tablas.
+
+    La matriz de recetas depende de Menus y RecetasPlanas, y las porciones
+    además del stock de Ingredientes. En cada consulta se leen los contadores
+    de VersionesTablas (una fila por tabla) y solo se recarga lo que cambió, en
+    esta terminal o en otra. Así el resultado tiene siempre los menús actuales,
+    también los creados sin receta y sin los eliminados. Como Menus cambia
+    además con cada menú que se agota o se repone, si solo cambió Menus la
+    matriz se rearma únicamente cuando cambió la lista de ids de menú.
+    """
+
+    TABLAS_MATRIZ = ("Menus", "RecetasPlanas")
+    TABLAS_STOCK = ("Ingredientes",)
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Los hilos de ServicioDatos comparten la caché
+        self._clave_matriz = None
+        self._clave_porciones = None
+        self._matriz: Optional[MatrizRecetas] = None
+        self._porciones: Dict[int, Optional[int]] = {}
+        self.matrices_construidas = 0
+        self.recalculos = 0
+
+    def calcular(self, db: Session) -> Dict[int, Optional[int]]:
+        if db.info.get("tablas_modificadas"):
+            # Cambios sin confirmar en esta sesión: los contadores todavía no los reflejan
+            matriz = MotorConsumo.construir_matriz(db, por_id=True)
+            stock = {ingrediente_id: cantidad or 0.0 for ingrediente_id, cantidad
+                     in db.execute(select(Ingrediente.id, Ingrediente.stock)).all()}
+            return self._por_menu(matriz, matriz.porciones(matriz.vector_ingredientes(stock)))
+
+        versiones = dict(db.execute(select(VersionTabla.tabla, VersionTabla.version)).all())
+        clave_matriz = tuple(versiones.get(tabla) for tabla in self.TABLAS_MATRIZ)
+        clave_porciones = clave_matriz + tuple(versiones.get(tabla) for tabla in self.TABLAS_STOCK)
+
+        with self._lock:
+            if clave_porciones == self._clave_porciones:
+                return dict(self._porciones)
+
+            if clave_matriz != self._clave_matriz or self._matriz is None:
+                if self._matriz is None or not self._mismos_menus(db, clave_matriz):
+                    self._matriz = MotorConsumo.construir_matriz(db, por_id=True)
+                    self.matrices_construidas += 1
+                self._clave_matriz = clave_matriz
+            matriz = self._matriz
+
+            stock = {ingrediente_id: cantidad or 0.0 for ingrediente_id, cantidad
+                     in db.execute(select(Ingrediente.id, Ingrediente.stock)).all()}
+            porciones = matriz.porciones(matriz.vector_ingredientes(stock))
+
+            self._porciones = self._por_menu(matriz, porciones)
+            self._clave_porciones = clave_porciones
+            self.recalculos += 1
+            return dict(self._porciones)
+
+    def _mismos_menus(self, db: Session, clave_matriz: tuple) -> bool:
+        """Indica si de la matriz en caché solo cambió Menus y siguen los mismos menús."""
+        indice = self.TABLAS_MATRIZ.index("Menus")
+        if clave_matriz[:indice] + clave_matriz[indice + 1:] != \
+                self._clave_matriz[:indice] + self._clave_matriz[indice + 1:]:
+            return False
+        return db.execute(select(Menu.id).order_by(Menu.id)).scalars().all() == self._matriz.menu_ids
+
+    @staticmethod
+    def _por_menu(matriz: MatrizRecetas, porciones) -> Dict[int, Optional[int]]:
+        return {
+            menu_id: None if math.isinf(valor) else int(valor)
+            for menu_id, valor in zip(matriz.menu_ids, porciones.tolist())
+        }
+
+    def limpiar(self):
+        with self._lock:
+            self._clave_matriz = self._clave_porciones = self._matriz = None
+            self._porciones = {}
+
+
+# Caché compartida por la aplicación
+porciones_menus = PorcionesMenus()
@@ -1,6 +1,11 @@
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session 
 from sqlalchemy.exc import SQLAlchemyError
-from models import Cliente
+from database import reintentar_si_ocupado
+from cache import cache_lecturas
+from models import Cliente, Pedido
+from crud.ventas_crud import VentasDiariasCRUD
+from crud.paginacion import Cambios, Pagina, cambios_desde, paginar, LIMITE_CAMBIOS
 from typing import Optional, List
 import re
 
@@ -17,6 +22,7 @@ class ClienteCRUD:
         return re.match(patron, correo) is not None
     
     @staticmethod
+    @reintentar_si_ocupado
     def crear_cliente(db: Session, rut: str, nombre: str, correo: str = None) -> Optional[Cliente]:
         """Crea un nuevo cliente con validaciones de integridad de datos."""
         try:
@@ -52,9 +58,10 @@ class ClienteCRUD:
     
     @staticmethod
     def obtener_cliente_por_id(db: Session, cliente_id: int) -> Optional[Cliente]:
-        """Busca y retorna un cliente por su identificador único."""
+        """Busca y retorna un cliente por su identificador único (pasa por la caché)."""
         try:
-            return db.query(Cliente).filter(Cliente.id == cliente_id).first()
+            return cache_lecturas.leer(db, ("Clientes", "id", cliente_id),
+                                       lambda: db.query(Cliente).filter(Cliente.id == cliente_id).first())
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener cliente: {str(e)}")
     
@@ -74,7 +81,40 @@ class ClienteCRUD:
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener clientes: {str(e)}")
     
+    # Columnas por las que se puede ordenar el listado paginado
+    COLUMNAS_ORDEN = {
+        "id": Cliente.id,
+        "rut": Cliente.rut,
+        "nombre": Cliente.nombre,
+        "correo": func.coalesce(Cliente.correo, ""),
+    }
+
+    @staticmethod
+    def listar_clientes(db: Session, limite: int = 100, despues_de: tuple = None,
+                        orden: str = "id", descendente: bool = False) -> Pagina:
+        """Lista clientes de a `limite` como filas (id, rut, nombre, correo) con cursor."""
+        try:
+            return paginar(db, ClienteCRUD._consulta_listado(), ClienteCRUD.COLUMNAS_ORDEN, Cliente.id,
+                           limite, despues_de, orden, descendente, Cliente.actualizado_en)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al listar clientes: {str(e)}")
+
+    @staticmethod
+    def cambios_clientes(db: Session, desde: float, ids: List[int], orden: str = "id",
+                         limite: int = LIMITE_CAMBIOS) -> Cambios:
+        """Clientes modificados desde la marca `desde` y cuáles de `ids` fueron eliminados."""
+        try:
+            return cambios_desde(db, ClienteCRUD._consulta_listado(), ClienteCRUD.COLUMNAS_ORDEN, Cliente.id,
+                                 Cliente.actualizado_en, desde, ids, orden, limite)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al buscar cambios en clientes: {str(e)}")
+
+    @staticmethod
+    def _consulta_listado():
+        return select(Cliente.id, Cliente.rut, Cliente.nombre, func.coalesce(Cliente.correo, ""))
+    
     @staticmethod
+    @reintentar_si_ocupado
     def actualizar_cliente(db: Session, cliente_id: int, rut: str = None, 
                           nombre: str = None, correo: str = None) -> Optional[Cliente]:
         """Actualiza los datos de un cliente"""
@@ -121,6 +161,7 @@ class ClienteCRUD:
             raise Exception(f"Error al actualizar cliente: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def eliminar_cliente(db: Session, cliente_id: int) -> bool:
         """Elimina un cliente por su ID"""
         try:
@@ -128,6 +169,8 @@ class ClienteCRUD:
             if not cliente:
                 return False
             
+            # Sus pedidos se eliminan por cascade: descontarlos del resumen de ventas
+            VentasDiariasCRUD.descontar_items(db, Pedido.cliente_id == cliente_id)
             db.delete(cliente)
             db.commit()
             return True
@@ -1,13 +1,33 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from models import Ingrediente
-from typing import List, Optional
+from database import confirmar_lote, reintentar_si_ocupado
+from cache import cache_lecturas
+from models import Ingrediente, RecetaIngrediente, Menu, marca_tiempo, normalizar_nombre
+from crud.menu_crud import MenuCRUD
+from crud.paginacion import Cambios, Pagina, cambios_desde, paginar, LIMITE_CAMBIOS, TAMANO_LOTE_IDS
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import csv
+import io
+import os
+import time
+
+# Filas del CSV que se guardan y confirman en cada lote
+TAMANO_LOTE_CSV = 1000
+# Errores que se incluyen en 'mensajes'; el detalle completo va al archivo de errores
+MAX_MENSAJES_CSV = 20
+# Bytes del CSV que procesa cada proceso en la importación en paralelo
+TAMANO_BLOQUE_CSV = 1024 * 1024
 
 class IngredienteCRUD:
     """Clase para operaciones CRUD de ingredientes con funciones de importación CSV."""
     
     @staticmethod
+    @reintentar_si_ocupado
     def crear_ingrediente(db: Session, nombre: str, stock: float, unidad: str) -> Ingrediente:
         """Crea un nuevo ingrediente con validaciones de negocio."""
         try:
@@ -23,9 +43,10 @@ class IngredienteCRUD:
             if not unidad or not unidad.strip():
                 raise ValueError("La unidad no puede estar vacía")
             
-            # Verificar que el ingrediente no esté duplicado
+            # Verificar que el ingrediente no esté duplicado (sin distinguir mayúsculas,
+            # igual que al resolver recetas)
             ingrediente_existente = db.query(Ingrediente).filter(
-                Ingrediente.nombre == nombre.strip()
+                Ingrediente.nombre_normalizado == normalizar_nombre(nombre)
             ).first()
             if ingrediente_existente:
                 raise ValueError(f"El ingrediente '{nombre}' ya existe")
@@ -46,14 +67,16 @@ class IngredienteCRUD:
     @staticmethod
     def obtener_ingrediente_por_id(db: Session, ingrediente_id: int) -> Optional[Ingrediente]:
         try:
-            return db.query(Ingrediente).filter(Ingrediente.id == ingrediente_id).first()
+            return cache_lecturas.leer(db, ("Ingredientes", "id", ingrediente_id),
+                                       lambda: db.query(Ingrediente).filter(Ingrediente.id == ingrediente_id).first())
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener ingrediente: {str(e)}")
     
     @staticmethod
     def obtener_ingrediente_por_nombre(db: Session, nombre: str) -> Optional[Ingrediente]:
         try:
-            return db.query(Ingrediente).filter(Ingrediente.nombre == nombre).first()
+            return cache_lecturas.leer(db, ("Ingredientes", "nombre", nombre),
+                                       lambda: db.query(Ingrediente).filter(Ingrediente.nombre == nombre).first())
         except SQLAlchemyError as e:
             raise Exception(f"Error al buscar ingrediente: {str(e)}")
     
@@ -64,7 +87,40 @@ class IngredienteCRUD:
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener ingredientes: {str(e)}")
     
+    # Columnas por las que se puede ordenar el listado paginado
+    COLUMNAS_ORDEN = {
+        "id": Ingrediente.id,
+        "nombre": Ingrediente.nombre,
+        "stock": Ingrediente.stock,
+        "unidad": Ingrediente.unidad,
+    }
+
+    @staticmethod
+    def listar_ingredientes(db: Session, limite: int = 100, despues_de: tuple = None,
+                            orden: str = "id", descendente: bool = False) -> Pagina:
+        """Lista ingredientes de a `limite` como filas (id, nombre, stock, unidad) con cursor."""
+        try:
+            return paginar(db, IngredienteCRUD._consulta_listado(), IngredienteCRUD.COLUMNAS_ORDEN, Ingrediente.id,
+                           limite, despues_de, orden, descendente, Ingrediente.actualizado_en)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al listar ingredientes: {str(e)}")
+
+    @staticmethod
+    def cambios_ingredientes(db: Session, desde: float, ids: List[int], orden: str = "id",
+                             limite: int = LIMITE_CAMBIOS) -> Cambios:
+        """Ingredientes modificados desde la marca `desde` y cuáles de `ids` fueron eliminados."""
+        try:
+            return cambios_desde(db, IngredienteCRUD._consulta_listado(), IngredienteCRUD.COLUMNAS_ORDEN,
+                                 Ingrediente.id, Ingrediente.actualizado_en, desde, ids, orden, limite)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al buscar cambios en ingredientes: {str(e)}")
+
+    @staticmethod
+    def _consulta_listado():
+        return select(Ingrediente.id, Ingrediente.nombre, Ingrediente.stock, Ingrediente.unidad)
+    
     @staticmethod
+    @reintentar_si_ocupado
     def actualizar_ingrediente(db: Session, ingrediente_id: int, nombre: str = None, 
                               stock: float = None, unidad: str = None) -> Optional[Ingrediente]:
         try:
@@ -77,7 +133,7 @@ class IngredienteCRUD:
                     raise ValueError("El nombre del ingrediente no puede estar vacío")
                 # Verificar que no exista otro ingrediente con el mismo nombre
                 nombre_existente = db.query(Ingrediente).filter(
-                    Ingrediente.nombre == nombre.strip(),
+                    Ingrediente.nombre_normalizado == normalizar_nombre(nombre),
                     Ingrediente.id != ingrediente_id
                 ).first()
                 if nombre_existente:
@@ -88,6 +144,7 @@ class IngredienteCRUD:
                 if stock < 0:
                     raise ValueError("El stock no puede ser negativo")
                 ingrediente.stock = stock
+                MenuCRUD.actualizar_agotados(db, [ingrediente_id])
             
             if unidad is not None:
                 if not unidad.strip():
@@ -102,6 +159,7 @@ class IngredienteCRUD:
             raise Exception(f"Error al actualizar ingrediente: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def actualizar_stock(db: Session, ingrediente_id: int, cantidad: float) -> Optional[Ingrediente]:
         try:
             ingrediente = db.query(Ingrediente).filter(Ingrediente.id == ingrediente_id).first()
@@ -115,6 +173,7 @@ class IngredienteCRUD:
                 db.rollback()
                 raise ValueError(f"Stock insuficiente. Stock actual: {ingrediente.stock - cantidad}")
             
+            MenuCRUD.actualizar_agotados(db, [ingrediente_id])
             db.commit()
             db.refresh(ingrediente)
             return ingrediente
@@ -123,16 +182,30 @@ class IngredienteCRUD:
             raise Exception(f"Error al actualizar stock: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def eliminar_ingrediente(db: Session, ingrediente_id: int) -> bool:
         try:
             ingrediente = db.query(Ingrediente).filter(Ingrediente.id == ingrediente_id).first()
             if not ingrediente:
                 return False
             
+            # No eliminar ingredientes que todavía forman parte de alguna receta
+            menus = [
+                nombre for (nombre,) in db.query(Menu.nombre)
+                .join(RecetaIngrediente, RecetaIngrediente.menu_id == Menu.id)
+                .filter(RecetaIngrediente.ingrediente_id == ingrediente_id)
+                .order_by(Menu.nombre)
+                .all()
+            ]
+            if menus:
+                raise ValueError(
+                    f"El ingrediente '{ingrediente.nombre}' se usa en las recetas de: {', '.join(menus)}"
+                )
+            
             db.delete(ingrediente)
             db.commit()
             return True
-        except SQLAlchemyError as e:
+        except (SQLAlchemyError, ValueError) as e:
             db.rollback()
             raise Exception(f"Error al eliminar ingrediente: {str(e)}")
     
@@ -148,20 +221,177 @@ class IngredienteCRUD:
             raise Exception(f"Error al verificar stock: {str(e)}")
     
     @staticmethod
-    def cargar_desde_csv(db: Session, archivo_csv: str) -> dict:
+    def _validar_fila_csv(fila: dict) -> dict:
+        """Valida una fila del CSV y la convierte en valores para insertar."""
+        # Como normalizamos, las claves son 'nombre', 'stock', 'unidad'
+        nombre = (fila.get('nombre') or "").strip()
+        stock_str = (fila.get('stock') or "").strip()
+        unidad = (fila.get('unidad') or "").strip()
+
+        if not nombre:
+            raise ValueError("Nombre vacío")
+
+        try:
+            stock = float(stock_str)
+        except ValueError:
+            raise ValueError(f"Stock inválido: '{stock_str}'")
+
+        if stock <= 0:
+            raise ValueError(f"Stock debe ser positivo: {stock}")
+
+        if not unidad:
+            raise ValueError("Unidad vacía")
+
+        return {'nombre': nombre, 'stock': stock, 'unidad': unidad}
+
+    @staticmethod
+    def _validar_lote_csv(filas: List[Tuple[int, dict]]) -> Tuple[List[dict], List[Tuple[int, str]]]:
+        """Valida un lote de filas (número, fila) y retorna (valores válidos, errores).
+
+        Si un nombre se repite dentro del lote (sin distinguir mayúsculas ni
+        espacios) se conserva la última fila, igual que si se hubieran aplicado
+        una por una.
+        """
+        validas, errores = {}, []
+        for fila_num, fila in filas:
+            try:
+                valores = IngredienteCRUD._validar_fila_csv(fila)
+                clave = normalizar_nombre(valores['nombre'])
+                validas.pop(clave, None)
+                validas[clave] = valores
+            except ValueError as e:
+                errores.append((fila_num, str(e)))
+        return list(validas.values()), errores
+
+    @staticmethod
+    def _lotes(iterable: Iterable, tamano: int) -> Iterator[list]:
+        """Agrupa un iterable en listas de a lo más `tamano` elementos."""
+        iterador = iter(iterable)
+        while True:
+            lote = list(islice(iterador, tamano))
+            if not lote:
+                return
+            yield lote
+
+    @staticmethod
+    def _procesar_bloque_csv(archivo_csv: str, inicio: int, fin: int, formato: dict,
+                             columnas: List[str]) -> Tuple[List[dict], List[Tuple[int, str]], int]:
+        """Lee y valida el bloque de bytes [inicio, fin) del CSV en un proceso aparte.
+
+        Retorna (valores válidos, errores con número de fila relativo al bloque,
+        cantidad de filas del bloque).
+        """
+        with open(archivo_csv, 'rb') as file:
+            file.seek(inicio)
+            texto = file.read(fin - inicio).decode('utf-8')
+        # Igual que DictReader: se omiten las líneas vacías
+        filas = [fila for fila in csv.reader(io.StringIO(texto, newline=''), **formato) if fila]
+        validas, errores = IngredienteCRUD._validar_lote_csv(
+            [(fila_num, dict(zip(columnas, fila))) for fila_num, fila in enumerate(filas, start=1)]
+        )
+        return validas, errores, len(filas)
+
+    @staticmethod
+    def _rangos_bloques_csv(archivo_csv: str, tamano_bloque: int) -> Iterator[Tuple[int, int]]:
+        """Divide el archivo (sin el encabezado) en rangos de bytes que terminan en fin de línea."""
+        with open(archivo_csv, 'rb') as file:
+            tamano_archivo = os.fstat(file.fileno()).st_size
+            file.readline()  # Encabezado
+            inicio = file.tell()
+            while inicio < tamano_archivo:
+                file.seek(inicio + tamano_bloque)
+                file.readline()  # Avanzar hasta el fin de la línea actual
+                fin = min(file.tell(), tamano_archivo)
+                yield inicio, fin
+                inicio = fin
+
+    @staticmethod
+    def _lotes_paralelos_csv(archivo_csv: str, formato: dict, columnas: List[str],
+                             procesos: int) -> Iterator[Tuple[List[dict], List[Tuple[int, str]], int]]:
+        """Valida bloques del CSV en un ProcessPoolExecutor y los entrega en el orden del archivo.
+
+        Mantiene a lo más dos bloques por proceso en curso para acotar la memoria.
+        """
+        fila_base = 1  # La fila 1 es el encabezado
+        with ProcessPoolExecutor(max_workers=procesos) as ejecutor:
+            pendientes = deque()
+            rangos = IngredienteCRUD._rangos_bloques_csv(archivo_csv, TAMANO_BLOQUE_CSV)
+            for inicio, fin in rangos:
+                pendientes.append(ejecutor.submit(
+                    IngredienteCRUD._procesar_bloque_csv, archivo_csv, inicio, fin, formato, columnas
+                ))
+                while len(pendientes) >= 2 * procesos or (pendientes and pendientes[0].done()):
+                    validas, errores, cantidad = pendientes.popleft().result()
+                    yield validas, [(fila_base + n, error) for n, error in errores], cantidad
+                    fila_base += cantidad
+            while pendientes:
+                validas, errores, cantidad = pendientes.popleft().result()
+                yield validas, [(fila_base + n, error) for n, error in errores], cantidad
+                fila_base += cantidad
+
+    @staticmethod
+    def contar_filas_csv(archivo_csv: str) -> int:
+        """Cuenta rápidamente las líneas de datos del CSV (sin el encabezado) para estimar el avance."""
+        lineas = 0
+        ultimo = b"\n"
+        with open(archivo_csv, 'rb') as file:
+            for bloque in iter(lambda: file.read(1024 * 1024), b""):
+                lineas += bloque.count(b"\n")
+                ultimo = bloque[-1:]
+        if ultimo != b"\n":
+            lineas += 1  # Última línea sin salto de línea
+        return max(lineas - 1, 0)
+
+    @staticmethod
+    def _sentencia_upsert():
+        """INSERT ... ON CONFLICT(nombre_normalizado) DO UPDATE para crear o actualizar ingredientes."""
+        sentencia = sqlite_insert(Ingrediente.__table__)
+        return sentencia.on_conflict_do_update(
+            index_elements=['nombre_normalizado'],
+            # ON CONFLICT no aplica el onupdate de la columna: la marca se pone a mano
+            set_={'stock': sentencia.excluded.stock, 'unidad': sentencia.excluded.unidad,
+                  'actualizado_en': marca_tiempo()}
+        )
+
+    @staticmethod
+    def cargar_desde_csv(db: Session, archivo_csv: str, tamano_lote: int = TAMANO_LOTE_CSV,
+                         archivo_errores: Optional[str] = None, procesos: int = 1,
+                         al_avanzar: Optional[Callable[[dict], Optional[bool]]] = None) -> dict:
         """Importa ingredientes desde archivo CSV con validación y manejo de errores.
         
+        El archivo se lee por partes y cada lote de `tamano_lote` filas se guarda
+        con un solo upsert y se confirma, así la memoria no crece con el archivo.
+        El detalle de las filas con error se escribe en `archivo_errores` (por
+        defecto `<archivo_csv>.errores.csv`, solo si hay errores); en 'mensajes'
+        quedan los primeros errores y un resumen.
+        
+        Con `procesos` > 1 (o None para usar todos los núcleos) el archivo se divide
+        en bloques por líneas que se leen y validan en paralelo; las escrituras
+        siguen el orden del archivo, así una fila repetida sigue ganando la última.
+        Este modo supone una fila por línea (sin saltos de línea dentro de comillas).
+        
+        `al_avanzar` se llama con las estadísticas después de confirmar cada lote;
+        si retorna False la importación se detiene conservando los lotes ya
+        confirmados y el resultado queda con 'cancelado' en True.
+        
         Retorna diccionario con estadísticas de la operación de importación.
         """
         resultados = {
             'exitosos': 0,
             'errores': 0,
-            'mensajes': []
+            'mensajes': [],
+            'archivo_errores': None,
+            'filas_por_segundo': 0.0,
+            'cancelado': False
         }
+        archivo_errores = archivo_errores or f"{archivo_csv}.errores.csv"
+        procesos = procesos or os.cpu_count() or 1
+        salida_errores = None
+        inicio = time.perf_counter()
 
         try:
             # Abrir con utf-8-sig para eliminar BOM si existe
-            with open(archivo_csv, 'r', encoding='utf-8-sig') as file:
+            with open(archivo_csv, 'r', encoding='utf-8-sig', newline='') as file:
                 # Detectar delimitador (coma o punto y coma)
                 muestra = file.read(1024)
                 file.seek(0)
@@ -181,7 +411,6 @@ class IngredienteCRUD:
                     (col or "").strip().lower().replace("\ufeff", "")
                     for col in reader.fieldnames
                 ]
-                print("DEBUG columnas leídas:", reader.fieldnames)
 
                 # Reasignar fieldnames normalizados manteniendo el orden
                 reader.fieldnames = normalizadas
@@ -193,69 +422,78 @@ class IngredienteCRUD:
                         "El CSV debe contener las columnas: nombre, stock, unidad"
                     )
 
-                for fila_num, fila in enumerate(reader, start=2):
-                    try:
-                        # Como normalizamos, ahora las claves son 'nombre', 'stock', 'unidad'
-                        nombre = (fila.get('nombre') or "").strip()
-                        stock_str = (fila.get('stock') or "").strip()
-                        unidad = (fila.get('unidad') or "").strip()
-
-                        # Validar datos
-                        if not nombre:
-                            raise ValueError("Nombre vacío")
-
-                        try:
-                            stock = float(stock_str)
-                        except ValueError:
-                            raise ValueError(f"Stock inválido: '{stock_str}'")
-
-                        if stock <= 0:
-                            raise ValueError(f"Stock debe ser positivo: {stock}")
-
-                        if not unidad:
-                            raise ValueError("Unidad vacía")
-
-                        # Verificar si el ingrediente ya existe
-                        ingrediente_existente = db.query(Ingrediente).filter(
-                            Ingrediente.nombre == nombre
-                        ).first()
-
-                        if ingrediente_existente:
-                            # Actualizar stock del ingrediente existente
-                            ingrediente_existente.stock = stock
-                            ingrediente_existente.unidad = unidad
-                            resultados['mensajes'].append(
-                                f"Fila {fila_num}: Actualizado '{nombre}'"
-                            )
-                        else:
-                            # Crear nuevo ingrediente
-                            nuevo_ingrediente = Ingrediente(
-                                nombre=nombre,
-                                stock=stock,
-                                unidad=unidad
-                            )
-                            db.add(nuevo_ingrediente)
-                            resultados['mensajes'].append(
-                                f"Fila {fila_num}: Creado '{nombre}'"
-                            )
-
-                        resultados['exitosos'] += 1
-
-                    except Exception as e:
-                        resultados['errores'] += 1
-                        resultados['mensajes'].append(
-                            f"Fila {fila_num}: Error - {str(e)}"
-                        )
-                        continue
-
-                # Confirmar todos los cambios al final
-                db.commit()
+                if procesos > 1:
+                    formato = {
+                        'delimiter': dialect.delimiter, 'quotechar': dialect.quotechar,
+                        'doublequote': dialect.doublequote, 'escapechar': dialect.escapechar,
+                        'skipinitialspace': dialect.skipinitialspace
+                    }
+                    lotes = IngredienteCRUD._lotes_paralelos_csv(
+                        archivo_csv, formato, normalizadas, procesos
+                    )
+                else:
+                    lotes = (
+                        IngredienteCRUD._validar_lote_csv(lote) + (len(lote),)
+                        for lote in IngredienteCRUD._lotes(enumerate(reader, start=2), tamano_lote)
+                    )
+
+                sentencia = IngredienteCRUD._sentencia_upsert()
+
+                def escribir(parte):
+                    db.execute(sentencia, parte)
+                    # El stock de estos ingredientes cambió: recalcular los menús que los usan,
+                    # con los nombres por partes para no pasar el límite de parámetros de SQLite
+                    nombres = [normalizar_nombre(fila['nombre']) for fila in parte]
+                    for inicio_nombres in range(0, len(nombres), TAMANO_LOTE_IDS):
+                        MenuCRUD.actualizar_agotados(db, select(Ingrediente.id).where(
+                            Ingrediente.nombre_normalizado.in_(nombres[inicio_nombres:inicio_nombres + TAMANO_LOTE_IDS])
+                        ))
+
+                for validas, errores, cantidad in lotes:
+                    for parte in IngredienteCRUD._lotes(validas, tamano_lote):
+                        # Confirmar el avance de cada lote; si la base está ocupada se repite solo este
+                        confirmar_lote(db, lambda: escribir(parte))
+                    resultados['exitosos'] += cantidad - len(errores)
+
+                    for fila_num, error in errores:
+                        if salida_errores is None:
+                            salida_errores = open(archivo_errores, 'w', encoding='utf-8', newline='')
+                            escritor_errores = csv.writer(salida_errores)
+                            escritor_errores.writerow(['fila', 'error'])
+                        escritor_errores.writerow([fila_num, error])
+                        if len(resultados['mensajes']) < MAX_MENSAJES_CSV:
+                            resultados['mensajes'].append(f"Fila {fila_num}: Error - {error}")
+                    resultados['errores'] += len(errores)
+
+                    if al_avanzar is not None:
+                        duracion = time.perf_counter() - inicio
+                        filas = resultados['exitosos'] + resultados['errores']
+                        resultados['filas_por_segundo'] = filas / duracion if duracion > 0 else 0.0
+                        if al_avanzar({**resultados, 'mensajes': list(resultados['mensajes'])}) is False:
+                            resultados['cancelado'] = True
+                            lotes.close()  # Detiene la lectura (y los procesos, si los hay)
+                            break
 
         except FileNotFoundError:
             raise Exception(f"Archivo no encontrado: {archivo_csv}")
         except Exception as e:
             db.rollback()
             raise Exception(f"Error al cargar CSV: {str(e)}")
+        finally:
+            if salida_errores is not None:
+                salida_errores.close()
 
+        duracion = time.perf_counter() - inicio
+        filas = resultados['exitosos'] + resultados['errores']
+        resultados['filas_por_segundo'] = filas / duracion if duracion > 0 else float(filas)
+        if salida_errores is not None:
+            resultados['archivo_errores'] = archivo_errores
+            if resultados['errores'] > MAX_MENSAJES_CSV:
+                resultados['mensajes'].append(
+                    f"... {resultados['errores'] - MAX_MENSAJES_CSV} errores más en {archivo_errores}"
+                )
+        resultados['mensajes'].append(
+            f"{filas} filas procesadas ({resultados['filas_por_segundo']:.0f} filas/s)"
+            + (", importación cancelada" if resultados['cancelado'] else "")
+        )
         return resultados
-
@@ -1,16 +1,317 @@
+from sqlalchemy import select, func, insert, update, delete, case, exists, bindparam
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from models import Menu, Ingrediente
-from typing import Optional, List, Dict
+from database import confirmar_lote, reintentar_si_ocupado
+from cache import cache_lecturas
+from models import (Menu, Ingrediente, Pedido, ItemPedido, RecetaIngrediente, RecetaSubreceta, RecetaPlana,
+                    normalizar_nombre)
+from crud.ventas_crud import VentasDiariasCRUD
+from crud.paginacion import Cambios, Pagina, cambios_desde, paginar, LIMITE_CAMBIOS, TAMANO_LOTE_IDS
+from typing import Any, Callable, Iterator, Optional, List, Dict, Tuple
+from itertools import groupby, islice
+import csv
+import json
+import time
+
+# Filas del archivo de menús que se validan, guardan y confirman en cada lote
+TAMANO_LOTE_MENUS = 500
+# Errores que se incluyen en 'mensajes'; el detalle completo va al archivo de errores
+MAX_MENSAJES_IMPORTACION = 20
 
 class MenuCRUD:
     """Clase para operaciones CRUD de menús con validación de recetas."""
     
     @staticmethod
+    def _resolver_recetas(db: Session, recetas: List[Dict[str, Any]], verificar_stock: bool = True
+                          ) -> Tuple[List[List[Tuple[Ingrediente, float]]], List[Tuple[int, str]]]:
+        """Valida varias recetas {nombre: cantidad} y las convierte en pares (ingrediente, cantidad).
+
+        Los nombres de todas las recetas se buscan juntos por `nombre_normalizado`
+        (sin distinguir mayúsculas ni espacios repetidos), con una consulta IN (...)
+        por cada TAMANO_LOTE_IDS nombres distintos. No se detiene en el primer
+        problema: retorna las recetas resueltas y la lista completa de errores como
+        (índice de la receta, mensaje).
+        """
+        errores = []
+        validas = []  # Por receta: [(nombre, nombre normalizado, cantidad)]
+        for indice, receta in enumerate(recetas):
+            if not isinstance(receta, dict):
+                errores.append((indice, "La receta debe ser un objeto {ingrediente: cantidad}"))
+                validas.append([])
+                continue
+
+            # Control de ingredientes duplicados en la receta
+            entradas = []
+            ingredientes_vistos = set()
+            for ingrediente, cantidad in receta.items():
+                if not isinstance(ingrediente, str) or not ingrediente.strip():
+                    errores.append((indice, "Nombre de ingrediente vacío en la receta"))
+                    continue
+
+                normalizado = normalizar_nombre(ingrediente)
+                if normalizado in ingredientes_vistos:
+                    errores.append((indice, f"El ingrediente '{ingrediente}' está duplicado en la receta"))
+                    continue
+                ingredientes_vistos.add(normalizado)
+
+                # Validar cantidades (desde un archivo pueden venir como texto)
+                try:
+                    if isinstance(cantidad, bool):
+                        raise TypeError
+                    cantidad = float(cantidad)
+                except (TypeError, ValueError):
+                    errores.append((indice, f"La cantidad del ingrediente '{ingrediente}' no es un número"))
+                    continue
+                if cantidad <= 0:
+                    errores.append((indice, f"La cantidad del ingrediente '{ingrediente}' debe ser mayor que cero"))
+                    continue
+                entradas.append((ingrediente, normalizado, cantidad))
+            validas.append(entradas)
+
+        # Una consulta por lote de nombres distintos, sobre el índice de nombre_normalizado
+        nombres = list({normalizado for entradas in validas for _, normalizado, _ in entradas})
+        candidatos = {}  # nombre normalizado -> [Ingrediente]
+        for inicio in range(0, len(nombres), TAMANO_LOTE_IDS):
+            lote = nombres[inicio:inicio + TAMANO_LOTE_IDS]
+            for ingrediente in db.query(Ingrediente).filter(Ingrediente.nombre_normalizado.in_(lote)):
+                candidatos.setdefault(ingrediente.nombre_normalizado, []).append(ingrediente)
+
+        resueltas = []
+        for indice, entradas in enumerate(validas):
+            resueltos = []
+            for ingrediente, normalizado, cantidad in entradas:
+                # Validar que el ingrediente exista en la base de datos
+                opciones = candidatos.get(normalizado, [])
+                if len(opciones) > 1:
+                    # Bases anteriores pueden tener "Tomate" y "tomate": manda la coincidencia exacta
+                    opciones = [opcion for opcion in opciones if opcion.nombre == ingrediente.strip()]
+                    if len(opciones) != 1:
+                        errores.append((indice, f"El ingrediente '{ingrediente}' es ambiguo en la base de datos"))
+                        continue
+                if not opciones:
+                    errores.append((indice, f"El ingrediente '{ingrediente}' no existe en la base de datos"))
+                    continue
+                ingrediente_db = opciones[0]
+
+                # Validar que tenga stock suficiente
+                if verificar_stock and ingrediente_db.stock < cantidad:
+                    errores.append((indice,
+                                    f"Stock insuficiente para '{ingrediente_db.nombre}'. "
+                                    f"Disponible: {ingrediente_db.stock} {ingrediente_db.unidad}, "
+                                    f"Requerido: {cantidad} {ingrediente_db.unidad}"))
+                    continue
+                resueltos.append((ingrediente_db, cantidad))
+            resueltas.append(resueltos)
+        return resueltas, errores
+
+    @staticmethod
+    def _resolver_receta(db: Session, receta: Dict[str, Any],
+                         verificar_stock: bool = True) -> List[Tuple[Ingrediente, float]]:
+        """Valida una receta {nombre: cantidad}; si tiene problemas los informa todos juntos."""
+        resueltas, errores = MenuCRUD._resolver_recetas(db, [receta], verificar_stock)
+        if errores:
+            raise ValueError("\n".join(mensaje for _, mensaje in errores))
+        return resueltas[0]
+    
+    @staticmethod
+    def _asignar_receta(menu: Menu, resueltos: List[Tuple[Ingrediente, float]]) -> None:
+        """Actualiza las filas de receta del menú en su lugar: modifica cantidades,
+        agrega ingredientes nuevos y elimina los que ya no están (delete-orphan).
+        """
+        actuales = {ri.ingrediente_id: ri for ri in menu.receta_ingredientes}
+        nuevos = []
+        for ingrediente, cantidad in resueltos:
+            fila = actuales.pop(ingrediente.id, None)
+            if fila is None:
+                fila = RecetaIngrediente(ingrediente=ingrediente, cantidad=cantidad)
+            else:
+                fila.cantidad = cantidad
+            nuevos.append(fila)
+        menu.receta_ingredientes = nuevos
+
+    @staticmethod
+    def _resolver_subrecetas(db: Session, subrecetas: Dict[str, Any]) -> List[Tuple[Menu, float]]:
+        """Valida subrecetas {nombre_menu: porciones} y las convierte en pares (menú, cantidad).
+
+        Los menús se buscan por nombre con una sola consulta IN (...) y los
+        problemas se informan todos juntos. Los ciclos se detectan al aplanar.
+        """
+        errores = []
+        entradas = []
+        for nombre, cantidad in subrecetas.items():
+            if not isinstance(nombre, str) or not nombre.strip():
+                errores.append("Nombre de subreceta vacío")
+                continue
+            try:
+                if isinstance(cantidad, bool):
+                    raise TypeError
+                cantidad = float(cantidad)
+            except (TypeError, ValueError):
+                errores.append(f"La cantidad de la subreceta '{nombre}' no es un número")
+                continue
+            if cantidad <= 0:
+                errores.append(f"La cantidad de la subreceta '{nombre}' debe ser mayor que cero")
+                continue
+            entradas.append((nombre.strip(), cantidad))
+
+        candidatos = {}
+        if entradas:
+            for menu in db.query(Menu).filter(Menu.nombre.in_([nombre for nombre, _ in entradas])):
+                candidatos.setdefault(menu.nombre, []).append(menu)
+
+        resueltos = []
+        vistos = set()
+        for nombre, cantidad in entradas:
+            opciones = candidatos.get(nombre, [])
+            if not opciones:
+                errores.append(f"La subreceta '{nombre}' no existe")
+            elif len(opciones) > 1:
+                errores.append(f"Hay varios menús llamados '{nombre}'")
+            elif opciones[0].id in vistos:
+                errores.append(f"La subreceta '{nombre}' está duplicada")
+            else:
+                vistos.add(opciones[0].id)
+                resueltos.append((opciones[0], cantidad))
+        if errores:
+            raise ValueError("\n".join(errores))
+        return resueltos
+
+    @staticmethod
+    def _asignar_subrecetas(menu: Menu, resueltos: List[Tuple[Menu, float]]) -> None:
+        """Actualiza las filas de subrecetas del menú en su lugar, como `_asignar_receta`."""
+        actuales = {rs.subreceta_id: rs for rs in menu.receta_subrecetas}
+        nuevos = []
+        for subreceta, cantidad in resueltos:
+            fila = actuales.pop(subreceta.id, None)
+            if fila is None:
+                fila = RecetaSubreceta(subreceta=subreceta, cantidad=cantidad)
+            else:
+                fila.cantidad = cantidad
+            nuevos.append(fila)
+        menu.receta_subrecetas = nuevos
+
+    @staticmethod
+    def actualizar_recetas_planas(db: Session, menu_ids: List[int]) -> List[int]:
+        """Recalcula RecetasPlanas de los menús indicados y de los que los usan como subreceta.
+
+        Los menús afectados (hacia arriba) y las recetas que hacen falta para
+        aplanarlos (hacia abajo) salen de dos consultas recursivas; cada menú se
+        aplana una sola vez aunque aparezca en varias recetas. Un ciclo de
+        subrecetas lanza ValueError. Trabaja en la transacción en curso y también
+        recalcula `agotado`. Retorna los ids de los menús afectados.
+        """
+        menu_ids = list(menu_ids)
+        if not menu_ids:
+            return []
+        db.flush()
+
+        arriba = select(Menu.id).where(Menu.id.in_(menu_ids)).cte("arriba", recursive=True)
+        arriba = arriba.union(
+            select(RecetaSubreceta.menu_id).join(arriba, RecetaSubreceta.subreceta_id == arriba.c.id)
+        )
+        afectados = db.scalars(select(arriba.c.id)).all()
+
+        abajo = select(Menu.id).where(Menu.id.in_(afectados)).cte("abajo", recursive=True)
+        abajo = abajo.union(
+            select(RecetaSubreceta.subreceta_id).join(abajo, RecetaSubreceta.menu_id == abajo.c.id)
+        )
+        necesarios = select(abajo.c.id)
+        propios = {}  # menu_id -> [(ingrediente_id, cantidad)]
+        for menu_id, ingrediente_id, cantidad in db.execute(
+            select(RecetaIngrediente.menu_id, RecetaIngrediente.ingrediente_id, RecetaIngrediente.cantidad)
+            .where(RecetaIngrediente.menu_id.in_(necesarios))
+        ):
+            propios.setdefault(menu_id, []).append((ingrediente_id, cantidad))
+        hijos = {}  # menu_id -> [(subreceta_id, cantidad)]
+        for menu_id, subreceta_id, cantidad in db.execute(
+            select(RecetaSubreceta.menu_id, RecetaSubreceta.subreceta_id, RecetaSubreceta.cantidad)
+            .where(RecetaSubreceta.menu_id.in_(necesarios))
+        ):
+            hijos.setdefault(menu_id, []).append((subreceta_id, cantidad))
+
+        planas = {}  # Memo: menu_id -> {ingrediente_id: cantidad}
+        camino = []
+
+        def aplanar(menu_id):
+            if menu_id in planas:
+                return planas[menu_id]
+            if menu_id in camino:
+                ciclo = camino[camino.index(menu_id):] + [menu_id]
+                nombres = dict(db.execute(select(Menu.id, Menu.nombre).where(Menu.id.in_(ciclo))).all())
+                raise ValueError("Las subrecetas forman un ciclo: " + " → ".join(nombres[i] for i in ciclo))
+            camino.append(menu_id)
+            plana = {}
+            for ingrediente_id, cantidad in propios.get(menu_id, []):
+                plana[ingrediente_id] = plana.get(ingrediente_id, 0.0) + cantidad
+            for subreceta_id, porciones in hijos.get(menu_id, []):
+                for ingrediente_id, cantidad in aplanar(subreceta_id).items():
+                    plana[ingrediente_id] = plana.get(ingrediente_id, 0.0) + porciones * cantidad
+            camino.pop()
+            planas[menu_id] = plana
+            return plana
+
+        filas = [
+            {"menu_id": menu_id, "ingrediente_id": ingrediente_id, "cantidad": cantidad}
+            for menu_id in afectados
+            for ingrediente_id, cantidad in aplanar(menu_id).items()
+        ]
+        tabla = RecetaPlana.__table__
+        db.execute(delete(tabla).where(tabla.c.menu_id.in_(afectados)))
+        if filas:
+            db.execute(insert(tabla), filas)
+        MenuCRUD.actualizar_agotados(db, menu_ids=afectados)
+        return afectados
+    
+    @staticmethod
+    def actualizar_agotados(db: Session, ingrediente_ids=None, menu_ids=None) -> int:
+        """Recalcula `agotado` solo en los menús que usan los ingredientes indicados, o en `menu_ids`.
+
+        Un menú queda agotado si a algún ingrediente de su receta (aplanada, con
+        las subrecetas) no le alcanza el stock para una porción. Los menús
+        afectados se buscan por el índice de RecetasPlanas.ingrediente_id
+        (ingrediente -> menús), sin recorrer el catálogo. `ingrediente_ids` puede ser una lista o un SELECT de ids. Trabaja
+        en la transacción en curso (no hace commit) y solo escribe los menús cuyo
+        estado cambia. Retorna cuántos cambiaron.
+        """
+        if menu_ids is not None:
+            afectados = Menu.id.in_(list(menu_ids))
+        elif ingrediente_ids is not None:
+            if isinstance(ingrediente_ids, (list, tuple, set)) and not ingrediente_ids:
+                return 0
+            if isinstance(ingrediente_ids, (tuple, set)):
+                ingrediente_ids = list(ingrediente_ids)
+            afectados = Menu.id.in_(
+                select(RecetaPlana.menu_id).where(RecetaPlana.ingrediente_id.in_(ingrediente_ids))
+            )
+        else:
+            raise ValueError("Debe indicar ingredientes o menús")
+
+        db.flush()  # El stock pendiente en la sesión tiene que estar escrito para compararlo
+        falta_stock = exists().where(
+            RecetaPlana.menu_id == Menu.id,
+            Ingrediente.id == RecetaPlana.ingrediente_id,
+            Ingrediente.stock < RecetaPlana.cantidad
+        )
+        nuevo = case((falta_stock, 1), else_=0)
+        cambios = db.execute(select(Menu.id, nuevo).where(afectados, Menu.agotado != nuevo)).all()
+
+        # Normalmente no cambia nada y basta con la consulta; solo se escribe si hay cambios
+        for valor in (0, 1):
+            ids = [menu_id for menu_id, agotado in cambios if agotado == valor]
+            if ids:
+                db.execute(update(Menu).where(Menu.id.in_(ids)).values(agotado=valor))
+        return len(cambios)
+
+    @staticmethod
+    @reintentar_si_ocupado
     def crear_menu(db: Session, nombre: str, descripcion: str, precio: float, 
                    categoria: str = None, disponible: bool = True, 
-                   receta: Dict[str, float] = None) -> Optional[Menu]:
-        """Crea un nuevo elemento de menú con validaciones de receta e ingredientes."""
+                   receta: Dict[str, float] = None,
+                   subrecetas: Dict[str, float] = None) -> Optional[Menu]:
+        """Crea un nuevo elemento de menú con validaciones de receta e ingredientes.
+
+        `subrecetas` indica otras recetas usadas, {nombre_menu: porciones}.
+        """
         try:
             # Validación de nombre obligatorio
             if not nombre or not nombre.strip():
@@ -21,46 +322,21 @@ class MenuCRUD:
                 raise ValueError("El precio debe ser mayor que cero")
             
             # Validación y verificación de receta
-            if receta:
-                # Control de ingredientes duplicados en la receta
-                ingredientes_vistos = set()
-                for ingrediente, cantidad in receta.items():
-                    if not ingrediente or not ingrediente.strip():
-                        raise ValueError("Nombre de ingrediente vacío en la receta")
-                    
-                    ingrediente_lower = ingrediente.lower()
-                    if ingrediente_lower in ingredientes_vistos:
-                        raise ValueError(f"El ingrediente '{ingrediente}' está duplicado en la receta")
-                    ingredientes_vistos.add(ingrediente_lower)
-                    
-                    # Validar cantidades
-                    if cantidad <= 0:
-                        raise ValueError(f"La cantidad del ingrediente '{ingrediente}' debe ser mayor que cero")
-                    
-                    # Validar que el ingrediente exista en la base de datos
-                    ingrediente_db = db.query(Ingrediente).filter(
-                        Ingrediente.nombre == ingrediente
-                    ).first()
-                    if not ingrediente_db:
-                        raise ValueError(f"El ingrediente '{ingrediente}' no existe en la base de datos")
-                    
-                    # Validar que tenga stock suficiente
-                    if ingrediente_db.stock < cantidad:
-                        raise ValueError(
-                            f"Stock insuficiente para '{ingrediente}'. "
-                            f"Disponible: {ingrediente_db.stock} {ingrediente_db.unidad}, "
-                            f"Requerido: {cantidad} {ingrediente_db.unidad}"
-                        )
+            resueltos = MenuCRUD._resolver_receta(db, receta) if receta else []
+            componentes = MenuCRUD._resolver_subrecetas(db, subrecetas) if subrecetas else []
             
             nuevo_menu = Menu(
                 nombre=nombre.strip(),
                 descripcion=descripcion.strip() if descripcion else None,
                 precio=precio,
                 categoria=categoria.strip() if categoria else None,
-                disponible=1 if disponible else 0,
-                receta=receta
+                disponible=1 if disponible else 0
             )
+            MenuCRUD._asignar_receta(nuevo_menu, resueltos)
+            MenuCRUD._asignar_subrecetas(nuevo_menu, componentes)
             db.add(nuevo_menu)
+            db.flush()
+            MenuCRUD.actualizar_recetas_planas(db, [nuevo_menu.id])
             db.commit()
             db.refresh(nuevo_menu)
             return nuevo_menu
@@ -68,10 +344,330 @@ class MenuCRUD:
             db.rollback()
             raise Exception(f"Error al crear menú: {str(e)}")
     
+    @staticmethod
+    def _validar_fila_menu(datos: Dict[str, Any]) -> Dict[str, Any]:
+        """Valida los datos de un menú (de un dict o de una fila de archivo) y los normaliza.
+
+        En los archivos todo llega como texto: el precio se convierte a número y
+        la receta, si viene como texto, se lee como JSON {"ingrediente": cantidad}.
+        """
+        if not isinstance(datos, dict):
+            raise ValueError("Se esperaba un objeto con los datos del menú")
+
+        nombre = datos.get("nombre")
+        nombre = nombre.strip() if isinstance(nombre, str) else ""
+        if not nombre:
+            raise ValueError("El nombre no puede estar vacío")
+
+        try:
+            precio = float(datos.get("precio"))
+        except (TypeError, ValueError):
+            raise ValueError(f"Precio inválido: '{datos.get('precio')}'")
+        if precio <= 0:
+            raise ValueError("El precio debe ser mayor que cero")
+
+        receta = datos.get("receta")
+        if isinstance(receta, str):
+            try:
+                receta = json.loads(receta) if receta.strip() else None
+            except json.JSONDecodeError:
+                raise ValueError('Receta inválida, use JSON {"ingrediente": cantidad}')
+
+        disponible = datos.get("disponible", True)
+        if isinstance(disponible, str):
+            disponible = disponible.strip().lower() not in ("0", "no", "false")
+
+        return {
+            "nombre": nombre,
+            "descripcion": (datos.get("descripcion") or "").strip() or None,
+            "precio": precio,
+            "categoria": (datos.get("categoria") or "").strip() or None,
+            "disponible": 1 if disponible else 0,
+            "receta": receta or {},
+        }
+
+    @staticmethod
+    @reintentar_si_ocupado
+    def crear_menus(db: Session, menus: List[Dict[str, Any]], verificar_stock: bool = False) -> List[Menu]:
+        """Crea varios menús en una sola transacción.
+
+        Cada menú es un dict con nombre, precio y opcionalmente descripcion,
+        categoria, disponible y receta. Todas las recetas se validan juntas con
+        `_resolver_recetas`; si algún menú tiene problemas no se crea ninguno y el
+        error los lista todos. Por defecto no se exige stock (un catálogo se carga
+        antes de reponer): los menús sin stock quedan marcados como agotados.
+        """
+        try:
+            errores = []
+            validos = []
+            nombres_vistos = set()
+            for numero, datos in enumerate(menus, start=1):
+                try:
+                    valores = MenuCRUD._validar_fila_menu(datos)
+                except ValueError as e:
+                    errores.append(f"Menú {numero}: {str(e)}")
+                    valores = None
+                else:
+                    if normalizar_nombre(valores["nombre"]) in nombres_vistos:
+                        errores.append(f"Menú {numero} ('{valores['nombre']}'): está repetido")
+                    nombres_vistos.add(normalizar_nombre(valores["nombre"]))
+                validos.append(valores)
+
+            resueltas, errores_recetas = MenuCRUD._resolver_recetas(
+                db, [valores["receta"] if valores else {} for valores in validos], verificar_stock
+            )
+            errores.extend(f"Menú {indice + 1} ('{validos[indice]['nombre']}'): {mensaje}"
+                           for indice, mensaje in errores_recetas)
+            if errores:
+                raise ValueError("\n".join(errores))
+
+            nuevos = []
+            for valores, resueltos in zip(validos, resueltas):
+                menu = Menu(**{clave: valor for clave, valor in valores.items() if clave != "receta"})
+                MenuCRUD._asignar_receta(menu, resueltos)
+                nuevos.append(menu)
+            db.add_all(nuevos)
+            db.flush()
+            MenuCRUD.actualizar_recetas_planas(db, [menu.id for menu in nuevos])
+            db.commit()
+            return nuevos
+        except (SQLAlchemyError, ValueError) as e:
+            db.rollback()
+            raise Exception(f"Error al crear menús: {str(e)}")
+
+    # --- Importación y exportación del catálogo ----------------------------
+    # Formatos: JSON lines (.jsonl/.ndjson, un objeto por línea) o CSV con las
+    # columnas nombre, descripcion, precio, categoria, disponible y receta, donde
+    # la receta va en JSON igual que en el formulario. Los menús se identifican
+    # por nombre: uno existente se actualiza (con su receta) y uno nuevo se crea.
+
+    @staticmethod
+    def _es_json_lines(archivo: str) -> bool:
+        return archivo.lower().endswith((".jsonl", ".ndjson"))
+
+    @staticmethod
+    def _filas_archivo_menus(entrada, archivo: str) -> Iterator[Tuple[int, Any]]:
+        """Recorre el archivo abierto de a una fila, como (número de línea, datos o excepción)."""
+        if MenuCRUD._es_json_lines(archivo):
+            for numero, linea in enumerate(entrada, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    yield numero, json.loads(linea)
+                except json.JSONDecodeError as e:
+                    yield numero, ValueError(f"JSON inválido: {e.msg}")
+            return
+
+        # El delimitador se toma del encabezado: las recetas JSON llevan comas entre comillas
+        encabezado = entrada.readline()
+        delimitador = ";" if encabezado.count(";") > encabezado.count(",") else ","
+        columnas = [columna.strip().lower() for columna in next(csv.reader([encabezado], delimiter=delimitador), [])]
+        if not {"nombre", "precio"} <= set(columnas):
+            raise ValueError("El CSV debe contener al menos las columnas: nombre, precio")
+        reader = csv.DictReader(entrada, fieldnames=columnas, delimiter=delimitador)
+        for numero, fila in enumerate(reader, start=2):
+            yield numero, fila
+
+    @staticmethod
+    def _guardar_lote_menus(db: Session, filas: List[Tuple[int, Any]]) -> Tuple[int, List[Tuple[int, str]]]:
+        """Valida y guarda un lote de filas (número, datos) sin confirmar.
+
+        Las recetas del lote se resuelven con una consulta, los menús existentes se
+        buscan con otra y las escrituras son un INSERT, un UPDATE y el reemplazo de
+        las filas de receta, cada uno en una sola ejecución. Si un nombre se repite
+        dentro del lote gana la última fila. Retorna (filas guardadas, errores).
+        """
+        errores = []
+        validas = []
+        for numero, datos in filas:
+            try:
+                if isinstance(datos, Exception):
+                    raise datos
+                validas.append((numero, MenuCRUD._validar_fila_menu(datos)))
+            except ValueError as e:
+                errores.append((numero, str(e)))
+
+        resueltas, errores_recetas = MenuCRUD._resolver_recetas(
+            db, [valores["receta"] for _, valores in validas], verificar_stock=False
+        )
+        con_error = {}
+        for indice, mensaje in errores_recetas:
+            con_error.setdefault(indice, []).append(mensaje)
+        errores.extend((validas[indice][0], "; ".join(mensajes)) for indice, mensajes in con_error.items())
+
+        por_nombre = {}  # nombre -> (valores, receta resuelta)
+        for indice, ((_, valores), resueltos) in enumerate(zip(validas, resueltas)):
+            if indice not in con_error:
+                por_nombre.pop(valores["nombre"], None)
+                por_nombre[valores["nombre"]] = (valores, resueltos)
+        if not por_nombre:
+            return 0, sorted(errores)
+
+        # Con nombres repetidos en la base se actualiza el menú más antiguo
+        existentes = dict(db.execute(
+            select(Menu.nombre, func.min(Menu.id))
+            .where(Menu.nombre.in_(list(por_nombre)))
+            .group_by(Menu.nombre)
+        ).all())
+
+        tabla = Menu.__table__
+        nuevos = [valores for nombre, (valores, _) in por_nombre.items() if nombre not in existentes]
+        columnas = ("nombre", "descripcion", "precio", "categoria", "disponible")
+        ids = dict(existentes)
+        if nuevos:
+            creados = db.execute(
+                insert(tabla).returning(tabla.c.nombre, tabla.c.id),
+                [{columna: valores[columna] for columna in columnas} for valores in nuevos]
+            )
+            ids.update(creados.all())
+        if existentes:
+            db.execute(
+                update(tabla).where(tabla.c.id == bindparam("b_id"))
+                .values(**{columna: bindparam(f"b_{columna}") for columna in columnas}),
+                [{"b_id": existentes[nombre], **{f"b_{columna}": valores[columna] for columna in columnas}}
+                 for nombre, (valores, _) in por_nombre.items() if nombre in existentes]
+            )
+            db.execute(delete(RecetaIngrediente.__table__).where(
+                RecetaIngrediente.__table__.c.menu_id.in_(list(existentes.values()))
+            ))
+            # Si alguno cambió de categoría, sus ventas ya resumidas pasan a la nueva
+            VentasDiariasCRUD.actualizar_categorias(db, list(existentes.values()))
+
+        filas_receta = [
+            {"menu_id": ids[nombre], "ingrediente_id": ingrediente.id, "cantidad": cantidad}
+            for nombre, (_, resueltos) in por_nombre.items()
+            for ingrediente, cantidad in resueltos
+        ]
+        if filas_receta:
+            db.execute(insert(RecetaIngrediente.__table__), filas_receta)
+        # También alcanza a los menús que usan estos como subreceta
+        MenuCRUD.actualizar_recetas_planas(db, [ids[nombre] for nombre in por_nombre])
+        return len(validas) - len(con_error), sorted(errores)
+
+    @staticmethod
+    def cargar_desde_archivo(db: Session, archivo: str, tamano_lote: int = TAMANO_LOTE_MENUS,
+                             archivo_errores: Optional[str] = None,
+                             al_avanzar: Optional[Callable[[dict], Optional[bool]]] = None) -> dict:
+        """Importa el catálogo de menús desde un archivo CSV o JSON lines.
+
+        El archivo se lee por partes y cada lote de `tamano_lote` filas se valida
+        en bloque, se guarda y se confirma, así la memoria no crece con el archivo.
+        Las filas con error se omiten y su detalle va a `archivo_errores` (por
+        defecto `<archivo>.errores.csv`, solo si hay errores). `al_avanzar` funciona
+        igual que en `IngredienteCRUD.cargar_desde_csv`.
+
+        Retorna diccionario con estadísticas de la importación.
+        """
+        resultados = {
+            'exitosos': 0,
+            'errores': 0,
+            'mensajes': [],
+            'archivo_errores': None,
+            'filas_por_segundo': 0.0,
+            'cancelado': False
+        }
+        archivo_errores = archivo_errores or f"{archivo}.errores.csv"
+        salida_errores = None
+        inicio = time.perf_counter()
+
+        try:
+            with open(archivo, 'r', encoding='utf-8-sig', newline='') as entrada:
+                filas = MenuCRUD._filas_archivo_menus(entrada, archivo)
+                lote = list(islice(filas, tamano_lote))
+                while lote:
+                    # Confirmar el avance de cada lote; si la base está ocupada se repite solo este
+                    guardadas, errores = confirmar_lote(db, lambda: MenuCRUD._guardar_lote_menus(db, lote))
+                    resultados['exitosos'] += guardadas
+                    resultados['errores'] += len(errores)
+
+                    for fila_num, error in errores:
+                        if salida_errores is None:
+                            salida_errores = open(archivo_errores, 'w', encoding='utf-8', newline='')
+                            escritor_errores = csv.writer(salida_errores)
+                            escritor_errores.writerow(['fila', 'error'])
+                        escritor_errores.writerow([fila_num, error])
+                        if len(resultados['mensajes']) < MAX_MENSAJES_IMPORTACION:
+                            resultados['mensajes'].append(f"Fila {fila_num}: Error - {error}")
+
+                    if al_avanzar is not None:
+                        duracion = time.perf_counter() - inicio
+                        procesadas = resultados['exitosos'] + resultados['errores']
+                        resultados['filas_por_segundo'] = procesadas / duracion if duracion > 0 else 0.0
+                        if al_avanzar({**resultados, 'mensajes': list(resultados['mensajes'])}) is False:
+                            resultados['cancelado'] = True
+                            break
+                    lote = list(islice(filas, tamano_lote))
+
+        except FileNotFoundError:
+            raise Exception(f"Archivo no encontrado: {archivo}")
+        except Exception as e:
+            db.rollback()
+            raise Exception(f"Error al importar menús: {str(e)}")
+        finally:
+            if salida_errores is not None:
+                salida_errores.close()
+
+        duracion = time.perf_counter() - inicio
+        procesadas = resultados['exitosos'] + resultados['errores']
+        resultados['filas_por_segundo'] = procesadas / duracion if duracion > 0 else float(procesadas)
+        if salida_errores is not None:
+            resultados['archivo_errores'] = archivo_errores
+            if resultados['errores'] > MAX_MENSAJES_IMPORTACION:
+                resultados['mensajes'].append(
+                    f"... {resultados['errores'] - MAX_MENSAJES_IMPORTACION} errores más en {archivo_errores}"
+                )
+        resultados['mensajes'].append(
+            f"{procesadas} filas procesadas ({resultados['filas_por_segundo']:.0f} filas/s)"
+            + (", importación cancelada" if resultados['cancelado'] else "")
+        )
+        return resultados
+
+    @staticmethod
+    def exportar_a_archivo(db: Session, archivo: str, tamano_lote: int = TAMANO_LOTE_MENUS) -> int:
+        """Exporta el catálogo con sus recetas a CSV o JSON lines, en el formato que lee la importación.
+
+        Menús y recetas salen de una sola consulta ordenada por menú que se lee de a
+        `tamano_lote` filas, así que la memoria no depende del tamaño del catálogo.
+        Retorna la cantidad de menús exportados.
+        """
+        consulta = (
+            select(Menu.id, Menu.nombre, Menu.descripcion, Menu.precio, Menu.categoria, Menu.disponible,
+                   Ingrediente.nombre, RecetaIngrediente.cantidad)
+            .outerjoin(RecetaIngrediente, RecetaIngrediente.menu_id == Menu.id)
+            .outerjoin(Ingrediente, Ingrediente.id == RecetaIngrediente.ingrediente_id)
+            .order_by(Menu.id)
+            .execution_options(yield_per=tamano_lote)
+        )
+        columnas = ["nombre", "descripcion", "precio", "categoria", "disponible", "receta"]
+        json_lines = MenuCRUD._es_json_lines(archivo)
+        total = 0
+        try:
+            with open(archivo, 'w', encoding='utf-8', newline='') as salida:
+                escritor = None if json_lines else csv.writer(salida, delimiter=';')
+                if escritor is not None:
+                    escritor.writerow(columnas)
+                for _, filas in groupby(db.execute(consulta), key=lambda fila: fila[0]):
+                    filas = list(filas)
+                    _, nombre, descripcion, precio, categoria, disponible = filas[0][:6]
+                    receta = {ingrediente: cantidad for *_, ingrediente, cantidad in filas if ingrediente}
+                    if json_lines:
+                        salida.write(json.dumps(
+                            dict(zip(columnas, (nombre, descripcion, precio, categoria, disponible, receta))),
+                            ensure_ascii=False
+                        ) + "\n")
+                    else:
+                        escritor.writerow([nombre, descripcion or "", precio, categoria or "", disponible,
+                                           json.dumps(receta, ensure_ascii=False) if receta else ""])
+                    total += 1
+        except (SQLAlchemyError, OSError) as e:
+            raise Exception(f"Error al exportar menús: {str(e)}")
+        return total
+
     @staticmethod
     def obtener_menu_por_id(db: Session, menu_id: int) -> Optional[Menu]:
         try:
-            return db.query(Menu).filter(Menu.id == menu_id).first()
+            return cache_lecturas.leer(db, ("Menus", "id", menu_id),
+                                       lambda: db.query(Menu).filter(Menu.id == menu_id).first())
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener menú: {str(e)}")
     
@@ -82,10 +678,45 @@ class MenuCRUD:
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener menús: {str(e)}")
     
+    # Columnas por las que se puede ordenar el listado paginado
+    COLUMNAS_ORDEN = {
+        "id": Menu.id,
+        "nombre": Menu.nombre,
+        "precio": Menu.precio,
+        "categoria": func.coalesce(Menu.categoria, ""),
+        "disponible": Menu.disponible,
+    }
+
+    @staticmethod
+    def listar_menus(db: Session, limite: int = 100, despues_de: tuple = None,
+                     orden: str = "id", descendente: bool = False) -> Pagina:
+        """Lista menús de a `limite` como filas (id, nombre, precio, categoria, disponible) con cursor."""
+        try:
+            return paginar(db, MenuCRUD._consulta_listado(), MenuCRUD.COLUMNAS_ORDEN, Menu.id,
+                           limite, despues_de, orden, descendente, Menu.actualizado_en)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al listar menús: {str(e)}")
+
+    @staticmethod
+    def cambios_menus(db: Session, desde: float, ids: List[int], orden: str = "id",
+                      limite: int = LIMITE_CAMBIOS) -> Cambios:
+        """Menús modificados desde la marca `desde` y cuáles de `ids` fueron eliminados."""
+        try:
+            return cambios_desde(db, MenuCRUD._consulta_listado(), MenuCRUD.COLUMNAS_ORDEN, Menu.id,
+                                 Menu.actualizado_en, desde, ids, orden, limite)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al buscar cambios en menús: {str(e)}")
+
+    @staticmethod
+    def _consulta_listado():
+        return select(Menu.id, Menu.nombre, Menu.precio, func.coalesce(Menu.categoria, ""), Menu.disponible,
+                      Menu.agotado)
+    
     @staticmethod
     def obtener_menus_disponibles(db: Session) -> List[Menu]:
         try:
-            return db.query(Menu).filter(Menu.disponible == 1).all()
+            # Se ofrecen los menús habilitados a mano y con stock para al menos una porción
+            return db.query(Menu).filter(Menu.disponible == 1, Menu.agotado == 0).all()
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener menús disponibles: {str(e)}")
     
@@ -97,10 +728,12 @@ class MenuCRUD:
             raise Exception(f"Error al obtener menús por categoría: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def actualizar_menu(db: Session, menu_id: int, nombre: str = None, 
                        descripcion: str = None, precio: float = None,
                        categoria: str = None, disponible: bool = None,
-                       receta: Dict[str, float] = None) -> Optional[Menu]:
+                       receta: Dict[str, float] = None,
+                       subrecetas: Dict[str, float] = None) -> Optional[Menu]:
         try:
             menu = db.query(Menu).filter(Menu.id == menu_id).first()
             if not menu:
@@ -112,21 +745,35 @@ class MenuCRUD:
                 menu.descripcion = descripcion
             if precio is not None:
                 menu.precio = precio
+            cambia_categoria = categoria is not None and categoria != menu.categoria
             if categoria is not None:
                 menu.categoria = categoria
             if disponible is not None:
                 menu.disponible = 1 if disponible else 0
+            if cambia_categoria:
+                # Las ventas ya resumidas pasan a la categoría nueva
+                db.flush()
+                VentasDiariasCRUD.actualizar_categorias(db, [menu.id])
             if receta is not None:
-                menu.receta = receta
+                # Un dict vacío deja el menú sin receta
+                resueltos = MenuCRUD._resolver_receta(db, receta, verificar_stock=False) if receta else []
+                MenuCRUD._asignar_receta(menu, resueltos)
+            if subrecetas is not None:
+                componentes = MenuCRUD._resolver_subrecetas(db, subrecetas) if subrecetas else []
+                MenuCRUD._asignar_subrecetas(menu, componentes)
+            if receta is not None or subrecetas is not None:
+                # Aplana este menú y los que lo usan; la receta nueva puede necesitar más de lo que hay en stock
+                MenuCRUD.actualizar_recetas_planas(db, [menu.id])
             
             db.commit()
             db.refresh(menu)
             return menu
-        except SQLAlchemyError as e:
+        except (SQLAlchemyError, ValueError) as e:
             db.rollback()
             raise Exception(f"Error al actualizar menú: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def cambiar_disponibilidad(db: Session, menu_id: int, disponible: bool) -> Optional[Menu]:
         try:
             menu = db.query(Menu).filter(Menu.id == menu_id).first()
@@ -142,15 +789,44 @@ class MenuCRUD:
             raise Exception(f"Error al cambiar disponibilidad: {str(e)}")
     
     @staticmethod
+    def _recalcular_totales_pedidos(db: Session, pedido_ids: List[int]) -> None:
+        """Recalcula total y cantidad de items guardados de los pedidos indicados desde sus items."""
+        # Import local: pedido_crud importa este módulo
+        from crud.pedido_crud import PedidoCRUD
+        for inicio in range(0, len(pedido_ids), TAMANO_LOTE_IDS):
+            lote = pedido_ids[inicio:inicio + TAMANO_LOTE_IDS]
+            db.execute(PedidoCRUD.sentencia_recalcular_totales().where(Pedido.__table__.c.id.in_(lote)))
+
+    @staticmethod
+    @reintentar_si_ocupado
     def eliminar_menu(db: Session, menu_id: int) -> bool:
         try:
             menu = db.query(Menu).filter(Menu.id == menu_id).first()
             if not menu:
                 return False
             
+            # No eliminar menús que forman parte de la receta de otros
+            usado_en = [
+                nombre for (nombre,) in db.query(Menu.nombre)
+                .join(RecetaSubreceta, RecetaSubreceta.menu_id == Menu.id)
+                .filter(RecetaSubreceta.subreceta_id == menu_id)
+                .order_by(Menu.nombre)
+            ]
+            if usado_en:
+                raise ValueError(f"El menú '{menu.nombre}' se usa como subreceta en: {', '.join(usado_en)}")
+
+            # Pedidos que pierden items: sus totales guardados se recalculan después
+            pedido_ids = [pedido_id for (pedido_id,) in db.query(ItemPedido.pedido_id)
+                          .filter(ItemPedido.menu_id == menu_id).distinct()]
+
+            # Los items y las filas de receta que lo referencian se eliminan por cascade
+            VentasDiariasCRUD.descontar_items(db, ItemPedido.menu_id == menu_id)
+            db.execute(delete(RecetaPlana.__table__).where(RecetaPlana.__table__.c.menu_id == menu_id))
             db.delete(menu)
+            db.flush()
+            MenuCRUD._recalcular_totales_pedidos(db, pedido_ids)
             db.commit()
             return True
-        except SQLAlchemyError as e:
+        except (SQLAlchemyError, ValueError) as e:
             db.rollback()
             raise Exception(f"Error al eliminar menú: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,124 @@
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Máximo de filas modificadas que se aplican como diferencias; con más conviene recargar
+LIMITE_CAMBIOS = 1000
+# Ids por consulta al verificar qué filas mostradas siguen existiendo
+TAMANO_LOTE_IDS = 500
+
+
+class Pagina(NamedTuple):
+    """Página de filas y cursor (valor de orden, id) para pedir la siguiente, o None si no hay más.
+
+    `claves` tiene el (valor de orden, id) de cada fila. En la primera página,
+    `marca` es el mayor `actualizado_en` de la tabla: desde ahí se piden cambios.
+    """
+    filas: List[tuple]
+    siguiente: Optional[Tuple[Any, int]]
+    claves: List[Tuple[Any, int]] = []
+    marca: Optional[float] = None
+
+
+class Cambios(NamedTuple):
+    """Filas modificadas desde una marca, ids eliminados y la marca nueva.
+
+    Si `desbordado` es True hubo más de `limite` filas modificadas y `filas`
+    viene incompleta: conviene recargar desde la primera página.
+    """
+    filas: List[tuple]
+    claves: List[Tuple[Any, int]]
+    eliminados: List[int]
+    marca: Optional[float]
+    desbordado: bool = False
+
+
+def _ordenar(consulta, columna, columna_id, descendente: bool):
+    if descendente:
+        return consulta.order_by(columna.desc(), columna_id.desc())
+    return consulta.order_by(columna.asc(), columna_id.asc())
+
+
+def _marca_actual(db: Session, columna_actualizado) -> Optional[float]:
+    """Mayor `actualizado_en` de la tabla; usa el índice, no recorre la tabla."""
+    return db.scalar(select(func.max(columna_actualizado)))
+
+
+def paginar(db: Session, consulta, columnas_orden: Dict[str, Any], columna_id,
+            limite: int, despues_de: Optional[Tuple[Any, int]] = None,
+            orden: str = "id", descendente: bool = False,
+            columna_actualizado=None) -> Pagina:
+    """Ejecuta `consulta` de a `limite` filas con paginación por cursor (keyset).
+
+    Ordena por la columna `orden` (una clave de `columnas_orden`) y desempata por
+    `columna_id`, así el cursor (valor, id) de la última fila identifica la posición
+    sin OFFSET: cada página cuesta lo mismo sin importar cuántas filas haya antes.
+    Las columnas que admiten NULL deben venir envueltas en coalesce, porque una
+    comparación con NULL dejaría filas fuera.
+    """
+    if limite <= 0:
+        raise ValueError("El límite debe ser mayor que cero")
+    if orden not in columnas_orden:
+        raise ValueError(f"No se puede ordenar por '{orden}'")
+
+    columna = columnas_orden[orden]
+    consulta = _ordenar(consulta, columna, columna_id, descendente)
+    if despues_de is not None:
+        posicion = tuple_(columna, columna_id)
+        cursor = tuple_(*despues_de)
+        consulta = consulta.where(posicion < cursor if descendente else posicion > cursor)
+
+    # En la primera página la marca viaja en la misma consulta (subconsulta sin correlación,
+    # SQLite la evalúa una vez); se lee en la misma instantánea que las filas
+    con_marca = columna_actualizado is not None and despues_de is None
+    if con_marca:
+        consulta = consulta.add_columns(select(func.max(columna_actualizado)).scalar_subquery())
+
+    # Se agregan el valor de orden y el id al final para armar el cursor
+    consulta = consulta.add_columns(columna, columna_id).limit(limite + 1)  # Una fila extra indica si hay otra página
+    filas = db.execute(consulta).all()
+    marca = filas[0][-3] if con_marca and filas else None
+    if con_marca:
+        filas = [fila[:-3] + fila[-2:] for fila in filas]
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = tuple(filas[-1][-2:])
+    return Pagina([tuple(fila[:-2]) for fila in filas], siguiente,
+                  [tuple(fila[-2:]) for fila in filas], marca)
+
+
+def cambios_desde(db: Session, consulta, columnas_orden: Dict[str, Any], columna_id,
+                  columna_actualizado, desde: float, ids: Iterable[int],
+                  orden: str = "id", limite: int = LIMITE_CAMBIOS) -> Cambios:
+    """Filas de `consulta` modificadas desde la marca `desde` y cuáles de `ids` ya no existen.
+
+    Los cambios se buscan con `actualizado_en >= desde` sobre su índice: el costo
+    depende de cuántas filas cambiaron, no del tamaño de la tabla. Las filas
+    eliminadas no dejan marca, por eso se comprueban solo los `ids` mostrados.
+    """
+    if orden not in columnas_orden:
+        raise ValueError(f"No se puede ordenar por '{orden}'")
+
+    marca = _marca_actual(db, columna_actualizado)
+    columna = columnas_orden[orden]
+    filas = db.execute(
+        consulta.where(columna_actualizado >= desde)
+        .add_columns(columna, columna_id)
+        .limit(limite + 1)
+    ).all()
+    desbordado = len(filas) > limite
+
+    ids = list(ids)
+    existentes = set()
+    for inicio in range(0, len(ids), TAMANO_LOTE_IDS):
+        lote = ids[inicio:inicio + TAMANO_LOTE_IDS]
+        existentes.update(db.scalars(select(columna_id).where(columna_id.in_(lote))))
+
+    return Cambios(
+        [tuple(fila[:-2]) for fila in filas[:limite]],
+        [tuple(fila[-2:]) for fila in filas[:limite]],
+        [fila_id for fila_id in ids if fila_id not in existentes],
+        marca, desbordado
+    )
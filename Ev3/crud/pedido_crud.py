@@ -1,12 +1,42 @@
+from sqlalchemy import insert, update, select, func, bindparam
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from models import Pedido, ItemPedido, Cliente, Menu, Ingrediente
-from typing import List, Optional, Dict
+from database import reintentar_si_ocupado
+from models import Pedido, ItemPedido, Cliente, Menu, Ingrediente, RecetaPlana
+from crud.ventas_crud import VentasDiariasCRUD
+from crud.cliente_crud import ClienteCRUD
+from crud.menu_crud import MenuCRUD
+from crud.paginacion import Cambios, cambios_desde, paginar, LIMITE_CAMBIOS
+from datetime import date, datetime
+from typing import List, Optional, Dict, NamedTuple, Tuple
+
+
+class FilaPedido(NamedTuple):
+    """Fila liviana para listar pedidos: solo las columnas que se muestran."""
+    id: int
+    cliente: str
+    fecha: datetime
+    estado: str
+    total: float
+    cantidad_items: int
+
+
+class PaginaPedidos(NamedTuple):
+    """Página de pedidos y cursor (valor de orden, id) para pedir la siguiente, o None si no hay más.
+
+    `claves` y `marca` tienen el mismo significado que en crud.paginacion.Pagina.
+    """
+    filas: List[FilaPedido]
+    siguiente: Optional[Tuple[datetime, int]]
+    claves: List[tuple] = []
+    marca: Optional[float] = None
+
 
 class PedidoCRUD:
     """Clase para operaciones CRUD de pedidos con gestión de items."""
     
     @staticmethod
+    @reintentar_si_ocupado
     def crear_pedido(db: Session, cliente_id: int, items: List[Dict]) -> Optional[Pedido]:
         """Crea un pedido completo con validación de cliente, menús y disponibilidad,
         descontando stock de los ingredientes según las recetas de cada menú.
@@ -16,7 +46,8 @@ class PedidoCRUD:
             if not cliente_id or cliente_id <= 0:
                 raise ValueError("Debe seleccionar un cliente válido")
             
-            cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+            # Se busca en cada pedido: pasa por la caché de lecturas
+            cliente = ClienteCRUD.obtener_cliente_por_id(db, cliente_id)
             if not cliente:
                 raise ValueError(f"Cliente con ID {cliente_id} no existe")
             
@@ -28,7 +59,30 @@ class PedidoCRUD:
             # 3) Calcular consumo total de ingredientes
             #    según recetas y cantidades pedidas
             # ----------------------------------------------------
-            consumo_ingredientes = {}  # {nombre_ingrediente: cantidad_total}
+            consumo_ingredientes = {}  # {id_ingrediente: cantidad_total}
+            total_pedido = 0.0
+            cantidad_items = 0
+
+            # Cargar todos los menús del pedido con una sola consulta IN (...)
+            ids_menus = {item_data.get("menu_id") for item_data in items if item_data.get("menu_id")}
+            menus = {
+                menu.id: menu
+                for menu in db.query(Menu).filter(Menu.id.in_(ids_menus)).all()
+            } if ids_menus else {}
+
+            # Recetas ya aplanadas (subrecetas incluidas) junto con sus ingredientes (un solo JOIN)
+            recetas = {}  # {menu_id: [(ingrediente, cantidad_por_menu)]}
+            ingredientes = {}  # {id_ingrediente: Ingrediente}
+            if ids_menus:
+                filas = (
+                    db.query(RecetaPlana.menu_id, RecetaPlana.cantidad, Ingrediente)
+                    .join(Ingrediente, Ingrediente.id == RecetaPlana.ingrediente_id)
+                    .filter(RecetaPlana.menu_id.in_(ids_menus))
+                    .all()
+                )
+                for menu_id, cant_por_menu, ingrediente in filas:
+                    recetas.setdefault(menu_id, []).append((ingrediente, cant_por_menu))
+                    ingredientes[ingrediente.id] = ingrediente
 
             for item_data in items:
                 menu_id = item_data.get("menu_id")
@@ -39,79 +93,84 @@ class PedidoCRUD:
                 if cantidad <= 0:
                     raise ValueError("La cantidad debe ser mayor que cero")
                 
-                # Obtener menú y validar
-                menu = db.query(Menu).filter(Menu.id == menu_id).first()
+                # Validar menú ya cargado
+                menu = menus.get(menu_id)
                 if not menu:
                     raise ValueError(f"Menú con ID {menu_id} no existe")
                 if not menu.disponible:
                     raise ValueError(f"El menú '{menu.nombre}' no está disponible")
-                
-                # Acumular uso de ingredientes según receta
-                if menu.receta:
-                    for ing_nombre, cant_por_menu in menu.receta.items():
-                        try:
-                            cant_por_menu = float(cant_por_menu)
-                        except (TypeError, ValueError):
-                            raise ValueError(
-                                f"Cantidad inválida en la receta del ingrediente '{ing_nombre}' "
-                                f"del menú '{menu.nombre}'"
-                            )
-                        if cant_por_menu <= 0:
-                            raise ValueError(
-                                f"La cantidad del ingrediente '{ing_nombre}' en el menú "
-                                f"'{menu.nombre}' debe ser mayor que cero"
-                            )
-                        
-                        consumo_total = cant_por_menu * cantidad
-                        consumo_ingredientes[ing_nombre] = (
-                            consumo_ingredientes.get(ing_nombre, 0.0) + consumo_total
-                        )
+
+                # Acumular totales que se guardan en el pedido
+                total_pedido += menu.precio * cantidad
+                cantidad_items += cantidad
+
+                # Acumular uso de ingredientes según receta (cantidades ya
+                # validadas al guardar el menú)
+                for ingrediente, cant_por_menu in recetas.get(menu_id, []):
+                    consumo_ingredientes[ingrediente.id] = (
+                        consumo_ingredientes.get(ingrediente.id, 0.0) + cant_por_menu * cantidad
+                    )
+
+                if menu.agotado:
+                    # Marcado sin stock: se rechaza ya, con el mismo mensaje de la verificación completa
+                    for ingrediente, _ in recetas.get(menu_id, []):
+                        if ingrediente.stock < consumo_ingredientes[ingrediente.id]:
+                            raise PedidoCRUD._stock_insuficiente(ingrediente, consumo_ingredientes[ingrediente.id])
 
             # ----------------------------------------------------
             # 4) Verificar stock suficiente para TODOS los ingredientes
+            #    (cargados junto con las recetas)
             # ----------------------------------------------------
-            for nombre_ing, consumo_total in consumo_ingredientes.items():
-                ingrediente = db.query(Ingrediente).filter(
-                    Ingrediente.nombre == nombre_ing
-                ).first()
-                if not ingrediente:
-                    raise ValueError(
-                        f"El ingrediente '{nombre_ing}' no existe en la base de datos"
-                    )
+            for id_ing, consumo_total in consumo_ingredientes.items():
+                ingrediente = ingredientes[id_ing]
                 if ingrediente.stock < consumo_total:
-                    raise ValueError(
-                        f"Stock insuficiente para '{nombre_ing}'. "
-                        f"Disponible: {ingrediente.stock} {ingrediente.unidad}, "
-                        f"Requerido para este pedido: {consumo_total} {ingrediente.unidad}"
-                    )
+                    raise PedidoCRUD._stock_insuficiente(ingrediente, consumo_total)
 
             # ----------------------------------------------------
             # 5) Crear pedido e items (ya sabemos que hay stock)
             # ----------------------------------------------------
-            nuevo_pedido = Pedido(cliente_id=cliente_id)
+            nuevo_pedido = Pedido(
+                cliente_id=cliente_id,
+                fecha=datetime.now(),
+                total=total_pedido,
+                cantidad_items=cantidad_items
+            )
             db.add(nuevo_pedido)
             db.flush()  # obtener ID del pedido
             
-            for item_data in items:
-                menu_id = item_data.get("menu_id")
-                cantidad = item_data.get("cantidad", 1)
+            # Inserción de todos los items en una sola ejecución (executemany)
+            db.execute(insert(ItemPedido.__table__), [
+                {
+                    "pedido_id": nuevo_pedido.id,
+                    "menu_id": item_data.get("menu_id"),
+                    "cantidad": item_data.get("cantidad", 1),
+                    "precio_unitario": menus[item_data.get("menu_id")].precio
+                }
+                for item_data in items
+            ])
 
-                item_pedido = ItemPedido(
-                    pedido_id=nuevo_pedido.id,
-                    menu_id=menu_id,
-                    cantidad=cantidad
+            # Registrar las ventas en el resumen diario (misma transacción)
+            VentasDiariasCRUD.registrar(db, (
+                (
+                    nuevo_pedido.fecha,
+                    item_data.get("menu_id"),
+                    menus[item_data.get("menu_id")].categoria,
+                    item_data.get("cantidad", 1),
+                    menus[item_data.get("menu_id")].precio * item_data.get("cantidad", 1)
                 )
-                db.add(item_pedido)
+                for item_data in items
+            ))
 
             # ----------------------------------------------------
-            # 6) Descontar stock de ingredientes
+            # 6) Descontar stock de ingredientes con un único UPDATE
+            #    condicionado (executemany); la condición stock >= consumo
+            #    protege contra otra terminal que haya consumido el stock
+            #    entre la verificación y la escritura
             # ----------------------------------------------------
-            for nombre_ing, consumo_total in consumo_ingredientes.items():
-                ingrediente = db.query(Ingrediente).filter(
-                    Ingrediente.nombre == nombre_ing
-                ).first()
-                # Aquí ya sabemos que existe y tiene stock suficiente
-                ingrediente.stock -= consumo_total
+            if consumo_ingredientes:
+                PedidoCRUD._descontar_stock(db, ingredientes, consumo_ingredientes)
+                # Solo se revisan los menús que usan los ingredientes descontados
+                MenuCRUD.actualizar_agotados(db, list(consumo_ingredientes))
 
             # 7) Confirmar todo
             db.commit()
@@ -122,6 +181,94 @@ class PedidoCRUD:
             db.rollback()
             raise Exception(f"Error al crear pedido: {str(e)}")
     
+    @staticmethod
+    def _stock_insuficiente(ingrediente: Ingrediente, requerido: float) -> ValueError:
+        """Error de stock insuficiente con el mensaje de siempre."""
+        return ValueError(
+            f"Stock insuficiente para '{ingrediente.nombre}'. "
+            f"Disponible: {ingrediente.stock} {ingrediente.unidad}, "
+            f"Requerido para este pedido: {requerido} {ingrediente.unidad}"
+        )
+
+    @staticmethod
+    def _descontar_stock(db: Session, ingredientes: Dict[int, Ingrediente],
+                         consumo_ingredientes: Dict[int, float]) -> None:
+        """Descuenta el consumo de cada ingrediente en una sola ejecución,
+        fallando si algún ingrediente ya no tiene stock suficiente.
+        """
+        tabla = Ingrediente.__table__
+        sentencia = (
+            update(tabla)
+            .where(tabla.c.id == bindparam("b_id"), tabla.c.stock >= bindparam("b_consumo"))
+            .values(stock=tabla.c.stock - bindparam("b_consumo"))
+        )
+        parametros = [
+            {"b_id": id_ing, "b_consumo": consumo}
+            for id_ing, consumo in consumo_ingredientes.items()
+        ]
+        resultado = db.execute(sentencia, parametros)
+
+        if resultado.rowcount != len(parametros):
+            # Otra transacción consumió el stock: releer para informar igual que la verificación
+            for id_ing, consumo_total in consumo_ingredientes.items():
+                ingrediente = ingredientes[id_ing]
+                db.refresh(ingrediente)
+                if ingrediente.stock < consumo_total:
+                    raise PedidoCRUD._stock_insuficiente(ingrediente, consumo_total)
+            raise ValueError("Stock insuficiente para completar el pedido")
+
+    @staticmethod
+    def _ajustar_totales(db: Session, pedido: Pedido, menu: Optional[Menu],
+                         delta_total: float, delta_cantidad: int) -> None:
+        """Suma las diferencias al total y a la cantidad de items guardados en el pedido
+        y al resumen diario de ventas.
+        """
+        pedidos = Pedido.__table__
+        db.execute(
+            update(pedidos)
+            .where(pedidos.c.id == pedido.id)
+            .values(
+                total=pedidos.c.total + delta_total,
+                cantidad_items=pedidos.c.cantidad_items + delta_cantidad
+            )
+        )
+        if menu is not None:
+            VentasDiariasCRUD.registrar(db, [
+                (pedido.fecha, menu.id, menu.categoria, delta_cantidad, delta_total)
+            ])
+
+    @staticmethod
+    def sentencia_recalcular_totales():
+        """Construye el UPDATE que recalcula total y cantidad de items de todos los pedidos."""
+        pedidos = Pedido.__table__
+        items = ItemPedido.__table__
+        total = (
+            select(func.coalesce(func.sum(items.c.cantidad * items.c.precio_unitario), 0.0))
+            .where(items.c.pedido_id == pedidos.c.id)
+            .scalar_subquery()
+        )
+        cantidad = (
+            select(func.coalesce(func.sum(items.c.cantidad), 0))
+            .where(items.c.pedido_id == pedidos.c.id)
+            .scalar_subquery()
+        )
+        return update(pedidos).values(total=total, cantidad_items=cantidad)
+
+    @staticmethod
+    @reintentar_si_ocupado
+    def recalcular_totales(db: Session) -> int:
+        """Rellena total y cantidad de items de los pedidos existentes a partir de sus items.
+        
+        Retorna la cantidad de pedidos actualizados.
+        """
+        try:
+            resultado = db.execute(PedidoCRUD.sentencia_recalcular_totales())
+            db.commit()
+            return resultado.rowcount
+        except SQLAlchemyError as e:
+            db.rollback()
+            raise Exception(f"Error al recalcular totales: {str(e)}")
+
     @staticmethod
     def obtener_pedido_por_id(db: Session, pedido_id: int) -> Optional[Pedido]:
         """Obtiene un pedido con todos sus items"""
@@ -138,6 +285,63 @@ class PedidoCRUD:
         except SQLAlchemyError as e:
             raise Exception(f"Error al obtener pedidos: {str(e)}")
     
+    # Columnas por las que se puede ordenar el listado paginado
+    COLUMNAS_ORDEN = {
+        "id": Pedido.id,
+        "cliente": Cliente.nombre,
+        "fecha": Pedido.fecha,
+        "total": Pedido.total,
+        "items": Pedido.cantidad_items,
+    }
+
+    @staticmethod
+    def listar_pedidos(db: Session, limite: int = 100,
+                       despues_de: Optional[Tuple[datetime, int]] = None,
+                       desde: Optional[date] = None, hasta: Optional[date] = None,
+                       cliente_id: Optional[int] = None,
+                       estado: Optional[str] = None,
+                       orden: str = "fecha", descendente: bool = True) -> PaginaPedidos:
+        """Lista pedidos de a `limite` por página, por defecto del más reciente al más antiguo.
+        
+        Usa paginación por cursor sobre (columna de orden, id): `despues_de` es el
+        cursor `siguiente` de la página anterior, así cada página cuesta lo mismo
+        sin importar cuántos pedidos haya antes. Cada página es una sola consulta.
+        """
+        try:
+            consulta = PedidoCRUD._consulta_listado().where(
+                *VentasDiariasCRUD.filtros_rango_fechas(Pedido.fecha, desde, hasta)
+            )
+            if cliente_id is not None:
+                consulta = consulta.where(Pedido.cliente_id == cliente_id)
+            if estado is not None:
+                consulta = consulta.where(Pedido.estado == estado)
+            
+            pagina = paginar(db, consulta, PedidoCRUD.COLUMNAS_ORDEN, Pedido.id,
+                             limite, despues_de, orden, descendente, Pedido.actualizado_en)
+            return PaginaPedidos([FilaPedido(*fila) for fila in pagina.filas], pagina.siguiente,
+                                 pagina.claves, pagina.marca)
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al listar pedidos: {str(e)}")
+
+    @staticmethod
+    def cambios_pedidos(db: Session, desde: float, ids: List[int], orden: str = "fecha",
+                        limite: int = LIMITE_CAMBIOS) -> Cambios:
+        """Pedidos modificados desde la marca `desde` y cuáles de `ids` fueron eliminados."""
+        try:
+            cambios = cambios_desde(db, PedidoCRUD._consulta_listado(), PedidoCRUD.COLUMNAS_ORDEN, Pedido.id,
+                                    Pedido.actualizado_en, desde, ids, orden, limite)
+            return cambios._replace(filas=[FilaPedido(*fila) for fila in cambios.filas])
+        except (SQLAlchemyError, ValueError) as e:
+            raise Exception(f"Error al buscar cambios en pedidos: {str(e)}")
+
+    @staticmethod
+    def _consulta_listado():
+        return (
+            select(Pedido.id, Cliente.nombre, Pedido.fecha, Pedido.estado,
+                   Pedido.total, Pedido.cantidad_items)
+            .join(Cliente, Cliente.id == Pedido.cliente_id)
+        )
+    
     @staticmethod
     def obtener_pedidos_por_cliente(db: Session, cliente_id: int) -> List[Pedido]:
         """Obtiene todos los pedidos de un cliente"""
@@ -147,6 +351,7 @@ class PedidoCRUD:
             raise Exception(f"Error al obtener pedidos del cliente: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def agregar_item(db: Session, pedido_id: int, menu_id: int, cantidad: int = 1) -> Optional[ItemPedido]:
         """Añade un elemento al pedido existente o actualiza cantidad si ya existe."""
         try:
@@ -169,7 +374,10 @@ class PedidoCRUD:
             ).first()
             
             if item_existente:
-                # Si existe, aumentar la cantidad
+                # Si existe, aumentar la cantidad al precio ya registrado en el item
+                PedidoCRUD._ajustar_totales(
+                    db, pedido, menu, item_existente.precio_unitario * cantidad, cantidad
+                )
                 item_existente.cantidad += cantidad
                 db.commit()
                 db.refresh(item_existente)
@@ -179,8 +387,10 @@ class PedidoCRUD:
                 nuevo_item = ItemPedido(
                     pedido_id=pedido_id,
                     menu_id=menu_id,
-                    cantidad=cantidad
+                    cantidad=cantidad,
+                    precio_unitario=menu.precio
                 )
+                PedidoCRUD._ajustar_totales(db, pedido, menu, menu.precio * cantidad, cantidad)
                 db.add(nuevo_item)
                 db.commit()
                 db.refresh(nuevo_item)
@@ -191,6 +401,7 @@ class PedidoCRUD:
             raise Exception(f"Error al agregar item: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def actualizar_cantidad_item(db: Session, item_id: int, nueva_cantidad: int) -> Optional[ItemPedido]:
         """Actualiza la cantidad de un item específico"""
         try:
@@ -201,6 +412,10 @@ class PedidoCRUD:
             if nueva_cantidad <= 0:
                 raise ValueError("La cantidad debe ser mayor a 0")
             
+            diferencia = nueva_cantidad - item.cantidad
+            PedidoCRUD._ajustar_totales(
+                db, item.pedido, item.menu, item.precio_unitario * diferencia, diferencia
+            )
             item.cantidad = nueva_cantidad
             db.commit()
             db.refresh(item)
@@ -211,6 +426,7 @@ class PedidoCRUD:
             raise Exception(f"Error al actualizar cantidad: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def eliminar_item(db: Session, item_id: int) -> bool:
         """Elimina un item específico de un pedido"""
         try:
@@ -218,6 +434,7 @@ class PedidoCRUD:
             if not item:
                 return False
             
+            PedidoCRUD._ajustar_totales(db, item.pedido, item.menu, -item.subtotal, -item.cantidad)
             db.delete(item)
             db.commit()
             return True
@@ -227,6 +444,7 @@ class PedidoCRUD:
             raise Exception(f"Error al eliminar item: {str(e)}")
     
     @staticmethod
+    @reintentar_si_ocupado
     def eliminar_pedido(db: Session, pedido_id: int) -> bool:
         """Elimina un pedido completo con todos sus items"""
         try:
@@ -235,6 +453,7 @@ class PedidoCRUD:
                 return False
             
             # Los items se eliminan automáticamente por cascade
+            VentasDiariasCRUD.descontar_items(db, ItemPedido.pedido_id == pedido_id)
             db.delete(pedido)
             db.commit()
             return True
@@ -251,7 +470,7 @@ class PedidoCRUD:
             if not pedido:
                 return 0.0
             
-            return pedido.total  # Usa la propiedad del modelo
+            return pedido.total  # Total guardado en el pedido
             
         except SQLAlchemyError as e:
             raise Exception(f"Error al calcular total: {str(e)}")
\ No newline at end of file
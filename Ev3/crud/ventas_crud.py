@@ -0,0 +1,142 @@
+from sqlalchemy import select, delete, insert, update, func, Date
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from database import reintentar_si_ocupado
+from models import VentaDiaria, Pedido, ItemPedido, Menu
+from crud.paginacion import TAMANO_LOTE_IDS
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Tuple, Optional
+
+# Movimiento del resumen: (fecha, menu_id, categoria, cantidad, total)
+Movimiento = Tuple[date, int, Optional[str], int, float]
+
+class VentasDiariasCRUD:
+    """Clase para mantener el resumen diario de ventas usado por los gráficos.
+
+    Los métodos de registro no confirman la transacción: se llaman desde las
+    operaciones de pedidos para que el resumen cambie junto con ellas.
+    """
+
+    @staticmethod
+    def filtros_rango_fechas(columna_fecha, desde: Optional[date] = None,
+                             hasta: Optional[date] = None) -> list:
+        """Condiciones para limitar una consulta a un rango de fechas inclusivo.
+        
+        Si `hasta` es una fecha sin hora se incluye el día completo.
+        """
+        filtros = [columna_fecha.isnot(None)]
+        if isinstance(columna_fecha.type, Date):
+            # Columnas de solo fecha: comparar contra días completos
+            if isinstance(desde, datetime):
+                desde = desde.date()
+            if isinstance(hasta, datetime):
+                hasta = hasta.date()
+            if desde is not None:
+                filtros.append(columna_fecha >= desde)
+            if hasta is not None:
+                filtros.append(columna_fecha <= hasta)
+            return filtros
+        if desde is not None:
+            filtros.append(columna_fecha >= desde)
+        if hasta is not None:
+            if isinstance(hasta, datetime):
+                filtros.append(columna_fecha <= hasta)
+            else:
+                filtros.append(columna_fecha < hasta + timedelta(days=1))
+        return filtros
+
+    @staticmethod
+    def registrar(db: Session, movimientos: Iterable[Movimiento]) -> None:
+        """Suma (o resta, con valores negativos) movimientos al resumen con un solo upsert."""
+        acumulado = {}
+        for fecha, menu_id, categoria, cantidad, total in movimientos:
+            if isinstance(fecha, datetime):
+                fecha = fecha.date()
+            clave = (fecha, menu_id)
+            anterior = acumulado.get(clave)
+            if anterior:
+                cantidad += anterior["cantidad"]
+                total += anterior["total"]
+            acumulado[clave] = {
+                "fecha": fecha, "menu_id": menu_id, "categoria": categoria,
+                "cantidad": cantidad, "total": total
+            }
+        if not acumulado:
+            return
+
+        sentencia = sqlite_insert(VentaDiaria.__table__)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=["fecha", "menu_id"],
+            set_={
+                "cantidad": VentaDiaria.__table__.c.cantidad + sentencia.excluded.cantidad,
+                "total": VentaDiaria.__table__.c.total + sentencia.excluded.total,
+                # El movimiento trae la categoría actual del menú
+                "categoria": func.coalesce(sentencia.excluded.categoria, VentaDiaria.__table__.c.categoria),
+            }
+        )
+        db.execute(sentencia, list(acumulado.values()))
+
+    @staticmethod
+    def actualizar_categorias(db: Session, menu_ids: List[int]) -> None:
+        """Copia la categoría actual de los menús indicados a todos sus días del resumen.
+
+        Se llama al modificar menús, sin confirmar, para que los gráficos por
+        categoría no mezclen la categoría antigua con la nueva.
+        """
+        tabla = VentaDiaria.__table__
+        categoria_actual = select(Menu.categoria).where(Menu.id == tabla.c.menu_id).scalar_subquery()
+        for inicio in range(0, len(menu_ids), TAMANO_LOTE_IDS):
+            lote = menu_ids[inicio:inicio + TAMANO_LOTE_IDS]
+            db.execute(
+                update(tabla)
+                .where(tabla.c.menu_id.in_(lote), tabla.c.categoria.is_distinct_from(categoria_actual))
+                .values(categoria=categoria_actual)
+            )
+
+    @staticmethod
+    def _consulta_items(*condiciones):
+        """Agrupa items de pedidos por día y menú según las condiciones indicadas."""
+        dia = func.date(Pedido.fecha)
+        return (
+            select(
+                dia,
+                ItemPedido.menu_id,
+                Menu.categoria,
+                func.sum(ItemPedido.cantidad),
+                func.sum(ItemPedido.cantidad * ItemPedido.precio_unitario)
+            )
+            .select_from(ItemPedido)
+            .join(Pedido, Pedido.id == ItemPedido.pedido_id)
+            .outerjoin(Menu, Menu.id == ItemPedido.menu_id)
+            .where(Pedido.fecha.isnot(None), *condiciones)
+            .group_by(dia, ItemPedido.menu_id)
+        )
+
+    @staticmethod
+    def descontar_items(db: Session, *condiciones) -> None:
+        """Resta del resumen los items que cumplen las condiciones (antes de eliminarlos)."""
+        filas = db.execute(VentasDiariasCRUD._consulta_items(*condiciones)).all()
+        VentasDiariasCRUD.registrar(db, (
+            (date.fromisoformat(dia), menu_id, categoria, -cantidad, -total)
+            for dia, menu_id, categoria, cantidad, total in filas
+        ))
+
+    @staticmethod
+    @reintentar_si_ocupado
+    def reconstruir(db: Session) -> int:
+        """Vacía y regenera el resumen diario a partir del historial de pedidos.
+
+        Retorna la cantidad de filas del resumen.
+        """
+        try:
+            db.execute(delete(VentaDiaria.__table__))
+            db.execute(insert(VentaDiaria.__table__).from_select(
+                ["fecha", "menu_id", "categoria", "cantidad", "total"],
+                VentasDiariasCRUD._consulta_items()
+            ))
+            db.commit()
+            return db.query(func.count()).select_from(VentaDiaria).scalar()
+        except SQLAlchemyError as e:
+            db.rollback()
+            raise Exception(f"Error al reconstruir ventas diarias: {str(e)}")
@@ -1,25 +1,261 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import os
+import time
+import random
+import functools
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, sessionmaker, declarative_base, object_session
 
-# Configuración de la base de datos SQLite local
-DATABASE_URL = 'sqlite:///./proyecto.db'
+# Configuración de la base de datos: se puede cambiar con variables de entorno
+#   RESTAURANTE_DB_URL         URL de SQLAlchemy (por defecto la base SQLite local)
+#   RESTAURANTE_DB_PERFIL      perfil de PRAGMAs de SQLite (ver PERFILES_PRAGMAS)
+#   RESTAURANTE_DB_REINTENTOS  reintentos de escritura cuando la base está ocupada
+DATABASE_URL = os.environ.get("RESTAURANTE_DB_URL", 'sqlite:///./proyecto.db')
+PERFIL_PRAGMAS = os.environ.get("RESTAURANTE_DB_PERFIL", "concurrente")
+REINTENTOS_MAXIMOS = int(os.environ.get("RESTAURANTE_DB_REINTENTOS", "5"))
 
-# Crear el motor de base de datos con configuración para SQLite
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# PRAGMAs aplicados a cada conexión nueva de SQLite
+PERFILES_PRAGMAS = {
+    # Varias terminales escribiendo y lectores (gráficos) sin bloquearse entre sí
+    "concurrente": {
+        "journal_mode": "WAL",         # Lectores no bloquean al escritor y viceversa
+        "synchronous": "NORMAL",       # Seguro con WAL; evita un fsync por commit
+        "busy_timeout": 5000,          # ms de espera por el bloqueo antes de fallar
+        "cache_size": -20000,          # ~20 MB de caché de páginas (negativo = KiB)
+        "mmap_size": 268435456,        # 256 MB de lectura con memoria mapeada
+        "temp_store": "MEMORY",        # Tablas temporales y ordenamientos en memoria
+    },
+    # Configuración por defecto de SQLite (diario de reversión, sin ajustes)
+    "basico": {},
+}
+
+
+def _aplicar_pragmas(pragmas: dict):
+    """Crea el listener que ejecuta los PRAGMAs del perfil en cada conexión."""
+    def al_conectar(conexion_dbapi, registro_conexion):
+        cursor = conexion_dbapi.cursor()
+        try:
+            for nombre, valor in pragmas.items():
+                # PRAGMA no admite parámetros; los valores vienen de PERFILES_PRAGMAS
+                cursor.execute(f"PRAGMA {nombre} = {valor}")
+        finally:
+            cursor.close()
+    return al_conectar
+
+
+def crear_motor(url: str = None, perfil: str = None):
+    """Crea un motor de base de datos; en SQLite aplica el perfil de PRAGMAs indicado."""
+    url = url or DATABASE_URL
+    perfil = perfil or PERFIL_PRAGMAS
+
+    if not url.startswith("sqlite"):
+        return create_engine(url)
+
+    if perfil not in PERFILES_PRAGMAS:
+        raise ValueError(f"Perfil de PRAGMAs desconocido: '{perfil}'")
+
+    motor = create_engine(url, connect_args={"check_same_thread": False})
+    if PERFILES_PRAGMAS[perfil]:
+        event.listen(motor, "connect", _aplicar_pragmas(PERFILES_PRAGMAS[perfil]))
+    return motor
+
+
+def es_base_ocupada(error: BaseException) -> bool:
+    """Indica si el error (o alguno de los que lo originaron) es SQLITE_BUSY/SQLITE_LOCKED."""
+    vistos = set()
+    while error is not None and id(error) not in vistos:
+        vistos.add(id(error))
+        if isinstance(error, OperationalError):
+            original = error.orig
+            if getattr(original, "sqlite_errorcode", None) in (5, 6):  # SQLITE_BUSY, SQLITE_LOCKED
+                return True
+            if "database is locked" in str(original) or "database table is locked" in str(original):
+                return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _esperar_reintento(intento: int):
+    """Espera con backoff exponencial y algo de azar para que dos terminales no reintenten al mismo tiempo."""
+    time.sleep(0.05 * (2 ** intento) * random.uniform(0.5, 1.5))
+
+
+def reintentar_si_ocupado(funcion):
+    """Reintenta una operación de escritura si falló porque la base estaba ocupada.
+
+    Solo para operaciones de una sola transacción: hacen rollback antes de
+    propagar el error, así que repetirlas completas no duplica nada. Las
+    importaciones que confirman por lotes usan `confirmar_lote`. Dentro de una
+    unidad de trabajo no se reintenta: el rollback ya deshizo todo lo anterior.
+    """
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        db = args[0] if args and isinstance(args[0], Session) else kwargs.get("db")
+        intento = 0
+        while True:
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                if intento >= REINTENTOS_MAXIMOS or not es_base_ocupada(e) or en_unidad_de_trabajo(db):
+                    raise
+                _esperar_reintento(intento)
+                intento += 1
+    return envoltura
+
+
+def confirmar_lote(db: Session, escribir):
+    """Ejecuta `escribir()` y confirma, repitiendo solo este lote si la base estaba ocupada.
+
+    Los lotes anteriores ya quedaron confirmados: ante el error se deshace lo
+    escrito por este lote y se vuelve a llamar a `escribir`. Dentro de una
+    unidad de trabajo no se reintenta. Retorna lo que retorne `escribir`.
+    """
+    intento = 0
+    while True:
+        try:
+            resultado = escribir()
+            db.commit()
+            return resultado
+        except Exception as e:
+            if intento >= REINTENTOS_MAXIMOS or not es_base_ocupada(e) or en_unidad_de_trabajo(db):
+                raise
+            db.rollback()
+            _esperar_reintento(intento)
+            intento += 1
+
+
+class SesionRestaurante(Session):
+    """Sesión de la aplicación: dentro de `unidad_de_trabajo` los commit de los CRUD no confirman.
+
+    Ahí `commit()` solo escribe lo pendiente y expira los objetos, como haría un
+    commit, para que la operación siguiente lea valores actuales; `refresh()` de
+    un objeto recién expirado se omite porque se recarga al usarlo. Un
+    `rollback()` deshace la unidad completa y la marca como fallida.
+    """
+
+    def commit(self):
+        if en_unidad_de_trabajo(self):
+            self.flush()
+            self.expire_all()
+            return
+        super().commit()
+
+    def refresh(self, instance, *args, **kwargs):
+        if en_unidad_de_trabajo(self) and inspect(instance).expired:
+            return
+        super().refresh(instance, *args, **kwargs)
+
+    def rollback(self):
+        unidad = self.info.get("unidad_de_trabajo")
+        if unidad is not None:
+            unidad["fallida"] = True
+        super().rollback()
+
+
+def en_unidad_de_trabajo(db) -> bool:
+    """Indica si la sesión está dentro de `unidad_de_trabajo`."""
+    return db is not None and db.info.get("unidad_de_trabajo") is not None
+
+
+@contextmanager
+def unidad_de_trabajo(db: Session):
+    """Agrupa varias operaciones CRUD en una sola transacción.
+
+    Dentro del bloque los métodos CRUD no confirman ni recargan: todo se
+    confirma con un solo commit al salir. Si el bloque termina con una
+    excepción, o alguna operación falló e hizo rollback aunque el error se haya
+    capturado, se deshace todo. Una unidad dentro de otra se suma a la exterior.
+
+        with unidad_de_trabajo(db):
+            for datos in clientes:
+                ClienteCRUD.crear_cliente(db, **datos)
+    """
+    if not isinstance(db, SesionRestaurante):
+        raise TypeError("unidad_de_trabajo necesita una sesión creada con SessionLocal")
+    if en_unidad_de_trabajo(db):
+        yield db
+        return
+
+    unidad = db.info["unidad_de_trabajo"] = {"fallida": False}
+    try:
+        yield db
+    except BaseException:
+        del db.info["unidad_de_trabajo"]
+        db.rollback()
+        raise
+    del db.info["unidad_de_trabajo"]
+    if unidad["fallida"]:
+        db.rollback()
+        raise Exception("La unidad de trabajo se deshizo por un error en una de sus operaciones")
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+# Crear el motor de base de datos según la configuración
+engine = crear_motor()
 
 # Configurar fábrica de sesiones de base de datos
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=SesionRestaurante)
 
 # Clase base para todos los modelos ORM
 Base = declarative_base()
 
 
+# Tablas con contador de versión en VersionesTablas. Cada commit que escribe en
+# ellas incrementa su contador, así otras terminales detectan qué cambió
+# leyendo unas pocas filas en lugar de las tablas completas.
+TABLAS_VERSIONADAS = {"Clientes", "Ingredientes", "Menus", "Pedidos", "ItemPedidos", "RecetaIngredientes",
+                      "RecetaSubrecetas", "RecetasPlanas"}
+
+
+def registrar_cambio(session: Session, tabla: str):
+    """Anota que la transacción en curso de la sesión modificó la tabla."""
+    if session is not None and tabla in TABLAS_VERSIONADAS:
+        session.info.setdefault("tablas_modificadas", set()).add(tabla)
+
+
+def _al_escribir_fila(mapper, conexion, objeto):
+    registrar_cambio(object_session(objeto), mapper.local_table.name)
+
+
+for _evento in ("after_insert", "after_update", "after_delete"):
+    event.listen(Base, _evento, _al_escribir_fila, propagate=True)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _al_ejecutar_sentencia(estado):
+    # INSERT/UPDATE/DELETE masivos (p. ej. el upsert del CSV) no pasan por los eventos de fila
+    if estado.is_insert or estado.is_update or estado.is_delete:
+        tabla = getattr(estado.statement, "table", None)
+        if tabla is not None:
+            registrar_cambio(estado.session, tabla.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _incrementar_versiones(session):
+    session.flush()  # Lo pendiente se escribe ahora para que también quede anotado
+    tablas = session.info.pop("tablas_modificadas", None)
+    if tablas:
+        # Una sola sentencia para todas las tablas; viaja en la misma transacción
+        session.execute(text('''
+            INSERT INTO "VersionesTablas" (tabla, version) VALUES (:tabla, 1)
+            ON CONFLICT(tabla) DO UPDATE SET version = version + 1
+        '''), [{"tabla": tabla} for tabla in sorted(tablas)])
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_cambios(session):
+    session.info.pop("tablas_modificadas", None)
+
+
 def get_session():
     """Generador que proporciona sesiones de base de datos con manejo automático de cierre."""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
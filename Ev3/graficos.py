@@ -1,9 +1,11 @@
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+from sqlalchemy import func, cast, select, Integer, String
 from sqlalchemy.orm import Session
-from models import Pedido, ItemPedido, Menu, Ingrediente
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from models import Menu, VentaDiaria
+from crud.ventas_crud import VentasDiariasCRUD
+from consumo import MotorConsumo
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Tuple, Optional
 from functools import reduce
 
 class GraficosEstadisticos:
@@ -17,106 +19,91 @@ class GraficosEstadisticos:
         return True
     
     @staticmethod
-    def obtener_ventas_por_fecha(db: Session, periodo: str = "diario") -> Dict[str, float]:
+    def clave_periodo(columna_fecha, periodo: str):
+        """Construye la expresión SQL (funciones de fecha de SQLite) que agrupa
+        una columna de fecha según el periodo solicitado.
+        """
+        if periodo == "semanal":
+            # Semana ISO: el jueves de la semana determina su número
+            jueves = func.date(columna_fecha, "-3 days", "weekday 4")
+            semana = (cast(func.strftime("%j", jueves), Integer) - 1) // 7 + 1
+            return func.strftime("%Y", columna_fecha).concat("-S").concat(cast(semana, String))
+        elif periodo == "mensual":
+            return func.strftime("%Y-%m", columna_fecha)
+        elif periodo == "anual":
+            return func.strftime("%Y", columna_fecha)
+        # "diario" y cualquier periodo desconocido
+        return func.strftime("%Y-%m-%d", columna_fecha)
+    
+    @staticmethod
+    def obtener_ventas_por_fecha(db: Session, periodo: str = "diario",
+                                 desde: Optional[date] = None,
+                                 hasta: Optional[date] = None) -> Dict[str, float]:
         """Agrupa y suma las ventas por periodos de tiempo especificados.
         
         Soporta agrupación diaria, semanal, mensual y anual de las transacciones.
+        Lee el resumen diario (VentasDiarias), por lo que el costo depende de la
+        cantidad de días y no de pedidos; `desde` y `hasta` limitan el rango.
         """
         try:
-            # Obtener todos los pedidos de la base de datos
-            pedidos = db.query(Pedido).all()
-            
-            if not GraficosEstadisticos.validar_datos_disponibles(pedidos):
+            clave = GraficosEstadisticos.clave_periodo(VentaDiaria.fecha, periodo)
+            consulta = (
+                select(clave, func.sum(VentaDiaria.total))
+                .where(*VentasDiariasCRUD.filtros_rango_fechas(VentaDiaria.fecha, desde, hasta))
+                .group_by(clave)
+                .having(func.sum(VentaDiaria.cantidad) > 0)
+            )
+            filas = db.execute(consulta).all()
+            
+            if not GraficosEstadisticos.validar_datos_disponibles(filas):
                 return {}
             
-            ventas = {}
-            
-            # Procesar cada pedido para agrupar por periodo
-            for pedido in pedidos:
-                if not pedido.fecha:
-                    continue
-                    
-                try:
-                    fecha = pedido.fecha
-                    total = pedido.total
-                    
-                    # Determinar formato de agrupación según el periodo
-                    if periodo == "diario":
-                        clave = fecha.strftime("%Y-%m-%d")
-                    elif periodo == "semanal":
-                        # Calcular número de semana ISO
-                        clave = f"{fecha.year}-S{fecha.isocalendar()[1]}"
-                    elif periodo == "mensual":
-                        clave = fecha.strftime("%Y-%m")
-                    elif periodo == "anual":
-                        clave = str(fecha.year)
-                    else:
-                        clave = fecha.strftime("%Y-%m-%d")
-                    
-                    ventas[clave] = ventas.get(clave, 0.0) + total
-                    
-                except (ValueError, AttributeError) as e:
-                    # Manejar errores de formato en fechas
-                    continue
-            
+            ventas = {periodo_clave: float(total or 0.0) for periodo_clave, total in filas}
             return dict(sorted(ventas.items()))
             
         except Exception as e:
             raise Exception(f"Error al obtener ventas por fecha: {str(e)}")
     
     @staticmethod
-    def obtener_distribucion_menus(db: Session) -> Dict[str, int]:
-        """Calcula las estadísticas de popularidad de cada elemento del menú."""
+    def obtener_distribucion_menus(db: Session, desde: Optional[date] = None,
+                                   hasta: Optional[date] = None) -> Dict[str, int]:
+        """Calcula las estadísticas de popularidad de cada elemento del menú
+        a partir del resumen diario de ventas.
+        """
         try:
-            # Obtener todos los items de pedidos realizados
-            items = db.query(ItemPedido).all()
-            
-            if not GraficosEstadisticos.validar_datos_disponibles(items):
-                return {}
-            
             # Acumular cantidades por nombre de menú
-            distribucion = {}
-            for item in items:
-                if item.menu and item.menu.nombre:
-                    nombre = item.menu.nombre
-                    distribucion[nombre] = distribucion.get(nombre, 0) + item.cantidad
+            vendidos = func.sum(VentaDiaria.cantidad)
+            consulta = (
+                select(Menu.nombre, vendidos)
+                .select_from(VentaDiaria)
+                .join(Menu, Menu.id == VentaDiaria.menu_id)
+                .where(*VentasDiariasCRUD.filtros_rango_fechas(VentaDiaria.fecha, desde, hasta))
+                .group_by(Menu.nombre)
+                .having(vendidos > 0)
+                .order_by(vendidos.desc())
+            )
+            filas = db.execute(consulta).all()
+            
+            if not GraficosEstadisticos.validar_datos_disponibles(filas):
+                return {}
             
             # Retornar ordenado por popularidad descendente
-            return dict(sorted(distribucion.items(), key=lambda x: x[1], reverse=True))
+            return {nombre: int(cantidad) for nombre, cantidad in filas if nombre}
             
         except Exception as e:
             raise Exception(f"Error al obtener distribución de menús: {str(e)}")
     
     @staticmethod
-    def obtener_uso_ingredientes(db: Session) -> Dict[str, float]:
-        """Calcula el consumo total de ingredientes en base a las recetas y pedidos."""
+    def obtener_uso_ingredientes(db: Session, desde: Optional[date] = None,
+                                 hasta: Optional[date] = None,
+                                 menu_id: Optional[int] = None) -> Dict[str, float]:
+        """Calcula el consumo total de ingredientes en base a las recetas y pedidos.
+        
+        El cálculo es un producto matriz-vector entre las recetas y las unidades
+        vendidas por menú (ver consumo.MotorConsumo).
+        """
         try:
-            # Obtener todos los pedidos para calcular consumo
-            pedidos = db.query(Pedido).all()
-            
-            if not GraficosEstadisticos.validar_datos_disponibles(pedidos):
-                return {}
-            
-            uso_ingredientes = {}
-            
-            # Procesar cada pedido y sus items
-            for pedido in pedidos:
-                for item in pedido.items:
-                    menu = item.menu
-                    cantidad_menu = item.cantidad
-                    
-                    # Calcular ingredientes usados si el menú tiene receta
-                    if menu and menu.receta:
-                        for ingrediente, cantidad_por_menu in menu.receta.items():
-                            try:
-                                # Multiplicar receta por cantidad pedida
-                                cantidad_total = cantidad_por_menu * cantidad_menu
-                                uso_ingredientes[ingrediente] = uso_ingredientes.get(ingrediente, 0.0) + cantidad_total
-                            except (ValueError, TypeError):
-                                # Omitir ingredientes con formato inválido
-                                continue
-            
-            return dict(sorted(uso_ingredientes.items(), key=lambda x: x[1], reverse=True))
+            return MotorConsumo.consumo_ingredientes(db, desde, hasta, menu_id)
             
         except Exception as e:
             raise Exception(f"Error al calcular uso de ingredientes: {str(e)}")
@@ -131,8 +118,9 @@ class GraficosEstadisticos:
             if not ventas:
                 return None, "No hay datos disponibles para mostrar ventas por fecha"
             
-            # Configurar figura y ejes del gráfico
-            fig, ax = plt.subplots(figsize=(10, 6))
+            # Configurar figura y ejes del gráfico (sin pyplot: se puede crear fuera del hilo de Tk)
+            fig = Figure(figsize=(10, 6))
+            ax = fig.subplots()
             
             fechas = list(ventas.keys())
             valores = list(ventas.values())
@@ -142,8 +130,8 @@ class GraficosEstadisticos:
             ax.set_xlabel('Fecha')
             ax.set_ylabel('Ventas ($)')
             ax.set_title(f'Ventas por {periodo.capitalize()}')
-            plt.xticks(rotation=45, ha='right')  # Rotar etiquetas para mejor legibilidad
-            plt.tight_layout()
+            fig.autofmt_xdate(rotation=45, ha='right')  # Rotar etiquetas para mejor legibilidad
+            fig.tight_layout()
             
             return fig, None
             
@@ -163,7 +151,8 @@ class GraficosEstadisticos:
             # Filtrar a los 10 elementos más vendidos para mejor visualización
             top_10 = dict(list(distribucion.items())[:10])
             
-            fig, ax = plt.subplots(figsize=(10, 6))
+            fig = Figure(figsize=(10, 6))
+            ax = fig.subplots()
             
             menus = list(top_10.keys())
             cantidades = list(top_10.values())
@@ -173,7 +162,7 @@ class GraficosEstadisticos:
             ax.set_xlabel('Cantidad Vendida')
             ax.set_ylabel('Menú')
             ax.set_title('Top 10 Menús Más Vendidos')
-            plt.tight_layout()
+            fig.tight_layout()
             
             return fig, None
             
@@ -190,7 +179,8 @@ class GraficosEstadisticos:
             if not uso:
                 return None, "No hay datos disponibles para mostrar uso de ingredientes"
             
-            fig, ax = plt.subplots(figsize=(10, 8))
+            fig = Figure(figsize=(10, 8))
+            ax = fig.subplots()
             
             ingredientes = list(uso.keys())
             cantidades = list(uso.values())
@@ -210,7 +200,7 @@ class GraficosEstadisticos:
             # Crear gráfico circular con porcentajes
             ax.pie(cantidades, labels=ingredientes, autopct='%1.1f%%', startangle=90)
             ax.set_title('Distribución de Uso de Ingredientes')
-            plt.tight_layout()
+            fig.tight_layout()
             
             return fig, None
             
@@ -0,0 +1,52 @@
+"""
+Medición de las fases del arranque de la aplicación.
+
+Solo depende de la biblioteca estándar, así puede importarse antes que
+customtkinter, SQLAlchemy o matplotlib y medir también lo que cuestan.
+"""
+
+import os
+import time
+from typing import List, Tuple
+
+# Con RESTAURANTE_TIEMPOS_INICIO=1 se imprimen los tiempos del arranque y de cada pestaña
+INFORMAR_TIEMPOS = os.environ.get("RESTAURANTE_TIEMPOS_INICIO", "0") == "1"
+
+
+class TiemposInicio:
+    """Registra la duración de cada fase del arranque, en orden.
+
+    Las fases se registran siempre; solo se imprimen si `informar` es verdadero.
+    """
+
+    def __init__(self, informar: bool = INFORMAR_TIEMPOS):
+        self.informar = informar
+        self.inicio = time.perf_counter()
+        self._anterior = self.inicio
+        self.fases: List[Tuple[str, float]] = []
+
+    def marcar(self, fase: str) -> float:
+        """Cierra la fase actual con el nombre indicado y retorna su duración en segundos."""
+        ahora = time.perf_counter()
+        duracion = ahora - self._anterior
+        self.fases.append((fase, duracion))
+        self._anterior = ahora
+        return duracion
+
+    @property
+    def total(self) -> float:
+        return self._anterior - self.inicio
+
+    def informe(self) -> str:
+        """Texto con la duración de cada fase y el total, en milisegundos."""
+        ancho = max((len(fase) for fase, _ in self.fases), default=0)
+        lineas = ["Tiempos de arranque:"]
+        for fase, duracion in self.fases:
+            lineas.append(f"  {fase.ljust(ancho)}  {duracion * 1000:8.1f} ms")
+        lineas.append(f"  {'total'.ljust(ancho)}  {self.total * 1000:8.1f} ms")
+        return "\n".join(lineas)
+
+    def mostrar(self, texto: str):
+        """Imprime el texto solo si el informe de tiempos está activado."""
+        if self.informar:
+            print(texto)
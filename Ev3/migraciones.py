@@ -0,0 +1,301 @@
+"""
+Migraciones versionadas del esquema de la base de datos.
+
+`Base.metadata.create_all` solo crea tablas nuevas; las columnas agregadas a
+tablas existentes se aplican aquí. La versión aplicada se guarda en
+`PRAGMA user_version` y cada paso es idempotente, de modo que también puede
+ejecutarse sobre una base recién creada.
+
+Uso:
+    python migraciones.py                       # aplica migraciones pendientes
+    python migraciones.py --recalcular-totales  # rellena totales de pedidos
+    python migraciones.py --reconstruir-ventas  # regenera el resumen VentasDiarias
+"""
+
+import argparse
+import json
+from sqlalchemy import inspect, text
+from database import get_session, engine, Base
+from crud.pedido_crud import PedidoCRUD
+from crud.ventas_crud import VentasDiariasCRUD
+import models  # noqa: F401  (registra los modelos en Base.metadata)
+from models import normalizar_nombre
+
+
+def _columnas(conexion, tabla: str) -> set:
+    """Retorna los nombres de columnas actuales de una tabla."""
+    return {columna["name"] for columna in inspect(conexion).get_columns(tabla)}
+
+
+def _agregar_columna(conexion, tabla: str, columna: str, definicion: str) -> bool:
+    """Agrega una columna si todavía no existe. Retorna True si fue creada."""
+    if columna in _columnas(conexion, tabla):
+        return False
+    conexion.execute(text(f'ALTER TABLE "{tabla}" ADD COLUMN {columna} {definicion}'))
+    return True
+
+
+# Cada paso usa SQL fijo (no los modelos actuales) para que siga siendo válido
+# aunque los modelos cambien en versiones posteriores.
+
+def _v1_totales_pedido(conexion):
+    """Agrega total y cantidad_items a Pedidos y los rellena desde sus items."""
+    _agregar_columna(conexion, "Pedidos", "total", "FLOAT NOT NULL DEFAULT 0")
+    _agregar_columna(conexion, "Pedidos", "cantidad_items", "INTEGER NOT NULL DEFAULT 0")
+    conexion.execute(text('''
+        UPDATE "Pedidos" SET
+            total = COALESCE((SELECT SUM(i.cantidad * m.precio)
+                              FROM "ItemPedidos" i JOIN "Menus" m ON m.id = i.menu_id
+                              WHERE i.pedido_id = "Pedidos".id), 0),
+            cantidad_items = COALESCE((SELECT SUM(i.cantidad) FROM "ItemPedidos" i
+                                       WHERE i.pedido_id = "Pedidos".id), 0)
+    '''))
+
+
+def _v2_precio_unitario_item(conexion):
+    """Agrega precio_unitario a ItemPedidos tomando el precio actual del menú."""
+    if _agregar_columna(conexion, "ItemPedidos", "precio_unitario", "FLOAT NOT NULL DEFAULT 0"):
+        conexion.execute(text('''
+            UPDATE "ItemPedidos" SET precio_unitario = COALESCE(
+                (SELECT m.precio FROM "Menus" m WHERE m.id = "ItemPedidos".menu_id), 0)
+        '''))
+
+
+
+def _v3_ventas_diarias(conexion):
+    """Llena el resumen VentasDiarias (creado por create_all) con el historial existente."""
+    if conexion.execute(text('SELECT COUNT(*) FROM "VentasDiarias"')).scalar() == 0:
+        conexion.execute(text('''
+            INSERT INTO "VentasDiarias" (fecha, menu_id, categoria, cantidad, total)
+            SELECT date(p.fecha), i.menu_id, m.categoria,
+                   SUM(i.cantidad), SUM(i.cantidad * i.precio_unitario)
+            FROM "ItemPedidos" i
+            JOIN "Pedidos" p ON p.id = i.pedido_id
+            LEFT JOIN "Menus" m ON m.id = i.menu_id
+            WHERE p.fecha IS NOT NULL
+            GROUP BY date(p.fecha), i.menu_id
+        '''))
+
+
+def _v4_receta_ingredientes(conexion):
+    """Copia las recetas JSON de Menus.receta a la tabla RecetaIngredientes.
+
+    La columna JSON se conserva en la base (el modelo ya no la usa). Las entradas
+    con ingredientes inexistentes o cantidades inválidas se omiten y se informan.
+    """
+    if "receta" not in _columnas(conexion, "Menus"):
+        return
+    if conexion.execute(text('SELECT COUNT(*) FROM "RecetaIngredientes"')).scalar() > 0:
+        return
+
+    ingredientes = dict(conexion.execute(text('SELECT nombre, id FROM "Ingredientes"')).all())
+    filas = []
+    for menu_id, receta_json in conexion.execute(
+        text('SELECT id, receta FROM "Menus" WHERE receta IS NOT NULL')
+    ).all():
+        try:
+            receta = json.loads(receta_json) if isinstance(receta_json, str) else receta_json
+        except ValueError:
+            print(f"Migración recetas: receta inválida en el menú {menu_id}, omitida")
+            continue
+        for nombre, cantidad in (receta or {}).items():
+            ingrediente_id = ingredientes.get(nombre)
+            try:
+                cantidad = float(cantidad)
+            except (TypeError, ValueError):
+                cantidad = 0.0
+            if ingrediente_id is None or cantidad <= 0:
+                print(f"Migración recetas: se omite '{nombre}' del menú {menu_id}")
+                continue
+            filas.append({"menu_id": menu_id, "ingrediente_id": ingrediente_id, "cantidad": cantidad})
+
+    if filas:
+        conexion.execute(text('''
+            INSERT INTO "RecetaIngredientes" (menu_id, ingrediente_id, cantidad)
+            VALUES (:menu_id, :ingrediente_id, :cantidad)
+        '''), filas)
+
+
+# Índices secundarios de las columnas usadas en búsquedas: (nombre, tabla, columnas)
+INDICES_V5 = [
+    ("ix_Pedidos_cliente_id", "Pedidos", "cliente_id"),
+    ("ix_Pedidos_fecha", "Pedidos", "fecha"),
+    ("ix_ItemPedidos_pedido_id_menu_id", "ItemPedidos", "pedido_id, menu_id"),
+    ("ix_ItemPedidos_menu_id", "ItemPedidos", "menu_id"),
+    ("ix_Clientes_correo", "Clientes", "correo"),
+    ("ix_Menus_disponible", "Menus", "disponible"),
+    ("ix_Menus_categoria", "Menus", "categoria"),
+]
+
+
+def _v5_indices_busqueda(conexion):
+    """Crea los índices secundarios declarados en los modelos en bases existentes."""
+    for nombre, tabla, columnas in INDICES_V5:
+        conexion.execute(text(f'CREATE INDEX IF NOT EXISTS "{nombre}" ON "{tabla}" ({columnas})'))
+
+
+# Tablas que se muestran en la interfaz y se refrescan por diferencias
+TABLAS_V6 = ["Clientes", "Ingredientes", "Menus", "Pedidos"]
+
+
+def _v6_actualizado_en(conexion):
+    """Agrega actualizado_en (segundos Unix según SQLite) con su índice a las tablas listadas."""
+    for tabla in TABLAS_V6:
+        # ADD COLUMN no admite un valor por defecto no constante: se rellena después
+        if _agregar_columna(conexion, tabla, "actualizado_en", "FLOAT NOT NULL DEFAULT 0"):
+            conexion.execute(text(
+                f'''UPDATE "{tabla}" SET actualizado_en = (julianday('now') - 2440587.5) * 86400.0'''
+            ))
+        conexion.execute(text(
+            f'CREATE INDEX IF NOT EXISTS "ix_{tabla}_actualizado_en" ON "{tabla}" (actualizado_en)'
+        ))
+
+
+def _v7_menus_agotados(conexion):
+    """Agrega Menus.agotado con su índice y lo calcula según el stock actual."""
+    if _agregar_columna(conexion, "Menus", "agotado", "INTEGER NOT NULL DEFAULT 0"):
+        conexion.execute(text('''
+            UPDATE "Menus" SET agotado = EXISTS (
+                SELECT 1 FROM "RecetaIngredientes" r JOIN "Ingredientes" i ON i.id = r.ingrediente_id
+                WHERE r.menu_id = "Menus".id AND i.stock < r.cantidad)
+        '''))
+    conexion.execute(text('CREATE INDEX IF NOT EXISTS "ix_Menus_agotado" ON "Menus" (agotado)'))
+
+
+def _v8_nombre_normalizado(conexion):
+    """Agrega Ingredientes.nombre_normalizado con su índice y lo rellena."""
+    if _agregar_columna(conexion, "Ingredientes", "nombre_normalizado", "VARCHAR NOT NULL DEFAULT ''"):
+        # lower() de SQLite solo convierte ASCII: se normaliza en Python como en los modelos
+        filas = conexion.execute(text('SELECT id, nombre FROM "Ingredientes"')).all()
+        if filas:
+            conexion.execute(
+                text('UPDATE "Ingredientes" SET nombre_normalizado = :normalizado WHERE id = :id'),
+                [{"id": fila_id, "normalizado": normalizar_nombre(nombre)} for fila_id, nombre in filas]
+            )
+    conexion.execute(text(
+        'CREATE INDEX IF NOT EXISTS "ix_Ingredientes_nombre_normalizado" ON "Ingredientes" (nombre_normalizado)'
+    ))
+
+
+def _v9_indice_nombre_menu(conexion):
+    """Índice por nombre de menú, usado por la importación del catálogo."""
+    conexion.execute(text('CREATE INDEX IF NOT EXISTS "ix_Menus_nombre" ON "Menus" (nombre)'))
+
+
+def _v10_recetas_planas(conexion):
+    """Llena RecetasPlanas (creada por create_all): sin subrecetas es la misma receta."""
+    if conexion.execute(text('SELECT COUNT(*) FROM "RecetasPlanas"')).scalar() == 0:
+        conexion.execute(text('''
+            INSERT INTO "RecetasPlanas" (menu_id, ingrediente_id, cantidad)
+            SELECT menu_id, ingrediente_id, cantidad FROM "RecetaIngredientes"
+        '''))
+
+
+def _v11_nombre_normalizado_unico(conexion):
+    """Hace único Ingredientes.nombre_normalizado.
+
+    Si hay ingredientes que solo difieren en mayúsculas o espacios la migración
+    se detiene y los lista: pueden tener unidades distintas y estar en recetas,
+    así que se resuelven a mano (renombrar o eliminar) antes de volver a abrir.
+    """
+    repetidos = conexion.execute(text('''
+        SELECT id, nombre, unidad, nombre_normalizado FROM "Ingredientes"
+        WHERE nombre_normalizado IN (
+            SELECT nombre_normalizado FROM "Ingredientes"
+            GROUP BY nombre_normalizado HAVING COUNT(*) > 1
+        )
+        ORDER BY nombre_normalizado, id
+    ''')).all()
+    if repetidos:
+        grupos = {}
+        for fila in repetidos:
+            grupos.setdefault(fila.nombre_normalizado, []).append(f"{fila.id} '{fila.nombre}' ({fila.unidad})")
+        detalle = "\n".join(f"  - {', '.join(ingredientes)}" for ingredientes in grupos.values())
+        raise Exception(
+            "Migración ingredientes: hay nombres que solo difieren en mayúsculas o espacios. "
+            f"Renombre o elimine los repetidos y vuelva a iniciar:\n{detalle}"
+        )
+
+    conexion.execute(text('DROP INDEX IF EXISTS "ix_Ingredientes_nombre_normalizado"'))
+    conexion.execute(text(
+        'CREATE UNIQUE INDEX "ix_Ingredientes_nombre_normalizado" ON "Ingredientes" (nombre_normalizado)'
+    ))
+
+
+def _v12_categorias_ventas(conexion):
+    """Indexa VentasDiarias por menú y le copia la categoría actual de cada menú existente."""
+    conexion.execute(text('CREATE INDEX IF NOT EXISTS "ix_VentasDiarias_menu_id" ON "VentasDiarias" (menu_id)'))
+    conexion.execute(text('''
+        UPDATE "VentasDiarias"
+        SET categoria = (SELECT m.categoria FROM "Menus" m WHERE m.id = "VentasDiarias".menu_id)
+        WHERE menu_id IN (SELECT id FROM "Menus")
+    '''))
+
+
+# Lista ordenada de migraciones: (versión, función)
+MIGRACIONES = [
+    (1, _v1_totales_pedido),
+    (2, _v2_precio_unitario_item),
+    (3, _v3_ventas_diarias),
+    (4, _v4_receta_ingredientes),
+    (5, _v5_indices_busqueda),
+    (6, _v6_actualizado_en),
+    (7, _v7_menus_agotados),
+    (8, _v8_nombre_normalizado),
+    (9, _v9_indice_nombre_menu),
+    (10, _v10_recetas_planas),
+    (11, _v11_nombre_normalizado_unico),
+    (12, _v12_categorias_ventas),
+]
+
+
+def aplicar_migraciones(motor=engine) -> int:
+    """Aplica las migraciones pendientes y retorna la versión final del esquema."""
+    with motor.begin() as conexion:
+        version_actual = conexion.execute(text("PRAGMA user_version")).scalar()
+        for version, migracion in MIGRACIONES:
+            if version <= version_actual:
+                continue
+            migracion(conexion)
+            # PRAGMA no admite parámetros; la versión es un entero controlado
+            conexion.execute(text(f"PRAGMA user_version = {int(version)}"))
+            version_actual = version
+    return version_actual
+
+
+def inicializar_base_datos(motor=engine) -> int:
+    """Crea las tablas faltantes y aplica las migraciones pendientes."""
+    Base.metadata.create_all(bind=motor)
+    return aplicar_migraciones(motor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos del restaurante")
+    parser.add_argument("--recalcular-totales", action="store_true",
+                        help="Recalcula total y cantidad de items de todos los pedidos")
+    parser.add_argument("--reconstruir-ventas", action="store_true",
+                        help="Regenera el resumen diario de ventas desde el historial")
+    args = parser.parse_args()
+
+    version = inicializar_base_datos()
+    print(f"Esquema en versión {version}")
+
+    if args.recalcular_totales:
+        db = next(get_session())
+        try:
+            actualizados = PedidoCRUD.recalcular_totales(db)
+            print(f"Totales recalculados en {actualizados} pedidos")
+        finally:
+            db.close()
+
+    if args.reconstruir_ventas:
+        db = next(get_session())
+        try:
+            filas = VentasDiariasCRUD.reconstruir(db)
+            print(f"Resumen de ventas regenerado: {filas} filas")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,32 @@
-from sqlalchemy import Column, String, Float, Integer, ForeignKey, JSON, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Float, Integer, ForeignKey, DateTime, Date, Index, func
+from sqlalchemy.orm import relationship, validates
 from database import Base
 from datetime import datetime
 
+
+def marca_tiempo():
+    """Hora actual según SQLite, en segundos Unix con milisegundos.
+
+    Se calcula en la base y no en Python para que todas las terminales usen el
+    mismo reloj al comparar marcas de modificación.
+    """
+    return (func.julianday("now") - 2440587.5) * 86400.0
+
+
+def normalizar_nombre(nombre: str) -> str:
+    """Forma de comparación de un nombre: sin distinguir mayúsculas ni espacios repetidos."""
+    return " ".join(nombre.split()).casefold()
+
+
+def _nombre_normalizado_por_defecto(contexto):
+    # Para los INSERT de Core (p. ej. el upsert de la carga CSV), que no pasan por @validates
+    return normalizar_nombre(contexto.get_current_parameters()["nombre"])
+
+
+def columna_actualizado_en():
+    """Marca de la última escritura de la fila; permite pedir solo lo que cambió."""
+    return Column(Float, nullable=False, default=marca_tiempo(), onupdate=marca_tiempo(), index=True)
+
 class Cliente(Base):
     """Modelo para representar clientes del restaurante."""
     __tablename__ = "Clientes"
@@ -10,7 +34,8 @@ class Cliente(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     rut = Column(String, unique=True, index=True, nullable=False)  # Identificador único del cliente
     nombre = Column(String, nullable=False)
-    correo = Column(String, nullable=True)  # Campo opcional
+    correo = Column(String, nullable=True, index=True)  # Campo opcional, se valida que no se repita
+    actualizado_en = columna_actualizado_en()
     
     # Relación uno a muchos: un cliente puede tener múltiples pedidos
     pedidos = relationship("Pedido", back_populates="cliente", cascade="all, delete-orphan")
@@ -24,6 +49,15 @@ class Ingrediente(Base):
     nombre = Column(String, nullable=False, unique=True)  # Nombre único del ingrediente
     stock = Column(Float, default=0.0)  # Cantidad disponible en inventario
     unidad = Column(String, nullable=False)  # Unidad de medida: kg, litros, unidades, etc.
+    # Nombre en minúsculas y sin espacios repetidos, único; las recetas se resuelven por esta columna
+    nombre_normalizado = Column(String, nullable=False, unique=True, index=True,
+                                default=_nombre_normalizado_por_defecto)
+    actualizado_en = columna_actualizado_en()
+
+    @validates("nombre")
+    def _normalizar(self, clave, nombre):
+        self.nombre_normalizado = normalizar_nombre(nombre)
+        return nombre
 
 
 class Menu(Base):
@@ -31,15 +65,73 @@ class Menu(Base):
     __tablename__ = "Menus"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    nombre = Column(String, nullable=False)
+    nombre = Column(String, nullable=False, index=True)  # La importación del catálogo busca por nombre
     descripcion = Column(String, nullable=True)
     precio = Column(Float, nullable=False)
-    categoria = Column(String, nullable=True)  # Clasificación: Churrascos, Bebidas, Postres, etc.
-    disponible = Column(Integer, default=1)  # Control de disponibilidad: 1=disponible, 0=no disponible
-    receta = Column(JSON, nullable=True)  # Ingredientes necesarios en formato JSON
+    categoria = Column(String, nullable=True, index=True)  # Clasificación: Churrascos, Bebidas, Postres, etc.
+    disponible = Column(Integer, default=1, index=True)  # Control de disponibilidad: 1=disponible, 0=no disponible
+    agotado = Column(Integer, nullable=False, default=0, index=True)  # 1 si el stock no alcanza para una porción; lo mantiene el CRUD
+    actualizado_en = columna_actualizado_en()
     
     # Relación uno a muchos: un menú puede aparecer en múltiples pedidos
     items = relationship("ItemPedido", back_populates="menu", cascade="all, delete-orphan")
+    # Ingredientes de la receta, una fila por ingrediente
+    receta_ingredientes = relationship("RecetaIngrediente", back_populates="menu",
+                                       cascade="all, delete-orphan")
+    # Otras recetas (salsas, masas, etc.) usadas por este menú
+    receta_subrecetas = relationship("RecetaSubreceta", foreign_keys="RecetaSubreceta.menu_id",
+                                     back_populates="menu", cascade="all, delete-orphan")
+
+    @property
+    def receta(self):
+        """Receta en formato {nombre_ingrediente: cantidad}, o None si no tiene."""
+        if not self.receta_ingredientes:
+            return None
+        return {ri.ingrediente.nombre: ri.cantidad for ri in self.receta_ingredientes}
+
+    @property
+    def subrecetas(self):
+        """Subrecetas en formato {nombre_menu: cantidad}, o None si no tiene."""
+        if not self.receta_subrecetas:
+            return None
+        return {rs.subreceta.nombre: rs.cantidad for rs in self.receta_subrecetas}
+
+
+class RecetaIngrediente(Base):
+    """Modelo para la cantidad de un ingrediente usada por una porción de un menú."""
+    __tablename__ = "RecetaIngredientes"
+
+    menu_id = Column(Integer, ForeignKey("Menus.id"), primary_key=True)
+    ingrediente_id = Column(Integer, ForeignKey("Ingredientes.id"), primary_key=True, index=True)
+    cantidad = Column(Float, nullable=False)  # Cantidad por porción, en la unidad del ingrediente
+
+    menu = relationship("Menu", back_populates="receta_ingredientes")
+    ingrediente = relationship("Ingrediente", lazy="joined")  # Siempre se necesita el nombre
+
+
+class RecetaSubreceta(Base):
+    """Modelo para las porciones de otra receta (un menú) usadas por una porción de un menú."""
+    __tablename__ = "RecetaSubrecetas"
+
+    menu_id = Column(Integer, ForeignKey("Menus.id"), primary_key=True)
+    subreceta_id = Column(Integer, ForeignKey("Menus.id"), primary_key=True, index=True)
+    cantidad = Column(Float, nullable=False)  # Porciones de la subreceta por porción del menú
+
+    menu = relationship("Menu", foreign_keys=[menu_id], back_populates="receta_subrecetas")
+    subreceta = relationship("Menu", foreign_keys=[subreceta_id], lazy="joined")
+
+
+class RecetaPlana(Base):
+    """Receta de un menú expandida a ingredientes, con las subrecetas ya multiplicadas.
+
+    La mantiene MenuCRUD.actualizar_recetas_planas en la misma transacción que
+    cualquier cambio de receta; pedidos, reportes y disponibilidad leen de aquí.
+    """
+    __tablename__ = "RecetasPlanas"
+
+    menu_id = Column(Integer, ForeignKey("Menus.id"), primary_key=True)
+    ingrediente_id = Column(Integer, ForeignKey("Ingredientes.id"), primary_key=True, index=True)
+    cantidad = Column(Float, nullable=False)  # Cantidad total por porción, en la unidad del ingrediente
 
 
 class Pedido(Base):
@@ -47,32 +139,35 @@ class Pedido(Base):
     __tablename__ = "Pedidos"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    fecha = Column(DateTime, default=datetime.now)  # Timestamp automático de creación
+    fecha = Column(DateTime, default=datetime.now, index=True)  # Timestamp automático de creación
     estado = Column(String, default="Pendiente")  # Estados: Pendiente, En preparación, Completado
+    total = Column(Float, nullable=False, default=0.0)  # Suma de subtotales, mantenida al escribir items
+    cantidad_items = Column(Integer, nullable=False, default=0)  # Suma de cantidades de los items
+    actualizado_en = columna_actualizado_en()
     
     # Referencia al cliente que realizó el pedido
-    cliente_id = Column(Integer, ForeignKey("Clientes.id"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("Clientes.id"), nullable=False, index=True)
     
     # Relaciones bidireccionales
     cliente = relationship("Cliente", back_populates="pedidos")
     items = relationship("ItemPedido", back_populates="pedido", cascade="all, delete-orphan")
-    
-    @property
-    def total(self) -> float:
-        """Calcula el total del pedido sumando todos los subtotales de los items."""
-        return sum(item.subtotal for item in self.items)
 
 
 class ItemPedido(Base):
     """Modelo para representar elementos individuales dentro de un pedido."""
     __tablename__ = "ItemPedidos"
+    __table_args__ = (
+        # Búsqueda de un menú dentro de un pedido; también sirve para filtrar por pedido
+        Index("ix_ItemPedidos_pedido_id_menu_id", "pedido_id", "menu_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     cantidad = Column(Integer, nullable=False)  # Cantidad solicitada del elemento del menú
+    precio_unitario = Column(Float, nullable=False, default=0.0)  # Precio del menú al momento del pedido
 
     # Referencias a pedido y menú
     pedido_id = Column(Integer, ForeignKey("Pedidos.id"), nullable=False)
-    menu_id = Column(Integer, ForeignKey("Menus.id"), nullable=False)
+    menu_id = Column(Integer, ForeignKey("Menus.id"), nullable=False, index=True)
     
     # Relaciones bidireccionales
     pedido = relationship("Pedido", back_populates="items")
@@ -80,7 +175,29 @@ class ItemPedido(Base):
 
     @property
     def subtotal(self) -> float:
-        """Calcula el subtotal multiplicando precio por cantidad."""
-        if self.menu:
-            return self.menu.precio * self.cantidad
-        return 0.0
+        """Calcula el subtotal multiplicando el precio registrado por la cantidad."""
+        return (self.precio_unitario or 0.0) * self.cantidad
+
+
+
+class VentaDiaria(Base):
+    """Resumen de ventas por día y menú, mantenido en la misma transacción que los pedidos."""
+    __tablename__ = "VentasDiarias"
+    __table_args__ = (
+        # Actualizar la categoría de un menú en todos sus días
+        Index("ix_VentasDiarias_menu_id", "menu_id"),
+    )
+
+    fecha = Column(Date, primary_key=True)  # Día de los pedidos
+    menu_id = Column(Integer, primary_key=True)  # Sin FK: el resumen se descuenta al eliminar el menú
+    categoria = Column(String, nullable=True)  # Categoría actual del menú: se actualiza al cambiarla
+    cantidad = Column(Integer, nullable=False, default=0)  # Unidades vendidas en el día
+    total = Column(Float, nullable=False, default=0.0)  # Ventas del día según precio registrado
+
+
+class VersionTabla(Base):
+    """Contador de commits que modificaron cada tabla (ver TABLAS_VERSIONADAS en database.py)."""
+    __tablename__ = "VersionesTablas"
+
+    tabla = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
\ No newline at end of file
@@ -0,0 +1,101 @@
+"""
+Detección de cambios hechos en la base por otras terminales.
+
+Cada cierto tiempo se consulta `PRAGMA data_version` en una conexión propia:
+el valor cambia solo cuando otra conexión confirmó una transacción, y leerlo
+no toca las tablas. Solo entonces se leen los contadores de VersionesTablas
+para saber qué tablas cambiaron. Con la aplicación inactiva, cada revisión es
+un PRAGMA y nada más.
+"""
+
+from typing import Callable, Dict, Optional, Set
+from database import engine
+
+
+class MonitorCambios:
+    """Revisa periódicamente la base y avisa qué tablas versionadas cambiaron.
+
+    `al_cambiar(tablas)` se llama en el hilo de Tk con el conjunto de nombres de
+    tablas cuyo contador cambió desde la revisión anterior. Si una revisión
+    falla se llama a `al_error(error)`, una sola vez mientras se repita el
+    mismo error; sin `al_error` el error se imprime.
+    """
+
+    INTERVALO_MS = 1000  # Cada cuánto se revisa la base
+
+    def __init__(self, widget, al_cambiar: Callable[[Set[str]], None], motor=engine,
+                 intervalo_ms: int = None, al_error: Optional[Callable[[Exception], None]] = None):
+        self.widget = widget
+        self.al_cambiar = al_cambiar
+        self.al_error = al_error or (lambda error: print(f"Error al revisar cambios en la base: {str(error)}"))
+        self._ultimo_error = None  # Mensaje del error ya informado, hasta que una revisión funcione
+        self.intervalo_ms = intervalo_ms or self.INTERVALO_MS
+        self.lecturas = 0  # Veces que se leyeron los contadores (solo cuando hubo commits)
+        self._id_after = None
+        # data_version es propio de cada conexión: se usa siempre la misma.
+        # En otros motores no existe y se leen los contadores en cada revisión.
+        self._usa_data_version = motor.dialect.name == "sqlite"
+        self._conexion = motor.raw_connection()
+        self._data_version = self._leer_data_version()
+        self._versiones = self._leer_versiones()
+
+    def iniciar(self):
+        """Programa la primera revisión."""
+        if self._id_after is None:
+            self._id_after = self.widget.after(self.intervalo_ms, self._revisar)
+
+    def detener(self):
+        """Cancela la revisión programada y libera la conexión."""
+        if self._id_after is not None:
+            self.widget.after_cancel(self._id_after)
+            self._id_after = None
+        if self._conexion is not None:
+            self._conexion.close()
+            self._conexion = None
+
+    def revisar(self) -> Set[str]:
+        """Retorna las tablas que cambiaron desde la revisión anterior."""
+        if self._usa_data_version:
+            version = self._leer_data_version()
+            if version == self._data_version:
+                return set()
+            self._data_version = version
+
+        versiones = self._leer_versiones()
+        cambiadas = {tabla for tabla, version in versiones.items()
+                     if self._versiones.get(tabla) != version}
+        self._versiones = versiones
+        return cambiadas
+
+    def _revisar(self):
+        # Corre en el hilo de Tk: con WAL la lectura no espera a los escritores
+        self._id_after = None
+        try:
+            cambiadas = self.revisar()
+            self._ultimo_error = None
+        except Exception as e:
+            cambiadas = set()
+            if str(e) != self._ultimo_error:
+                self._ultimo_error = str(e)
+                self.al_error(e)
+        if self._conexion is not None:
+            self._id_after = self.widget.after(self.intervalo_ms, self._revisar)
+        if cambiadas:
+            self.al_cambiar(cambiadas)
+
+    def _consultar(self, sql: str) -> list:
+        cursor = self._conexion.cursor()
+        try:
+            cursor.execute(sql)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _leer_data_version(self):
+        if not self._usa_data_version:
+            return None
+        return self._consultar("PRAGMA data_version")[0][0]
+
+    def _leer_versiones(self) -> Dict[str, int]:
+        self.lecturas += 1
+        return dict(self._consultar('SELECT tabla, version FROM "VersionesTablas"'))
@@ -0,0 +1,230 @@
+"""
+Tabla que carga sus filas por páginas a medida que el usuario se desplaza.
+
+En lugar de insertar la tabla completa en el Treeview, pide a la base solo las
+filas visibles más un margen, con paginación por cursor, y trae la página
+siguiente cuando el desplazamiento se acerca al final. Ordenar por una columna
+vuelve a consultar con ORDER BY en SQL en vez de ordenar en memoria.
+
+Después de crear, editar o eliminar, `actualizar()` pide solo las filas
+modificadas desde la última lectura y las aplica sobre las que ya se muestran,
+sin vaciar la tabla.
+"""
+
+from bisect import bisect_left
+from tkinter import ttk, messagebox
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class _Invertida:
+    """Invierte la comparación de una clave para ubicar filas en un orden descendente."""
+    __slots__ = ("clave",)
+
+    def __init__(self, clave):
+        self.clave = clave
+
+    def __lt__(self, otra):
+        return otra.clave < self.clave
+
+
+class TablaVirtual:
+    """Treeview con carga perezosa de páginas a través de un ServicioDatos.
+
+    `cargar(db, limite, despues_de, orden, descendente)` debe retornar una Pagina
+    como los métodos `listar_*` de los CRUD, y `cambios(db, desde, ids, orden)`
+    unos Cambios como los métodos `cambios_*`. `columnas` es una lista de
+    (título, clave de orden o None, ancho). `formatear` convierte cada fila en
+    los valores mostrados; la primera columna debe ser el id.
+    """
+
+    MARGEN_FILAS = 50            # Filas extra pedidas además de las visibles
+    UMBRAL_DESPLAZAMIENTO = 0.8  # Fracción recorrida a partir de la cual se pide la página siguiente
+    ALTO_FILA = 20               # Alto aproximado de una fila del Treeview, en píxeles
+
+    def __init__(self, parent, servicio, clave: str, columnas: List[Tuple[str, Optional[str], int]],
+                 cargar: Callable[..., Any], cambios: Optional[Callable[..., Any]] = None,
+                 formatear: Optional[Callable[[tuple], tuple]] = None,
+                 orden: str = "id", descendente: bool = False, **opciones_treeview):
+        self.servicio = servicio
+        self.clave = clave
+        self.columnas = columnas
+        self.cargar = cargar
+        self.cambios = cambios
+        self.formatear = formatear or tuple
+        self.orden = orden
+        self.descendente = descendente
+        self._siguiente = None
+        self._cargando = False
+        self._actualizar_despues = False
+        self._marca = None         # Mayor actualizado_en visto en la última lectura completa
+        self._claves = []          # (valor de orden, id) de cada fila, en el orden mostrado
+        self._clave_por_id = {}    # id -> (valor de orden, id)
+
+        self.frame = ttk.Frame(parent)
+        titulos = [titulo for titulo, _, _ in columnas]
+        self.treeview = ttk.Treeview(self.frame, columns=titulos, show="headings", **opciones_treeview)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.treeview.yview)
+        # El Treeview avisa cada desplazamiento: ahí se decide si pedir otra página
+        self.treeview.configure(yscrollcommand=self._al_desplazar)
+
+        for titulo, clave_orden, ancho in columnas:
+            comando = (lambda c=clave_orden: self.ordenar_por(c)) if clave_orden else ""
+            self.treeview.heading(titulo, text=titulo, command=comando)
+            self.treeview.column(titulo, width=ancho)
+        self._marcar_orden()
+
+        self.scrollbar.pack(side="right", fill="y")
+        self.treeview.pack(side="left", fill="both", expand=True)
+
+    def pack(self, **opciones):
+        self.frame.pack(**opciones)
+
+    @property
+    def tamano_pagina(self) -> int:
+        """Filas que caben en pantalla más el margen de precarga."""
+        visibles = max(self.treeview.winfo_height(), 1) // self.ALTO_FILA
+        return max(visibles, 10) + self.MARGEN_FILAS
+
+    def id_seleccionado(self) -> Optional[Any]:
+        """Retorna el id (primera columna) de la fila seleccionada, o None."""
+        seleccion = self.treeview.selection()
+        if not seleccion:
+            return None
+        return self.treeview.item(seleccion[0])["values"][0]
+
+    def refrescar(self):
+        """Vuelve a la primera página con el orden actual."""
+        self._siguiente = None
+        self._pedir(None, reemplazar=True)
+
+    def actualizar(self):
+        """Aplica solo los cambios desde la última lectura; sin lectura previa, recarga."""
+        if self.cambios is None or self._marca is None:
+            self.refrescar()
+            return
+        if self._cargando:
+            # Se aplica al terminar lo que está en camino, para no descartarlo
+            self._actualizar_despues = True
+            return
+
+        desde, ids, orden = self._marca, list(self._clave_por_id), self.orden
+        self._cargando = True
+        self.servicio.ejecutar(
+            lambda db: self.cambios(db, desde, ids, orden),
+            self._aplicar_cambios, self._fallo, clave=self.clave
+        )
+
+    def cargar_mas(self):
+        """Agrega la página siguiente si la hay y no hay otra en camino."""
+        if self._siguiente is not None and not self._cargando:
+            self._pedir(self._siguiente, reemplazar=False)
+
+    def ordenar_por(self, clave_orden: str):
+        """Ordena por la columna indicada; un segundo clic invierte el sentido."""
+        if clave_orden == self.orden:
+            self.descendente = not self.descendente
+        else:
+            self.orden, self.descendente = clave_orden, False
+        self._marcar_orden()
+        self.refrescar()
+
+    def _marcar_orden(self):
+        """Muestra una flecha en el encabezado de la columna ordenada."""
+        for titulo, clave_orden, _ in self.columnas:
+            flecha = (" ▼" if self.descendente else " ▲") if clave_orden == self.orden else ""
+            self.treeview.heading(titulo, text=titulo + flecha)
+
+    def _pedir(self, despues_de, reemplazar: bool):
+        limite = self.tamano_pagina
+        orden, descendente = self.orden, self.descendente
+
+        def mostrar(pagina):
+            if reemplazar:
+                self.treeview.delete(*self.treeview.get_children())
+                self.treeview.yview_moveto(0)
+                self._claves, self._clave_por_id = [], {}
+                self._marca = pagina.marca
+            for fila, clave in zip(pagina.filas, pagina.claves):
+                self._colocar(fila, clave)
+            self._siguiente = pagina.siguiente
+            self._terminar_pedido()
+
+        # Con la misma clave, un refresco reemplaza a la página que esté en camino
+        self._cargando = True
+        self.servicio.ejecutar(
+            lambda db: self.cargar(db, limite, despues_de, orden, descendente),
+            mostrar, self._fallo, clave=self.clave
+        )
+
+    def _terminar_pedido(self):
+        self._cargando = False
+        if self._actualizar_despues:
+            self._actualizar_despues = False
+            self.actualizar()
+
+    def _fallo(self, error):
+        self._actualizar_despues = False
+        self._cargando = False
+        messagebox.showerror("Error", str(error))
+
+    def _aplicar_cambios(self, cambios):
+        """Aplica inserciones, modificaciones y eliminaciones sobre las filas mostradas."""
+        if cambios.desbordado:
+            # Demasiados cambios (p. ej. una importación masiva): sale más barato recargar
+            self._cargando = False
+            self.refrescar()
+            return
+
+        for fila_id in cambios.eliminados:
+            self._quitar(fila_id)
+        for fila, clave in zip(cambios.filas, cambios.claves):
+            if self._en_rango(clave):
+                self._colocar(fila, clave)
+            else:
+                # Quedó después de la última página cargada: llegará al desplazarse
+                self._quitar(clave[1])
+        self._marca = cambios.marca
+        self._terminar_pedido()
+
+    def _llave(self):
+        return _Invertida if self.descendente else (lambda clave: clave)
+
+    def _posicion(self, clave) -> int:
+        llave = self._llave()
+        return bisect_left(self._claves, llave(clave), key=llave)
+
+    def _en_rango(self, clave) -> bool:
+        """Indica si la fila cae dentro de lo ya cargado (antes del cursor de la página siguiente)."""
+        if self._siguiente is None:
+            return True
+        llave = self._llave()
+        return not llave(self._siguiente) < llave(clave)
+
+    def _colocar(self, fila, clave):
+        """Inserta la fila en su posición, o la mueve y actualiza si ya se muestra."""
+        fila_id = clave[1]
+        anterior = self._clave_por_id.pop(fila_id, None)
+        if anterior is not None:
+            del self._claves[self._posicion(anterior)]
+        indice = self._posicion(clave)
+        self._claves.insert(indice, clave)
+        self._clave_por_id[fila_id] = clave
+
+        valores = self.formatear(fila)
+        if anterior is not None:
+            # move + item conserva la selección del usuario, a diferencia de borrar e insertar
+            self.treeview.move(fila_id, "", indice)
+            self.treeview.item(fila_id, values=valores)
+        else:
+            self.treeview.insert("", indice, iid=fila_id, values=valores)
+
+    def _quitar(self, fila_id):
+        anterior = self._clave_por_id.pop(fila_id, None)
+        if anterior is not None:
+            del self._claves[self._posicion(anterior)]
+            self.treeview.delete(fila_id)
+
+    def _al_desplazar(self, primero, ultimo):
+        self.scrollbar.set(primero, ultimo)
+        if float(ultimo) >= self.UMBRAL_DESPLAZAMIENTO:
+            self.cargar_mas()
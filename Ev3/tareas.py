@@ -0,0 +1,223 @@
+"""
+Ejecución de operaciones largas fuera del hilo de la interfaz.
+
+Tkinter no se puede usar desde otros hilos: el trabajo corre en un hilo aparte
+y sus avisos vuelven por una cola que la interfaz revisa con `after()`.
+"""
+
+import queue
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from sqlalchemy.orm import Session, scoped_session
+from database import SessionLocal
+
+
+class ControlTarea:
+    """Canal entre la tarea y la interfaz: avisos de avance y pedido de cancelación."""
+
+    def __init__(self):
+        self._cancelar = threading.Event()
+        self._cola = queue.Queue()
+
+    @property
+    def cancelada(self) -> bool:
+        return self._cancelar.is_set()
+
+    def cancelar(self) -> None:
+        """Pide a la tarea que se detenga en su próximo punto de control."""
+        self._cancelar.set()
+
+    def informar(self, **datos) -> bool:
+        """Envía datos de avance a la interfaz. Retorna False si se pidió cancelar."""
+        self._cola.put(("progreso", datos))
+        return not self.cancelada
+
+
+class TareaSegundoPlano:
+    """Ejecuta `funcion(control)` en un hilo y entrega avance y resultado en el hilo de Tk.
+
+    La función recibe un ControlTarea: debe llamar a `control.informar(...)` para
+    reportar avance y detenerse cuando retorne False. Los callbacks se ejecutan
+    siempre en el hilo de la interfaz; de varios avisos de avance acumulados
+    entre revisiones solo se entrega el último.
+    """
+
+    INTERVALO_MS = 100  # Cada cuánto la interfaz revisa la cola
+
+    def __init__(self, widget, funcion: Callable[[ControlTarea], Any],
+                 al_progreso: Optional[Callable[[dict], None]] = None,
+                 al_terminar: Optional[Callable[[Any], None]] = None,
+                 al_error: Optional[Callable[[Exception], None]] = None):
+        self.widget = widget
+        self.funcion = funcion
+        self.al_progreso = al_progreso
+        self.al_terminar = al_terminar
+        self.al_error = al_error
+        self.control = ControlTarea()
+        self._hilo = None
+        self._terminada = False
+
+    @property
+    def en_curso(self) -> bool:
+        return self._hilo is not None and not self._terminada
+
+    def iniciar(self) -> "TareaSegundoPlano":
+        self._hilo = threading.Thread(target=self._ejecutar, daemon=True)
+        self._hilo.start()
+        self.widget.after(self.INTERVALO_MS, self._revisar)
+        return self
+
+    def cancelar(self) -> None:
+        self.control.cancelar()
+
+    def _ejecutar(self):
+        """Cuerpo del hilo: nunca toca widgets, solo deja mensajes en la cola."""
+        try:
+            self.control._cola.put(("resultado", self.funcion(self.control)))
+        except Exception as e:
+            self.control._cola.put(("error", e))
+
+    def _revisar(self):
+        """Procesa los mensajes pendientes en el hilo de Tk y reprograma la revisión."""
+        progreso, final = None, None
+        try:
+            while True:
+                tipo, dato = self.control._cola.get_nowait()
+                if tipo == "progreso":
+                    progreso = dato
+                else:
+                    final = (tipo, dato)
+        except queue.Empty:
+            pass
+
+        if progreso is not None and self.al_progreso:
+            self.al_progreso(progreso)
+
+        if final is None:
+            self.widget.after(self.INTERVALO_MS, self._revisar)
+            return
+
+        self._terminada = True
+        tipo, dato = final
+        if tipo == "resultado" and self.al_terminar:
+            self.al_terminar(dato)
+        elif tipo == "error" and self.al_error:
+            self.al_error(dato)
+
+
+class ServicioDatos:
+    """Ejecuta las consultas de la interfaz en un grupo acotado de hilos.
+
+    `ejecutar(operacion, ...)` llama a `operacion(db)` en un hilo del grupo con la
+    sesión propia de ese hilo y entrega el resultado en el hilo de Tk. La sesión
+    se cierra al terminar, así que la operación debe retornar datos simples
+    (tuplas, dicts) y no objetos ORM que luego haya que leer desde la interfaz.
+
+    Con `clave`, cada solicitud deja obsoletas las anteriores de la misma clave
+    (p. ej. varios "Refrescar" seguidos): sus resultados se descartan sin llamar
+    a los callbacks. Las escrituras se envían sin clave y nunca se descartan.
+    """
+
+    INTERVALO_MS = 50  # Cada cuánto la interfaz revisa la cola mientras hay trabajo
+    HILOS = 3          # Suficiente para que una consulta lenta no frene a las demás
+
+    def __init__(self, widget, fabrica_sesiones=SessionLocal, hilos: int = None,
+                 al_cambiar_pendientes: Optional[Callable[[int], None]] = None):
+        self.widget = widget
+        self.al_cambiar_pendientes = al_cambiar_pendientes
+        self._ejecutor = ThreadPoolExecutor(max_workers=hilos or self.HILOS, thread_name_prefix="datos")
+        # Una sesión por hilo: las sesiones de SQLAlchemy no se comparten entre hilos
+        self._sesiones = scoped_session(fabrica_sesiones)
+        self._cola = queue.Queue()
+        self._numeros = itertools.count(1)
+        self._callbacks = {}   # numero -> (clave, al_terminar, al_error)
+        self._ultima = {}      # clave -> número de la solicitud más reciente
+        self._revisando = False
+        self._cerrado = False
+        self.descartados = 0
+
+    @property
+    def pendientes(self) -> int:
+        """Solicitudes enviadas cuyo resultado aún no se entrega."""
+        return len(self._callbacks)
+
+    def en_curso(self, clave: str) -> bool:
+        """Indica si la última solicitud con esa clave sigue sin resultado."""
+        return clave in self._ultima
+
+    def ejecutar(self, operacion: Callable[[Session], Any],
+                 al_terminar: Optional[Callable[[Any], None]] = None,
+                 al_error: Optional[Callable[[Exception], None]] = None,
+                 clave: Optional[str] = None) -> int:
+        """Envía `operacion(db)` al grupo de hilos. Retorna el número de la solicitud."""
+        if self._cerrado:
+            raise RuntimeError("El servicio de datos está cerrado")
+
+        numero = next(self._numeros)
+        if clave is not None:
+            self._ultima[clave] = numero
+        self._callbacks[numero] = (clave, al_terminar, al_error)
+        self._avisar_pendientes()
+        self._ejecutor.submit(self._trabajar, numero, operacion)
+
+        if not self._revisando:
+            self._revisando = True
+            self.widget.after(self.INTERVALO_MS, self._revisar)
+        return numero
+
+    def cerrar(self) -> None:
+        """Descarta las solicitudes en espera y deja de entregar resultados."""
+        self._cerrado = True
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)
+
+    def _trabajar(self, numero: int, operacion):
+        """Cuerpo del hilo: nunca toca widgets, solo deja el resultado en la cola."""
+        db = self._sesiones()
+        try:
+            mensaje = ("resultado", operacion(db))
+        except Exception as e:
+            mensaje = ("error", e)
+        finally:
+            # Cierra la sesión del hilo; la próxima operación parte sin estado previo
+            self._sesiones.remove()
+        self._cola.put((numero,) + mensaje)
+
+    def _avisar_pendientes(self):
+        if self.al_cambiar_pendientes:
+            self.al_cambiar_pendientes(self.pendientes)
+
+    def _revisar(self):
+        """Entrega en el hilo de Tk los resultados listos; solo revisa mientras hay trabajo."""
+        if self._cerrado:
+            self._revisando = False
+            return
+
+        antes = self.pendientes
+        entregas = []
+        try:
+            while True:
+                numero, tipo, dato = self._cola.get_nowait()
+                clave, al_terminar, al_error = self._callbacks.pop(numero)
+                if clave is not None:
+                    if self._ultima.get(clave) != numero:
+                        # Una solicitud más nueva con la misma clave la reemplazó
+                        self.descartados += 1
+                        continue
+                    del self._ultima[clave]
+                callback = al_terminar if tipo == "resultado" else al_error
+                if callback:
+                    entregas.append((callback, dato))
+        except queue.Empty:
+            pass
+
+        # Reprogramar antes de los callbacks: si uno falla, la revisión sigue activa
+        self._revisando = bool(self._callbacks)
+        if self._revisando:
+            self.widget.after(self.INTERVALO_MS, self._revisar)
+        if self.pendientes != antes:
+            self._avisar_pendientes()
+
+        for callback, dato in entregas:
+            callback(dato)
@@ -8,11 +8,12 @@ from crud.cliente_crud import ClienteCRUD
 from crud.ingrediente_crud import IngredienteCRUD
 from crud.menu_crud import MenuCRUD
 from crud.pedido_crud import PedidoCRUD
+from migraciones import inicializar_base_datos
 import os
 import tempfile
 
-# Crear las tablas si no existen
-Base.metadata.create_all(bind=engine)
+# Crear las tablas si no existen y aplicar migraciones
+inicializar_base_datos()
 
 def test_database_errors():
     """Prueba manejo de errores relacionados con la base de datos."""
@@ -317,6 +318,8 @@ def test_csv_errors():
             print(f"✓ CSV con errores procesado: {resultados['errores']} errores detectados")
             if resultados['errores'] > 0:
                 print("✓ Errores correctamente registrados en el resultado")
+            if resultados['archivo_errores']:
+                os.unlink(resultados['archivo_errores'])
         except Exception as e:
             print(f"Error inesperado: {e}")
         finally:
@@ -0,0 +1,1565 @@
+"""
+Script para probar el rendimiento de las operaciones del sistema de restaurante.
+Verifica que las operaciones críticas no dependan del volumen de datos.
+
+Cada prueba trabaja sobre una base temporal nueva: proyecto.db no se toca y
+las pruebas se pueden repetir. Uso (desde la carpeta Ev3):
+    python -m pytest test_rendimiento.py -s
+"""
+
+import sys
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from database import crear_motor, SesionRestaurante
+from crud.cliente_crud import ClienteCRUD
+from crud.ingrediente_crud import IngredienteCRUD
+from crud.menu_crud import MenuCRUD
+from crud.pedido_crud import PedidoCRUD
+from migraciones import inicializar_base_datos
+from cache import cache_lecturas
+from consumo import porciones_menus
+
+# Las pruebas cuentan consultas y releen datos recién escritos: sin caché de lecturas
+cache_lecturas.activa = False
+
+
+@pytest.fixture
+def motor(tmp_path):
+    """Motor sobre una base temporal con el esquema al día."""
+    motor = crear_motor(f"sqlite:///{tmp_path}/t.db")
+    inicializar_base_datos(motor)
+    # Las cachés del proceso se guían por ids y versiones, que se repiten entre bases
+    cache_lecturas.limpiar()
+    porciones_menus.limpiar()
+    yield motor
+    motor.dispose()
+
+
+@pytest.fixture
+def sesiones(motor):
+    """Fábrica de sesiones de la base temporal, configurada como SessionLocal."""
+    return sessionmaker(autoflush=False, bind=motor, class_=SesionRestaurante)
+
+
+@pytest.fixture
+def db(sesiones):
+    db = sesiones()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def otra(sesiones):
+    """Segunda sesión sobre la misma base: hace de otra terminal."""
+    otra = sesiones()
+    yield otra
+    otra.close()
+
+
+@pytest.fixture
+def cliente(db):
+    return ClienteCRUD.crear_cliente(db, "11111111-1", "Cliente Prueba")
+
+
+@pytest.fixture
+def crear_ingredientes(db):
+    """Crea ingredientes a partir de {nombre: stock} y retorna {nombre: id}."""
+    def crear(stocks: dict, unidad: str = "gramos") -> dict:
+        return {nombre: IngredienteCRUD.crear_ingrediente(db, nombre, stock, unidad).id
+                for nombre, stock in stocks.items()}
+    return crear
+
+
+@pytest.fixture
+def crear_menu(db):
+    """Crea un menú de prueba y retorna su id."""
+    def crear(nombre: str, precio: float = 1000.0, receta: dict = None, **kwargs) -> int:
+        return MenuCRUD.crear_menu(db, nombre, "Menú de prueba", precio, receta=receta, **kwargs).id
+    return crear
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias SQL y los commits ejecutados por el motor mientras está activo."""
+
+    def __init__(self, motor):
+        self.motor = motor
+        self.sentencias = []
+        self.parametros = []
+        self.commits = 0
+
+    def _registrar(self, conn, cursor, statement, parameters, context, executemany):
+        self.sentencias.append(statement)
+        # En executemany se guarda el primer juego de parámetros
+        self.parametros.append(parameters[0] if executemany and parameters else parameters)
+
+    def _contar_commit(self, conn):
+        self.commits += 1
+
+    def __enter__(self):
+        event.listen(self.motor, "before_cursor_execute", self._registrar)
+        event.listen(self.motor, "commit", self._contar_commit)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.motor, "before_cursor_execute", self._registrar)
+        event.remove(self.motor, "commit", self._contar_commit)
+
+    @property
+    def total(self) -> int:
+        return len(self.sentencias)
+
+
+def test_consultas_crear_pedido(motor, db, cliente, crear_ingredientes, crear_menu):
+    """Verifica que crear un pedido use las mismas consultas sin importar el tamaño del carrito."""
+    print("\n=== TESTING CONSULTAS CREAR PEDIDO ===")
+
+    crear_ingredientes({f"Ingrediente Rendimiento {i}": 1000.0 for i in range(10)})
+    # Cada menú usa su ingrediente y, desde el segundo, también el primero
+    menu_ids = [
+        crear_menu(f"Menú Rendimiento {i}", 1000.0 + i,
+                   receta={f"Ingrediente Rendimiento {i}": 10.0, **({"Ingrediente Rendimiento 0": 1.0} if i else {})})
+        for i in range(10)
+    ]
+    cliente_id = cliente.id
+
+    # Pedido de una sola línea
+    with ContadorConsultas(motor) as una_linea:
+        PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": menu_ids[0], "cantidad": 1}])
+
+    # Pedido de diez líneas
+    with ContadorConsultas(motor) as diez_lineas:
+        PedidoCRUD.crear_pedido(
+            db, cliente_id, [{"menu_id": menu_id, "cantidad": 2} for menu_id in menu_ids]
+        )
+
+    assert diez_lineas.total == una_linea.total, (
+        f"Consultas: {una_linea.total} (1 línea) vs {diez_lineas.total} (10 líneas)"
+    )
+    print(f"✓ Consultas constantes por pedido: {diez_lineas.total}")
+
+    # El stock se descuenta según todas las recetas del pedido
+    ingrediente = IngredienteCRUD.obtener_ingrediente_por_nombre(db, "Ingrediente Rendimiento 0")
+    assert ingrediente.stock == 1000.0 - 10.0 - 10.0 * 2 - 1.0 * 2 * 9
+    print(f"✓ Stock descontado correctamente: {ingrediente.stock}")
+
+    # Stock insuficiente mantiene el mensaje de error original
+    with pytest.raises(Exception, match="Stock insuficiente para 'Ingrediente Rendimiento 1'") as error:
+        PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": menu_ids[1], "cantidad": 500}])
+    print(f"✓ Stock insuficiente detectado: {error.value}")
+
+
+def test_totales_guardados_pedido(db, cliente, crear_menu):
+    """Verifica que total y cantidad de items del pedido se mantengan al modificar sus items."""
+    print("\n=== TESTING TOTALES GUARDADOS DEL PEDIDO ===")
+
+    menu_a_id = crear_menu("Menú Totales A", 1000.0)
+    menu_b_id = crear_menu("Menú Totales B", 2500.0)
+
+    pedido = PedidoCRUD.crear_pedido(db, cliente.id, [{"menu_id": menu_a_id, "cantidad": 2}])
+    pedido_id = pedido.id
+    assert (pedido.total, pedido.cantidad_items) == (2000.0, 2)
+    print(f"✓ Totales al crear: ${pedido.total}, {pedido.cantidad_items} menú(s)")
+
+    item_b = PedidoCRUD.agregar_item(db, pedido_id, menu_b_id, 1)
+    PedidoCRUD.agregar_item(db, pedido_id, menu_a_id, 1)
+    PedidoCRUD.actualizar_cantidad_item(db, item_b.id, 3)
+    pedido = PedidoCRUD.obtener_pedido_por_id(db, pedido_id)
+    assert (pedido.total, pedido.cantidad_items) == (3000.0 + 7500.0, 6)
+    print(f"✓ Totales tras modificar items: ${pedido.total}, {pedido.cantidad_items} menú(s)")
+
+    PedidoCRUD.eliminar_item(db, item_b.id)
+    assert PedidoCRUD.calcular_total(db, pedido_id) == 3000.0
+    print("✓ Totales tras eliminar item correctos")
+
+    # Cambiar el precio del menú no altera los pedidos ya registrados
+    MenuCRUD.actualizar_menu(db, menu_a_id, precio=9999.0)
+
+    # El recálculo completo coincide con los valores mantenidos al escribir
+    PedidoCRUD.recalcular_totales(db)
+    pedido = PedidoCRUD.obtener_pedido_por_id(db, pedido_id)
+    assert (pedido.total, pedido.cantidad_items) == (3000.0, 3)
+    print("✓ Recálculo de totales consistente")
+
+
+def test_totales_al_eliminar_menu(db, cliente, crear_menu):
+    """Verifica que eliminar un menú corrija los totales guardados de los pedidos que lo tenían."""
+    print("\n=== TESTING TOTALES AL ELIMINAR MENÚ ===")
+
+    from datetime import date
+    from graficos import GraficosEstadisticos
+
+    menu_a_id = crear_menu("Menú Eliminado A", 500.0)
+    menu_b_id = crear_menu("Menú Eliminado B", 1000.0)
+    pedido_id = PedidoCRUD.crear_pedido(db, cliente.id, [
+        {"menu_id": menu_a_id, "cantidad": 1}, {"menu_id": menu_b_id, "cantidad": 2}
+    ]).id
+    solo_b_id = PedidoCRUD.crear_pedido(db, cliente.id, [{"menu_id": menu_b_id, "cantidad": 1}]).id
+
+    assert MenuCRUD.eliminar_menu(db, menu_b_id)
+    pedido = PedidoCRUD.obtener_pedido_por_id(db, pedido_id)
+    assert (pedido.total, pedido.cantidad_items) == (500.0, 1)
+    vacio = PedidoCRUD.obtener_pedido_por_id(db, solo_b_id)
+    assert (vacio.total, vacio.cantidad_items) == (0.0, 0)
+
+    # El listado y el resumen de ventas coinciden con lo que queda en los items
+    filas = {fila.id: fila.total for fila in PedidoCRUD.listar_pedidos(db, 10).filas}
+    assert filas == {pedido_id: 500.0, solo_b_id: 0.0}
+    hoy = date.today()
+    assert GraficosEstadisticos.obtener_ventas_por_fecha(db, "diario", hoy, hoy) == {hoy.isoformat(): 500.0}
+    print(f"✓ Totales corregidos tras eliminar un menú: ${pedido.total}, {pedido.cantidad_items} menú(s)")
+
+
+def test_ventas_agrupadas_en_sql(db, cliente, crear_menu):
+    """Verifica la agrupación de ventas por periodo y el filtro por rango de fechas."""
+    print("\n=== TESTING VENTAS AGRUPADAS EN SQL ===")
+
+    from datetime import date, datetime
+    from graficos import GraficosEstadisticos
+    from models import Pedido, ItemPedido
+    from crud.ventas_crud import VentasDiariasCRUD
+
+    menu_id = crear_menu("Menú Ventas", 10.0)
+    # Pedidos históricos aislados en el año 2001 (31/12/2001 es semana ISO 1)
+    for fecha, cantidad in [(datetime(2001, 1, 1, 9), 10), (datetime(2001, 1, 1, 20), 5),
+                            (datetime(2001, 2, 14, 13), 7), (datetime(2001, 12, 31, 12), 3)]:
+        pedido = Pedido(cliente_id=cliente.id, fecha=fecha, total=cantidad * 10.0, cantidad_items=cantidad)
+        pedido.items.append(ItemPedido(menu_id=menu_id, cantidad=cantidad, precio_unitario=10.0))
+        db.add(pedido)
+    db.commit()
+    # Los pedidos se insertaron directamente: regenerar el resumen diario
+    VentasDiariasCRUD.reconstruir(db)
+
+    desde, hasta = date(2001, 1, 1), date(2001, 12, 31)
+    diario = GraficosEstadisticos.obtener_ventas_por_fecha(db, "diario", desde, hasta)
+    assert diario == {"2001-01-01": 150.0, "2001-02-14": 70.0, "2001-12-31": 30.0}
+    print(f"✓ Ventas diarias: {diario}")
+
+    semanal = GraficosEstadisticos.obtener_ventas_por_fecha(db, "semanal", desde, hasta)
+    assert semanal == {"2001-S1": 180.0, "2001-S7": 70.0}
+    print(f"✓ Ventas semanales (semana ISO): {semanal}")
+
+    mensual = GraficosEstadisticos.obtener_ventas_por_fecha(db, "mensual", desde, date(2001, 2, 14))
+    assert mensual == {"2001-01": 150.0, "2001-02": 70.0}
+    print(f"✓ Ventas mensuales con rango: {mensual}")
+
+
+def test_resumen_ventas_diarias(db, cliente, crear_menu):
+    """Verifica que el resumen diario mantenido al escribir coincida con uno regenerado."""
+    print("\n=== TESTING RESUMEN DE VENTAS DIARIAS ===")
+
+    from graficos import GraficosEstadisticos
+    from models import VentaDiaria
+    from crud.ventas_crud import VentasDiariasCRUD
+
+    def resumen():
+        return sorted(
+            (str(v.fecha), v.menu_id, v.categoria, v.cantidad, round(v.total, 6))
+            for v in db.query(VentaDiaria).filter(VentaDiaria.cantidad != 0).all()
+        )
+
+    menu_a_id = crear_menu("Menú Resumen A", 1200.0, categoria="Pruebas")
+    menu_b_id = crear_menu("Menú Resumen B", 800.0, categoria="Pruebas")
+
+    pedido = PedidoCRUD.crear_pedido(db, cliente.id, [
+        {"menu_id": menu_a_id, "cantidad": 2}, {"menu_id": menu_b_id, "cantidad": 1}
+    ])
+    pedido_id = pedido.id
+    item_b = PedidoCRUD.agregar_item(db, pedido_id, menu_b_id, 2)
+    PedidoCRUD.actualizar_cantidad_item(db, item_b.id, 5)
+    otro = PedidoCRUD.crear_pedido(db, cliente.id, [{"menu_id": menu_a_id, "cantidad": 4}])
+    PedidoCRUD.eliminar_pedido(db, otro.id)
+
+    distribucion = GraficosEstadisticos.obtener_distribucion_menus(db)
+    assert distribucion["Menú Resumen A"] == 2 and distribucion["Menú Resumen B"] == 5
+    print(f"✓ Distribución desde el resumen: A={distribucion['Menú Resumen A']}, B={distribucion['Menú Resumen B']}")
+
+    # Un cambio de categoría alcanza a las ventas ya resumidas
+    MenuCRUD.actualizar_menu(db, menu_b_id, categoria="Pruebas Nuevas")
+    assert {v.categoria for v in db.query(VentaDiaria).filter(VentaDiaria.menu_id == menu_b_id)} == {"Pruebas Nuevas"}
+
+    incremental = resumen()
+    VentasDiariasCRUD.reconstruir(db)
+    assert incremental == resumen()
+    print("✓ Resumen incremental coincide con el regenerado")
+
+
+def test_consumo_ingredientes_vectorizado(db, cliente, crear_ingredientes, crear_menu):
+    """Verifica el consumo de ingredientes calculado con la matriz de recetas."""
+    print("\n=== TESTING CONSUMO DE INGREDIENTES ===")
+
+    from datetime import date
+    from graficos import GraficosEstadisticos
+
+    crear_ingredientes({"Harina Consumo": 5000.0, "Queso Consumo": 5000.0})
+    empanada_id = crear_menu("Empanada Consumo", 1500.0, receta={"Harina Consumo": 80.0, "Queso Consumo": 50.0})
+    pizza_id = crear_menu("Pizza Consumo", 6000.0, receta={"Harina Consumo": 300.0, "Queso Consumo": 200.0})
+
+    PedidoCRUD.crear_pedido(db, cliente.id, [
+        {"menu_id": empanada_id, "cantidad": 3}, {"menu_id": pizza_id, "cantidad": 1}
+    ])
+    PedidoCRUD.crear_pedido(db, cliente.id, [{"menu_id": pizza_id, "cantidad": 2}])
+
+    uso = GraficosEstadisticos.obtener_uso_ingredientes(db)
+    assert uso["Harina Consumo"] == 3 * 80.0 + 3 * 300.0
+    assert uso["Queso Consumo"] == 3 * 50.0 + 3 * 200.0
+    print(f"✓ Consumo total: Harina={uso['Harina Consumo']}, Queso={uso['Queso Consumo']}")
+
+    por_menu = GraficosEstadisticos.obtener_uso_ingredientes(db, menu_id=empanada_id)
+    assert por_menu == {"Harina Consumo": 240.0, "Queso Consumo": 150.0}
+    print(f"✓ Consumo por menú: {por_menu}")
+
+    fuera_de_rango = GraficosEstadisticos.obtener_uso_ingredientes(
+        db, desde=date(2001, 1, 1), hasta=date(2001, 1, 2), menu_id=pizza_id
+    )
+    assert fuera_de_rango == {}
+    print("✓ Consumo por rango de fechas sin ventas vacío")
+
+
+def test_migracion_nombres_repetidos(motor):
+    """Verifica que la migración del nombre único se detenga y liste los ingredientes repetidos."""
+    print("\n=== TESTING MIGRACIÓN CON NOMBRES REPETIDOS ===")
+
+    from sqlalchemy import text
+    from migraciones import aplicar_migraciones
+
+    # Base anterior a la migración 11: índice sin unicidad y dos "harina" en unidades distintas
+    with motor.begin() as conexion:
+        conexion.execute(text('DROP INDEX "ix_Ingredientes_nombre_normalizado"'))
+        conexion.execute(text('CREATE INDEX "ix_Ingredientes_nombre_normalizado" ON "Ingredientes" (nombre_normalizado)'))
+        conexion.execute(text('''
+            INSERT INTO "Ingredientes" (nombre, stock, unidad, nombre_normalizado, actualizado_en)
+            VALUES ('Harina', 2.0, 'kg', 'harina', 0), ('harina ', 500.0, 'gramos', 'harina', 0)
+        '''))
+        conexion.execute(text("PRAGMA user_version = 10"))
+
+    with pytest.raises(Exception, match=r"Renombre o elimine(.|\n)*'Harina' \(kg\), \d+ 'harina ' \(gramos\)"):
+        aplicar_migraciones(motor)
+
+    with motor.connect() as conexion:
+        assert conexion.execute(text("PRAGMA user_version")).scalar() == 10
+        assert conexion.execute(text('SELECT COUNT(*) FROM "Ingredientes"')).scalar() == 2
+    print("✓ La migración se detiene sin tocar los ingredientes repetidos")
+
+
+def test_receta_normalizada(db, crear_ingredientes, tmp_path):
+    """Verifica las recetas guardadas en RecetaIngredientes y su migración desde JSON."""
+    print("\n=== TESTING RECETAS NORMALIZADAS ===")
+
+    from sqlalchemy import text
+    from models import RecetaIngrediente
+
+    arroz_id = crear_ingredientes({"Arroz Receta": 1000.0, "Pollo Receta": 1000.0, "Arveja Receta": 1000.0})["Arroz Receta"]
+
+    menu = MenuCRUD.crear_menu(db, "Arroz con Pollo Receta", "Menú de prueba", 5000.0,
+                               receta={"Arroz Receta": 150.0, "Pollo Receta": 200.0})
+    menu_id = menu.id
+    assert menu.receta == {"Arroz Receta": 150.0, "Pollo Receta": 200.0}
+    print(f"✓ Receta guardada por ingrediente: {menu.receta}")
+
+    # La actualización modifica, agrega y elimina filas en su lugar
+    menu = MenuCRUD.actualizar_menu(db, menu_id, receta={"Arroz Receta": 120.0, "Arveja Receta": 30.0})
+    assert menu.receta == {"Arroz Receta": 120.0, "Arveja Receta": 30.0}
+    filas = db.query(RecetaIngrediente).filter(RecetaIngrediente.menu_id == menu_id).count()
+    assert filas == 2
+    print(f"✓ Receta actualizada: {menu.receta}")
+
+    with pytest.raises(Exception, match="no existe") as error:
+        MenuCRUD.actualizar_menu(db, menu_id, receta={"Ingrediente Fantasma": 1.0})
+    print(f"✓ Ingrediente inexistente rechazado: {error.value}")
+
+    with pytest.raises(Exception, match="Arroz con Pollo Receta") as error:
+        IngredienteCRUD.eliminar_ingrediente(db, arroz_id)
+    print(f"✓ Ingrediente en uso protegido: {error.value}")
+
+    MenuCRUD.eliminar_menu(db, menu_id)
+    assert db.query(RecetaIngrediente).filter(RecetaIngrediente.menu_id == menu_id).count() == 0
+    assert IngredienteCRUD.eliminar_ingrediente(db, arroz_id)
+    print("✓ Filas de receta eliminadas junto con el menú")
+
+    # Migración de una base con recetas en la columna JSON
+    antigua = crear_motor(f"sqlite:///{tmp_path}/antigua.db")
+    with antigua.begin() as conexion:
+        conexion.execute(text(
+            'CREATE TABLE "Ingredientes" (id INTEGER PRIMARY KEY, nombre VARCHAR NOT NULL UNIQUE, '
+            'stock FLOAT, unidad VARCHAR NOT NULL)'
+        ))
+        conexion.execute(text(
+            'CREATE TABLE "Menus" (id INTEGER PRIMARY KEY, nombre VARCHAR NOT NULL, descripcion VARCHAR, '
+            'precio FLOAT NOT NULL, categoria VARCHAR, disponible INTEGER, receta JSON)'
+        ))
+        conexion.execute(text(
+            "INSERT INTO \"Ingredientes\" VALUES (1, 'Pan', 10, 'unidades'), (2, 'Carne', 5000, 'gramos')"
+        ))
+        conexion.execute(text(
+            "INSERT INTO \"Menus\" VALUES "
+            "(1, 'Churrasco', NULL, 5000, NULL, 1, '{\"Pan\": 1, \"Carne\": 150.0, \"Palta\": 40}'), "
+            "(2, 'Bebida', NULL, 1000, NULL, 1, 'null')"
+        ))
+    inicializar_base_datos(antigua)
+    with antigua.connect() as conexion:
+        filas = conexion.execute(text(
+            'SELECT menu_id, ingrediente_id, cantidad FROM "RecetaIngredientes" ORDER BY ingrediente_id'
+        )).all()
+    antigua.dispose()
+    assert [tuple(f) for f in filas] == [(1, 1, 1.0), (1, 2, 150.0)]
+    print(f"✓ Recetas JSON migradas (ingrediente inexistente omitido): {len(filas)} filas")
+
+
+def test_motor_concurrente_y_reintentos(motor):
+    """Verifica los PRAGMAs del perfil concurrente y el reintento ante base ocupada."""
+    print("\n=== TESTING MOTOR CONCURRENTE ===")
+
+    import sqlite3
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    import database
+
+    if database.PERFIL_PRAGMAS == "concurrente" and motor.url.get_backend_name() == "sqlite":
+        with motor.connect() as conexion:
+            assert conexion.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+            assert conexion.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        print("✓ PRAGMAs del perfil concurrente aplicados")
+
+    intentos = []
+
+    @database.reintentar_si_ocupado
+    def escribir():
+        intentos.append(1)
+        if len(intentos) < 3:
+            try:
+                raise OperationalError("COMMIT", {}, sqlite3.OperationalError("database is locked"))
+            except OperationalError as e:
+                # Igual que los CRUD: el error original queda como contexto
+                raise Exception(f"Error al crear pedido: {str(e)}")
+        return "ok"
+
+    assert escribir() == "ok" and len(intentos) == 3
+    print(f"✓ Operación reintentada tras base ocupada: {len(intentos)} intentos")
+
+    @database.reintentar_si_ocupado
+    def invalida():
+        intentos.append(1)
+        raise ValueError("dato inválido")
+
+    intentos.clear()
+    with pytest.raises(ValueError):
+        invalida()
+    assert len(intentos) == 1
+    print("✓ Errores que no son de bloqueo no se reintentan")
+
+
+def test_reintento_por_lote(motor, db, tmp_path, monkeypatch):
+    """Verifica que una importación repita solo el lote cuyo commit encontró la base ocupada."""
+    print("\n=== TESTING REINTENTO POR LOTE ===")
+
+    import sqlite3
+    from sqlalchemy.exc import OperationalError
+    from models import Ingrediente
+
+    archivo = str(tmp_path / "ocupada.csv")
+    with open(archivo, "w", encoding="utf-8", newline="") as f:
+        f.write("nombre,stock,unidad\n")
+        for i in range(30):
+            f.write(f"Ocupada {i},{i + 1}.0,gramos\n")
+
+    commit_original = db.commit
+    commits = []
+
+    def commit_ocupado():
+        commits.append(1)
+        if len(commits) == 2:  # Falla una vez el commit del segundo lote
+            raise OperationalError("COMMIT", {}, sqlite3.OperationalError("database is locked"))
+        commit_original()
+
+    monkeypatch.setattr(db, "commit", commit_ocupado)
+    with ContadorConsultas(motor) as consultas:
+        resultados = IngredienteCRUD.cargar_desde_csv(db, archivo, tamano_lote=10)
+
+    assert resultados["exitosos"] == 30 and resultados["errores"] == 0
+    # Tres lotes más la repetición del segundo; el primero no se vuelve a escribir
+    upserts = [s for s in consultas.sentencias if s.startswith("INSERT")]
+    assert len(upserts) == 4 and len(commits) == 4
+    assert db.query(Ingrediente).filter(Ingrediente.nombre.like("Ocupada %")).count() == 30
+    print(f"✓ Solo se repitió el lote con la base ocupada ({len(upserts)} upserts)")
+
+
+def planes_con_scan(motor, sentencias, parametros) -> list:
+    """Ejecuta EXPLAIN QUERY PLAN sobre las lecturas/escrituras registradas y
+    retorna las que recorren una tabla completa como (sentencia, detalle).
+    """
+    con_scan = []
+    with motor.connect() as conexion:
+        for sentencia, parametros_sentencia in zip(sentencias, parametros):
+            if not sentencia.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            plan = conexion.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {sentencia}", parametros_sentencia or ()
+            ).all()
+            for fila in plan:
+                detalle = fila[-1]
+                if detalle.startswith("SCAN ") and not detalle.startswith("SCAN CONSTANT ROW"):
+                    con_scan.append((" ".join(sentencia.split()), detalle))
+    return con_scan
+
+
+def test_planes_consulta_sin_scan(motor, db):
+    """Verifica con EXPLAIN QUERY PLAN que las consultas CRUD usen índices.
+
+    Los listados completos (obtener_todos_*) y los recálculos masivos recorren
+    las tablas a propósito y no se incluyen.
+    """
+    print("\n=== TESTING PLANES DE CONSULTA ===")
+
+    with ContadorConsultas(motor) as consultas:
+        cliente = ClienteCRUD.crear_cliente(db, "77777777-7", "Cliente Planes", "planes@correo.cl")
+        cliente_id = cliente.id
+        ClienteCRUD.obtener_cliente_por_id(db, cliente_id)
+        ingrediente = IngredienteCRUD.crear_ingrediente(db, "Ingrediente Planes", 1000.0, "gramos")
+        ingrediente_id = ingrediente.id
+        IngredienteCRUD.obtener_ingrediente_por_nombre(db, "Ingrediente Planes")
+        menu = MenuCRUD.crear_menu(db, "Menú Planes", "Menú de prueba", 1000.0,
+                                   categoria="Planes", receta={"Ingrediente Planes": 5.0})
+        menu_id = menu.id
+        MenuCRUD.obtener_menus_disponibles(db)
+        MenuCRUD.obtener_menus_por_categoria(db, "Planes")
+
+        pedido = PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": menu_id, "cantidad": 1}])
+        pedido_id = pedido.id
+        PedidoCRUD.obtener_pedidos_por_cliente(db, cliente_id)
+        item = PedidoCRUD.agregar_item(db, pedido_id, menu_id, 2)
+        PedidoCRUD.actualizar_cantidad_item(db, item.id, 4)
+        PedidoCRUD.eliminar_item(db, item.id)
+        PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": menu_id, "cantidad": 1}])
+        PedidoCRUD.eliminar_pedido(db, pedido_id)
+
+        MenuCRUD.eliminar_menu(db, menu_id)
+        IngredienteCRUD.eliminar_ingrediente(db, ingrediente_id)
+        ClienteCRUD.eliminar_cliente(db, cliente_id)
+
+    con_scan = planes_con_scan(motor, consultas.sentencias, consultas.parametros)
+    for sentencia, detalle in con_scan:
+        print(f"✗ {detalle}: {sentencia}")
+    assert not con_scan, f"{len(con_scan)} consulta(s) recorren tablas completas"
+    print(f"✓ {consultas.total} sentencias revisadas, ninguna recorre una tabla completa")
+
+
+def test_listado_pedidos_paginado(motor, db, cliente):
+    """Verifica la paginación por cursor (fecha, id) y los filtros del listado de pedidos."""
+    print("\n=== TESTING LISTADO DE PEDIDOS PAGINADO ===")
+
+    from datetime import date, datetime, timedelta
+    from sqlalchemy import insert
+    from models import Pedido
+
+    cliente_id = cliente.id
+    # 25 pedidos en 2002; cada fecha se repite en dos pedidos para probar el desempate por id
+    inicio = datetime(2002, 3, 1, 12, 0)
+    db.execute(insert(Pedido.__table__), [
+        {"cliente_id": cliente_id, "fecha": inicio + timedelta(hours=i // 2),
+         "estado": "Completado" if i % 5 == 0 else "Pendiente", "total": 100.0 * i,
+         "cantidad_items": i}
+        for i in range(25)
+    ])
+    db.commit()
+
+    vistos = []
+    cursor = None
+    paginas = 0
+    while True:
+        with ContadorConsultas(motor) as consultas:
+            pagina = PedidoCRUD.listar_pedidos(db, 10, despues_de=cursor, cliente_id=cliente_id)
+        assert consultas.total == 1, consultas.sentencias
+        vistos.extend(pagina.filas)
+        paginas += 1
+        cursor = pagina.siguiente
+        if cursor is None:
+            break
+
+    assert paginas == 3 and len(vistos) == 25
+    assert len({fila.id for fila in vistos}) == 25
+    claves = [(fila.fecha, fila.id) for fila in vistos]
+    assert claves == sorted(claves, reverse=True)
+    assert vistos[0].cliente == "Cliente Prueba"
+    print(f"✓ {len(vistos)} pedidos en {paginas} páginas, una consulta por página, sin repetir")
+
+    completados = PedidoCRUD.listar_pedidos(db, 100, cliente_id=cliente_id, estado="Completado")
+    assert len(completados.filas) == 5 and completados.siguiente is None
+    print("✓ Filtro por estado correcto")
+
+    primer_dia = PedidoCRUD.listar_pedidos(db, 100, desde=date(2002, 3, 1), hasta=date(2002, 3, 1))
+    assert len(primer_dia.filas) == 24  # Las 12 horas del 1 de marzo; el resto cae el día 2
+    print("✓ Filtro por rango de fechas correcto")
+
+
+def test_carga_csv_por_lotes(motor, db, tmp_path):
+    """Verifica la importación CSV por lotes con upsert y archivo de errores."""
+    print("\n=== TESTING CARGA CSV POR LOTES ===")
+
+    import csv
+    import os
+
+    archivo = str(tmp_path / "catalogo.csv")
+    with open(archivo, "w", encoding="utf-8", newline="") as f:
+        f.write("nombre;stock;unidad\n")
+        for i in range(2500):
+            if i % 500 == 7:
+                f.write(f"Lote CSV {i};abc;gramos\n")  # Stock inválido
+            else:
+                f.write(f"Lote CSV {i};{i + 1}.0;gramos\n")
+        f.write("Lote CSV 3;999.0;kg\n")  # Repetido: actualiza al existente
+
+    with ContadorConsultas(motor) as consultas:
+        resultados = IngredienteCRUD.cargar_desde_csv(db, archivo, tamano_lote=1000)
+
+    assert resultados["exitosos"] == 2496 and resultados["errores"] == 5
+    # Tres lotes: un upsert por lote y ninguna consulta por fila
+    upserts = [s for s in consultas.sentencias if s.startswith("INSERT")]
+    versiones = [s for s in consultas.sentencias if "VersionesTablas" in s]
+    agotados = [s for s in consultas.sentencias if "agotado" in s]
+    # Cada lote revisa además los menús que usan sus ingredientes (ninguno aquí),
+    # de a TAMANO_LOTE_IDS nombres, y su commit incrementa el contador de versión de Ingredientes
+    assert len(upserts) == 3 and len(versiones) == 3 and len(agotados) == 5
+    assert consultas.total == 11
+    print(f"✓ {resultados['exitosos']} filas en {len(upserts)} upserts "
+          f"({resultados['filas_por_segundo']:.0f} filas/s)")
+
+    ingrediente = IngredienteCRUD.obtener_ingrediente_por_nombre(db, "Lote CSV 3")
+    assert (ingrediente.stock, ingrediente.unidad) == (999.0, "kg")
+    print("✓ Fila repetida actualiza el ingrediente existente")
+
+    with open(resultados["archivo_errores"], encoding="utf-8") as f:
+        errores = list(csv.reader(f))
+    assert errores[0] == ["fila", "error"] and len(errores) == 6
+    assert errores[1] == ["9", "Stock inválido: 'abc'"]
+    assert len(resultados["mensajes"]) <= 21
+    print(f"✓ Errores escritos en {os.path.basename(resultados['archivo_errores'])}")
+
+
+def test_carga_csv_nombres_normalizados(db, crear_ingredientes, crear_menu, tmp_path):
+    """Verifica que el CSV actualice ingredientes cuyo nombre solo difiere en mayúsculas o espacios."""
+    print("\n=== TESTING CARGA CSV CON NOMBRES NORMALIZADOS ===")
+
+    from models import Ingrediente, RecetaIngrediente
+
+    ids = crear_ingredientes({"Tomate": 10.0})
+    menu_id = crear_menu("Ensalada CSV", receta={"tomate": 2.0})
+
+    archivo = str(tmp_path / "normalizados.csv")
+    with open(archivo, "w", encoding="utf-8", newline="") as f:
+        f.write("nombre,stock,unidad\n")
+        f.write("tomate,20.0,gramos\n")
+        f.write("  TOMATE  ,30.0,kg\n")  # Repetido en el mismo lote: gana esta fila
+        f.write("Palta  Hass,5.0,unidades\n")
+        f.write("palta hass,6.0,unidades\n")
+
+    resultados = IngredienteCRUD.cargar_desde_csv(db, archivo)
+    assert resultados["errores"] == 0
+
+    tomates = db.query(Ingrediente).filter(Ingrediente.nombre_normalizado == "tomate").all()
+    assert len(tomates) == 1 and tomates[0].id == ids["Tomate"]
+    assert (tomates[0].nombre, tomates[0].stock, tomates[0].unidad) == ("Tomate", 30.0, "kg")
+    paltas = db.query(Ingrediente).filter(Ingrediente.nombre_normalizado == "palta hass").all()
+    assert len(paltas) == 1 and paltas[0].stock == 6.0
+    print("✓ Un solo ingrediente por nombre normalizado")
+
+    receta = db.query(RecetaIngrediente).filter(RecetaIngrediente.menu_id == menu_id).all()
+    assert [(r.ingrediente_id, r.cantidad) for r in receta] == [(ids["Tomate"], 2.0)]
+    print("✓ La receta sigue apuntando al ingrediente existente")
+
+
+def test_carga_csv_en_paralelo(db, tmp_path, monkeypatch):
+    """Verifica que la importación en paralelo dé el mismo resultado que la secuencial."""
+    print("\n=== TESTING CARGA CSV EN PARALELO ===")
+
+    import csv
+    from models import Ingrediente
+    import crud.ingrediente_crud as ingrediente_crud
+
+    def escribir(archivo, prefijo):
+        with open(archivo, "w", encoding="utf-8-sig", newline="") as f:
+            f.write("Nombre,Stock,Unidad\n")
+            for i in range(3000):
+                if i % 700 == 3:
+                    f.write(f"{prefijo} {i},,gramos\n")  # Stock vacío
+                elif i % 250 == 0:
+                    f.write("\n")  # Línea vacía: no cuenta como fila
+                else:
+                    # Los nombres se repiten a lo largo del archivo: gana la última fila
+                    f.write(f"{prefijo} {i % 400},{i}.0,gramos\n")
+
+    def estado(prefijo):
+        filas = db.query(Ingrediente).filter(Ingrediente.nombre.like(f"{prefijo} %")).all()
+        return {ing.nombre.split(" ")[-1]: (ing.stock, ing.unidad) for ing in filas}
+
+    monkeypatch.setattr(ingrediente_crud, "TAMANO_BLOQUE_CSV", 2048)  # Muchos bloques pequeños
+
+    resultados = {}
+    errores = {}
+    for prefijo, procesos in (("Secuencial", 1), ("Paralelo", 3)):
+        archivo = str(tmp_path / f"{prefijo}.csv")
+        escribir(archivo, prefijo)
+        resultados[prefijo] = IngredienteCRUD.cargar_desde_csv(
+            db, archivo, tamano_lote=500, procesos=procesos
+        )
+        with open(resultados[prefijo]["archivo_errores"], encoding="utf-8") as f:
+            errores[prefijo] = [fila[0] for fila in csv.reader(f)]
+
+    for clave in ("exitosos", "errores"):
+        assert resultados["Secuencial"][clave] == resultados["Paralelo"][clave]
+    assert errores["Secuencial"] == errores["Paralelo"]
+    assert estado("Secuencial") == estado("Paralelo")
+    assert estado("Paralelo")["5"] == (2805.0, "gramos")
+    print(f"✓ Paralelo igual a secuencial: {resultados['Paralelo']['exitosos']} filas, "
+          f"{resultados['Paralelo']['errores']} errores en las mismas filas")
+
+
+class WidgetFalso:
+    """Reemplaza a un widget de Tk: guarda los `after()` y los ejecuta a pedido."""
+
+    def __init__(self):
+        self.pendientes = []
+
+    def after(self, ms, funcion, *args):
+        self.pendientes.append((funcion, args))
+
+    def procesar(self, limite_segundos: float = 10.0):
+        """Ejecuta los callbacks programados hasta que no quede ninguno."""
+        import time
+        fin = time.time() + limite_segundos
+        while self.pendientes and time.time() < fin:
+            funcion, args = self.pendientes.pop(0)
+            funcion(*args)
+            time.sleep(0.01)
+        assert not self.pendientes, "La tarea no terminó a tiempo"
+
+
+def test_importacion_en_segundo_plano(db, sesiones, tmp_path):
+    """Verifica la importación CSV en un hilo con avance y cancelación."""
+    print("\n=== TESTING IMPORTACIÓN EN SEGUNDO PLANO ===")
+
+    import threading
+    from models import Ingrediente
+    from tareas import TareaSegundoPlano
+
+    archivo = str(tmp_path / "catalogo.csv")
+    with open(archivo, "w", encoding="utf-8") as f:
+        f.write("nombre,stock,unidad\n")
+        for i in range(5000):
+            f.write(f"Tarea CSV {i},{i + 1}.0,gramos\n")
+    assert IngredienteCRUD.contar_filas_csv(archivo) == 5000
+
+    hilo_interfaz = threading.current_thread()
+    eventos = {"progreso": [], "resultado": None, "hilos": set()}
+
+    def importar(control):
+        # La tarea corre en otro hilo: abre su propia sesión
+        sesion = sesiones()
+        try:
+            total = IngredienteCRUD.contar_filas_csv(archivo)
+            return IngredienteCRUD.cargar_desde_csv(
+                sesion, archivo, al_avanzar=lambda avance: control.informar(total=total, **avance)
+            )
+        finally:
+            sesion.close()
+
+    def al_progreso(avance):
+        eventos["hilos"].add(threading.current_thread())
+        eventos["progreso"].append(avance)
+
+    def al_terminar(resultados):
+        eventos["hilos"].add(threading.current_thread())
+        eventos["resultado"] = resultados
+
+    # Cancelada antes de empezar: se detiene después del primer lote confirmado
+    widget = WidgetFalso()
+    tarea = TareaSegundoPlano(widget, importar, al_progreso=al_progreso, al_terminar=al_terminar)
+    tarea.cancelar()
+    tarea.iniciar()
+    widget.procesar()
+
+    resultados = eventos["resultado"]
+    assert resultados["cancelado"] and resultados["exitosos"] == 1000
+    assert eventos["progreso"][-1]["total"] == 5000
+    assert eventos["hilos"] == {hilo_interfaz}
+    assert not tarea.en_curso
+    guardados = db.query(Ingrediente).filter(Ingrediente.nombre.like("Tarea CSV %")).count()
+    db.rollback()  # Termina la lectura para ver lo que confirme la importación siguiente
+    assert guardados == 1000
+    print(f"✓ Cancelación conserva los lotes confirmados: {guardados} filas")
+
+    # Sin cancelar: termina completa y los callbacks corren en el hilo de la interfaz
+    widget = WidgetFalso()
+    TareaSegundoPlano(widget, importar, al_progreso=al_progreso, al_terminar=al_terminar).iniciar()
+    widget.procesar()
+    assert eventos["resultado"]["exitosos"] == 5000 and not eventos["resultado"]["cancelado"]
+    print(f"✓ Importación completa: {eventos['resultado']['filas_por_segundo']:.0f} filas/s")
+
+    errores = []
+    widget = WidgetFalso()
+    TareaSegundoPlano(widget, lambda control: IngredienteCRUD.cargar_desde_csv(None, "no_existe.csv"),
+                      al_error=errores.append).iniciar()
+    widget.procesar()
+    assert len(errores) == 1 and "Archivo no encontrado" in str(errores[0])
+    print(f"✓ Error de la tarea entregado a la interfaz: {errores[0]}")
+
+
+def test_servicio_datos_en_hilos(sesiones):
+    """Verifica que el servicio de datos use una sesión por hilo y descarte resultados obsoletos."""
+    print("\n=== TESTING SERVICIO DE DATOS EN HILOS ===")
+
+    import threading
+    import time
+    from tareas import ServicioDatos
+
+    hilo_interfaz = threading.current_thread()
+    pendientes = []
+    widget = WidgetFalso()
+    servicio = ServicioDatos(widget, sesiones, hilos=3, al_cambiar_pendientes=pendientes.append)
+    eventos = {"resultados": [], "errores": [], "hilos": set()}
+
+    def al_terminar(resultado):
+        eventos["hilos"].add(threading.current_thread())
+        eventos["resultados"].append(resultado)
+
+    def al_error(error):
+        eventos["hilos"].add(threading.current_thread())
+        eventos["errores"].append(error)
+
+    try:
+        # Tres consultas a la vez: cada hilo trabaja con su propia sesión
+        barrera = threading.Barrier(3, timeout=5)
+
+        def sesion_del_hilo(db):
+            barrera.wait()
+            ClienteCRUD.obtener_todos_clientes(db)
+            return threading.get_ident(), id(db)
+
+        for _ in range(3):
+            servicio.ejecutar(sesion_del_hilo, al_terminar, al_error)
+        widget.procesar()
+        assert not eventos["errores"], eventos["errores"]
+        hilos = {hilo for hilo, _ in eventos["resultados"]}
+        sesiones_usadas = {sesion for _, sesion in eventos["resultados"]}
+        assert len(hilos) == 3 and len(sesiones_usadas) == 3
+        assert threading.get_ident() not in hilos
+        print("✓ Tres consultas simultáneas en tres hilos con tres sesiones distintas")
+
+        # Dos refrescos seguidos: el primero (más lento) queda obsoleto y se descarta
+        eventos["resultados"].clear()
+
+        def lenta(db):
+            time.sleep(0.3)
+            return "obsoleto"
+
+        servicio.ejecutar(lenta, al_terminar, al_error, clave="clientes")
+        assert servicio.en_curso("clientes")
+        servicio.ejecutar(lambda db: "vigente", al_terminar, al_error, clave="clientes")
+        widget.procesar()
+        assert eventos["resultados"] == ["vigente"], eventos["resultados"]
+        assert servicio.descartados == 1 and not servicio.en_curso("clientes")
+        print("✓ Resultado de un refresco reemplazado descartado")
+
+        # Los errores llegan a la interfaz y el estado de carga vuelve a cero
+        servicio.ejecutar(lambda db: ClienteCRUD.crear_cliente(db, "", ""), al_terminar, al_error)
+        widget.procesar()
+        assert len(eventos["errores"]) == 1 and "RUT" in str(eventos["errores"][0])
+        assert eventos["hilos"] == {hilo_interfaz}
+        assert max(pendientes) == 3 and pendientes[-1] == 0 and servicio.pendientes == 0
+        print(f"✓ Callbacks en el hilo de la interfaz; error entregado: {eventos['errores'][0]}")
+    finally:
+        servicio.cerrar()
+
+    with pytest.raises(RuntimeError):
+        servicio.ejecutar(lambda db: None)
+    print("✓ Servicio cerrado no acepta más solicitudes")
+
+
+def recorrer_paginas(listar, db, limite: int, **kwargs) -> list:
+    """Junta todas las filas de un listado paginado siguiendo los cursores."""
+    filas, cursor = [], None
+    while True:
+        pagina = listar(db, limite, cursor, **kwargs)
+        assert len(pagina.filas) <= limite
+        filas.extend(pagina.filas)
+        if pagina.siguiente is None:
+            return filas
+        cursor = pagina.siguiente
+
+
+def test_listados_paginados_ordenados(db):
+    """Verifica que los listados por cursor recorran todas las filas en el orden pedido."""
+    print("\n=== TESTING LISTADOS PAGINADOS ORDENADOS ===")
+
+    # Nombres repetidos y correos vacíos: el desempate por id y el coalesce no pierden filas
+    for i in range(12):
+        ClienteCRUD.crear_cliente(db, f"6{i:07d}-{i % 10}", f"Listado {i % 3}",
+                                  f"listado{i}@correo.cl" if i % 2 else None)
+        IngredienteCRUD.crear_ingrediente(db, f"Ingrediente Listado {i}", float(i % 4 + 1), "gramos")
+        MenuCRUD.crear_menu(db, f"Menú Listado {i}", "", 100.0 * (i % 5 + 1),
+                            categoria=None if i % 3 == 0 else f"Categoría {i % 2}")
+
+    clientes = [(c.id, c.rut, c.nombre, c.correo or "") for c in ClienteCRUD.obtener_todos_clientes(db)]
+    casos = [
+        ("clientes por nombre desc", ClienteCRUD.listar_clientes, clientes, 5,
+         {"orden": "nombre", "descendente": True}, lambda f: (f[2], f[0]), True),
+        ("clientes por correo", ClienteCRUD.listar_clientes, clientes, 5,
+         {"orden": "correo"}, lambda f: (f[3], f[0]), False),
+        ("ingredientes por stock", IngredienteCRUD.listar_ingredientes,
+         [(i.id, i.nombre, i.stock, i.unidad) for i in IngredienteCRUD.obtener_todos_ingredientes(db)], 500,
+         {"orden": "stock"}, lambda f: (f[2], f[0]), False),
+        ("menús por categoría desc", MenuCRUD.listar_menus,
+         [(m.id, m.nombre, m.precio, m.categoria or "", m.disponible, m.agotado) for m in MenuCRUD.obtener_todos_menus(db)], 5,
+         {"orden": "categoria", "descendente": True}, lambda f: (f[3], f[0]), True),
+    ]
+    for nombre, listar, todas, limite, kwargs, clave, descendente in casos:
+        paginado = recorrer_paginas(listar, db, limite, **kwargs)
+        esperado = sorted(todas, key=clave, reverse=descendente)
+        assert paginado == esperado, f"{nombre}: el recorrido paginado no coincide"
+        print(f"✓ {nombre}: {len(paginado)} filas en orden y sin repetir")
+
+    pedidos = recorrer_paginas(PedidoCRUD.listar_pedidos, db, 5, orden="total", descendente=False)
+    assert [(p.total, p.id) for p in pedidos] == sorted((p.total, p.id) for p in pedidos)
+    print(f"✓ pedidos por total: {len(pedidos)} filas")
+
+    with pytest.raises(Exception, match="No se puede ordenar") as error:
+        ClienteCRUD.listar_clientes(db, 5, orden="contraseña")
+    print(f"✓ Columna de orden desconocida rechazada: {error.value}")
+
+
+class TreeviewFalso:
+    """Reemplaza a ttk.Treeview (y a Frame/Scrollbar) guardando las filas en una lista."""
+
+    def __init__(self, *args, **kwargs):
+        self.filas = []        # [iid, valores] en el orden mostrado
+        self.insertadas = 0
+        self.vaciados = 0
+
+    def __getattr__(self, nombre):
+        # configure, heading, column, pack, yview, set...: sin efecto en las pruebas
+        return lambda *args, **kwargs: None
+
+    def winfo_height(self):
+        return 1
+
+    def get_children(self):
+        return [iid for iid, _ in self.filas]
+
+    def delete(self, *iids):
+        if iids and len(iids) == len(self.filas):
+            self.vaciados += 1
+        self.filas = [fila for fila in self.filas if fila[0] not in iids]
+
+    def insert(self, padre, indice, iid=None, values=()):
+        assert iid not in self.get_children(), f"Fila {iid} insertada dos veces"
+        self.filas.insert(len(self.filas) if indice == "end" else indice, [iid, tuple(values)])
+        self.insertadas += 1
+
+    def move(self, iid, padre, indice):
+        # Igual que Tk: el índice se cuenta sin la fila que se mueve
+        fila = self.filas.pop(self.get_children().index(iid))
+        self.filas.insert(indice, fila)
+
+    def item(self, iid, values=None):
+        self.filas[self.get_children().index(iid)][1] = tuple(values)
+
+
+def test_refresco_por_diferencias(db, sesiones, monkeypatch):
+    """Verifica que la tabla aplique solo los cambios sin vaciarse ni perder el orden."""
+    print("\n=== TESTING REFRESCO POR DIFERENCIAS ===")
+
+    from types import SimpleNamespace
+    import tabla_virtual
+    from tareas import ServicioDatos
+
+    monkeypatch.setattr(tabla_virtual, "ttk", SimpleNamespace(Frame=TreeviewFalso, Treeview=TreeviewFalso,
+                                                              Scrollbar=TreeviewFalso))
+    widget = WidgetFalso()
+    servicio = ServicioDatos(widget, sesiones)
+
+    try:
+        for i in range(16):
+            ClienteCRUD.crear_cliente(db, f"5{i:07d}-{i % 10}", f"Diferencias {i}")
+
+        tabla = tabla_virtual.TablaVirtual(
+            None, servicio, "clientes", [("ID", "id", 50), ("Nombre", "nombre", 200)],
+            ClienteCRUD.listar_clientes, ClienteCRUD.cambios_clientes,
+            formatear=lambda fila: (fila[0], fila[2]), orden="nombre", descendente=True
+        )
+        tabla.MARGEN_FILAS = 0  # Páginas de 10 filas: queda contenido sin cargar
+        tabla.actualizar()
+        widget.procesar()
+        arbol = tabla.treeview
+        assert len(arbol.filas) == 10 and tabla._siguiente is not None
+
+        def esperado():
+            """Filas que deben verse: las ordenadas hasta el cursor de la última página cargada."""
+            todas = sorted(((c.nombre, c.id) for c in ClienteCRUD.obtener_todos_clientes(db)), reverse=True)
+            return [fila_id for nombre, fila_id in todas if (nombre, fila_id) >= tuple(tabla._siguiente)]
+
+        assert arbol.get_children() == esperado()
+        insertadas = arbol.insertadas
+
+        # Alta que entra arriba, cambio de nombre, baja y alta fuera de lo cargado
+        nuevo = ClienteCRUD.crear_cliente(db, "59999999-9", "Zzz Diferencias nuevo")
+        mostrado = arbol.get_children()[3]
+        ClienteCRUD.actualizar_cliente(db, mostrado, nombre="Zzy Diferencias renombrado")
+        eliminado = arbol.get_children()[5]
+        ClienteCRUD.eliminar_cliente(db, eliminado)
+        lejano = ClienteCRUD.crear_cliente(db, "59999998-8", "Aaa Diferencias al final")
+
+        tabla.actualizar()
+        widget.procesar()
+        assert arbol.get_children() == esperado()
+        assert arbol.get_children()[:2] == [nuevo.id, mostrado]
+        assert eliminado not in arbol.get_children() and lejano.id not in arbol.get_children()
+        assert arbol.filas[1][1] == (mostrado, "Zzy Diferencias renombrado")
+        assert arbol.insertadas == insertadas + 1 and arbol.vaciados == 0
+        print(f"✓ Cambios aplicados sin recargar: 1 alta, 1 movida, 1 baja; {len(arbol.filas)} filas visibles")
+
+        # Sin cambios no se toca la tabla
+        tabla.actualizar()
+        widget.procesar()
+        assert arbol.insertadas == insertadas + 1 and arbol.get_children() == esperado()
+        print("✓ Actualizar sin cambios no modifica filas")
+    finally:
+        servicio.cerrar()
+
+
+def test_arranque_sin_importaciones_pesadas(capsys):
+    """Verifica que los módulos que usa la App al arrancar no importen matplotlib ni numpy."""
+    print("\n=== TESTING ARRANQUE SIN IMPORTACIONES PESADAS ===")
+
+    import os
+    import subprocess
+    import sys
+    from inicio import TiemposInicio
+
+    # Proceso aparte: este ya puede tener matplotlib cargado por otros tests
+    codigo = (
+        "import sys\n"
+        "import database, migraciones, tareas, tabla_virtual, inicio\n"
+        "import crud.cliente_crud, crud.ingrediente_crud, crud.menu_crud, crud.pedido_crud\n"
+        "print(','.join(m for m in ('matplotlib', 'numpy', 'graficos') if m in sys.modules))\n"
+    )
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    cargados = salida.stdout.strip()
+    print(f"Módulos pesados cargados al arrancar: {cargados or 'ninguno'}")
+    assert cargados == "", f"El arranque importa {cargados}"
+
+    tiempos = TiemposInicio()
+    tiempos.marcar("importaciones")
+    tiempos.marcar("ventana")
+    informe = tiempos.informe()
+    print(informe)
+    assert [fase for fase, _ in tiempos.fases] == ["importaciones", "ventana"]
+    assert "total" in informe and abs(tiempos.total - sum(d for _, d in tiempos.fases)) < 1e-9
+
+    # Sin activarlo el informe no se imprime
+    capsys.readouterr()
+    TiemposInicio(informar=False).mostrar(informe)
+    assert capsys.readouterr().out == ""
+    TiemposInicio(informar=True).mostrar(informe)
+    assert capsys.readouterr().out == informe + "\n"
+    print("✓ matplotlib se difiere hasta abrir la pestaña Gráficos")
+
+
+def test_monitor_cambios(motor, db, otra):
+    """Verifica que el monitor detecte qué tablas cambiaron y no lea nada si no hubo commits."""
+    print("\n=== TESTING MONITOR DE CAMBIOS ===")
+
+    from models import Ingrediente, VersionTabla
+    from monitor_cambios import MonitorCambios
+
+    def version(db, tabla):
+        fila = db.get(VersionTabla, tabla)
+        db.expire_all()
+        return fila.version if fila else 0
+
+    avisos = []
+    monitor = MonitorCambios(WidgetFalso(), avisos.append, motor=motor)
+
+    try:
+        # Sin commits: solo el PRAGMA, sin leer los contadores
+        lecturas = monitor.lecturas
+        for _ in range(100):
+            assert monitor.revisar() == set()
+        assert monitor.lecturas == lecturas
+        print("✓ 100 revisiones sin cambios no leen VersionesTablas")
+
+        antes = version(db, "Clientes")
+        cliente = ClienteCRUD.crear_cliente(otra, "49999999-9", "Cliente Monitor")
+        assert version(db, "Clientes") == antes + 1
+        assert monitor.revisar() == {"Clientes"}
+        assert monitor.revisar() == set()
+
+        # Un commit que toca varias tablas las informa juntas; un rollback no cuenta
+        ingrediente = IngredienteCRUD.crear_ingrediente(otra, "Ingrediente Monitor", 10.0, "kg")
+        MenuCRUD.crear_menu(otra, "Menú Monitor", "", 1000.0, receta={"Ingrediente Monitor": 1.0})
+        assert monitor.revisar() == {"Ingredientes", "Menus", "RecetaIngredientes", "RecetasPlanas"}
+        antes = version(db, "Ingredientes")
+        otra.query(Ingrediente).filter(Ingrediente.id == ingrediente.id).update({"stock": 5.0})
+        otra.rollback()
+        assert version(db, "Ingredientes") == antes and monitor.revisar() == set()
+
+        # UPDATE masivo sin pasar por los objetos
+        otra.query(Ingrediente).filter(Ingrediente.id == ingrediente.id).update({"stock": 5.0})
+        otra.commit()
+        assert monitor.revisar() == {"Ingredientes"}
+
+        ClienteCRUD.eliminar_cliente(otra, cliente.id)
+        assert monitor.revisar() == {"Clientes"}
+        print("✓ Inserciones, modificaciones masivas y eliminaciones se detectan por tabla")
+    finally:
+        monitor.detener()
+
+
+def test_monitor_cambios_errores(motor, monkeypatch):
+    """Verifica que un error repetido del monitor se informe una sola vez."""
+    print("\n=== TESTING ERRORES DEL MONITOR DE CAMBIOS ===")
+
+    from monitor_cambios import MonitorCambios
+
+    errores = []
+    monitor = MonitorCambios(WidgetFalso(), lambda tablas: None, motor=motor, al_error=errores.append)
+    fallas = [RuntimeError("database is locked")] * 3 + [None] + [RuntimeError("database is locked")]
+
+    def revisar():
+        falla = fallas.pop(0)
+        if falla is not None:
+            raise falla
+        return set()
+
+    monkeypatch.setattr(monitor, "revisar", revisar)
+    try:
+        for _ in range(5):
+            monitor._revisar()
+    finally:
+        monitor.detener()
+
+    # Tres fallas seguidas se informan una vez; tras una revisión correcta se vuelve a informar
+    assert [str(error) for error in errores] == ["database is locked"] * 2
+    print("✓ El mismo error no se repite en cada revisión")
+
+
+def test_cache_lecturas(motor, db, otra, monkeypatch):
+    """Verifica aciertos, invalidación al escribir, desalojo y vencimiento de la caché."""
+    print("\n=== TESTING CACHÉ DE LECTURAS ===")
+
+    from sqlalchemy import inspect
+
+    monkeypatch.setattr(cache_lecturas, "activa", True)
+
+    cliente = ClienteCRUD.crear_cliente(db, "48888888-8", "Cliente Caché")
+    ClienteCRUD.obtener_cliente_por_id(db, cliente.id)
+    with ContadorConsultas(motor) as consultas:
+        leido = ClienteCRUD.obtener_cliente_por_id(otra, cliente.id)
+    # El acierto no consulta y el objeto queda en la sesión que lo pidió
+    assert consultas.total == 0 and leido.nombre == "Cliente Caché"
+    assert inspect(leido).session is otra
+    assert cache_lecturas.aciertos == 1 and cache_lecturas.fallos == 1
+
+    # Un commit en otra sesión invalida la entrada de esa fila
+    cliente_id = cliente.id
+    ClienteCRUD.actualizar_cliente(otra, cliente_id, nombre="Cliente Caché Editado")
+    db.expire_all()
+    with ContadorConsultas(motor) as consultas:
+        assert ClienteCRUD.obtener_cliente_por_id(db, cliente_id).nombre == "Cliente Caché Editado"
+    assert consultas.total == 1
+
+    # Las búsquedas sin resultado también se guardan y se invalidan al insertar
+    assert IngredienteCRUD.obtener_ingrediente_por_nombre(db, "Ingrediente Caché") is None
+    with ContadorConsultas(motor) as consultas:
+        assert IngredienteCRUD.obtener_ingrediente_por_nombre(otra, "Ingrediente Caché") is None
+    assert consultas.total == 0
+    IngredienteCRUD.crear_ingrediente(otra, "Ingrediente Caché", 5.0, "kg")
+    assert IngredienteCRUD.obtener_ingrediente_por_nombre(db, "Ingrediente Caché").stock == 5.0
+
+    # Un menú leído por id se invalida al cambiar su disponibilidad
+    menu_id = MenuCRUD.crear_menu(db, "Menú Caché", "", 1500.0).id
+    assert MenuCRUD.obtener_menu_por_id(otra, menu_id).disponible == 1
+    MenuCRUD.cambiar_disponibilidad(otra, menu_id, False)
+    db.expire_all()
+    assert MenuCRUD.obtener_menu_por_id(db, menu_id).disponible == 0
+    print(f"✓ Invalidación al escribir: {cache_lecturas.estadisticas()}")
+
+    # Capacidad: se desaloja la entrada usada hace más tiempo
+    cache_lecturas.limpiar()
+    monkeypatch.setattr(cache_lecturas, "capacidad", 2)
+    otros = [ClienteCRUD.crear_cliente(db, f"4777777{i}-{i}", f"Cliente Caché {i}") for i in range(3)]
+    for otro in otros:
+        ClienteCRUD.obtener_cliente_por_id(db, otro.id)
+    assert cache_lecturas.desalojos == 1 and cache_lecturas.estadisticas()["entradas"] == 2
+
+    # Vencimiento: con TTL cero cada lectura vuelve a la base
+    monkeypatch.setattr(cache_lecturas, "ttl", 0)
+    cache_lecturas.limpiar()  # El TTL se fija al guardar cada entrada
+    ClienteCRUD.obtener_cliente_por_id(db, otros[2].id)
+    with ContadorConsultas(motor) as consultas:
+        ClienteCRUD.obtener_cliente_por_id(db, otros[2].id)
+    assert consultas.total == 1
+    print(f"✓ Desalojo y vencimiento: {cache_lecturas.estadisticas()}")
+
+
+def test_porciones_posibles(motor, db, crear_ingredientes, crear_menu):
+    """Verifica el cálculo vectorizado de porciones por menú y su invalidación por versiones."""
+    print("\n=== TESTING PORCIONES POSIBLES ===")
+
+    import time
+    import numpy as np
+    from consumo import MatrizRecetas, MotorConsumo
+
+    # Menú 3 sin receta: no depende del stock. 0.6 / 0.2 no debe perder una porción por redondeo
+    matriz = MatrizRecetas.desde_filas([1, 2, 3], [(2, "b", 0.2), (1, "a", 2.0), (1, "b", 0.5), (2, "a", 1.0)])
+    porciones = matriz.porciones(matriz.vector_ingredientes({"a": 7.0, "b": 0.6}))
+    assert porciones[:2].tolist() == [1.0, 3.0] and np.isinf(porciones[2])
+
+    # Catálogo grande: 5000 menús × 5000 ingredientes, 10 ingredientes por receta
+    azar = np.random.default_rng(7)
+    entradas = [(m, int(j), float(azar.uniform(0.1, 5.0)))
+                for m in range(5000) for j in azar.choice(5000, 10, replace=False)]
+    grande = MatrizRecetas.desde_filas(range(5000), entradas)
+    stock = grande.vector_ingredientes({j: float(azar.uniform(0, 100)) for j in range(5000)})
+    inicio = time.perf_counter()
+    resultado = grande.porciones(stock)
+    ms = (time.perf_counter() - inicio) * 1000
+    esperado = [min(int(stock[grande.indice_ingrediente[j]] / q + 1e-9) for _, j, q in entradas[m * 10:(m + 1) * 10])
+                for m in range(100)]
+    assert resultado[:100].tolist() == esperado
+    print(f"✓ 5000 menús × 5000 ingredientes en {ms:.1f} ms")
+    assert ms < 100
+
+    queso_id = crear_ingredientes({"Harina Porciones": 1000.0, "Queso Porciones": 300.0})["Queso Porciones"]
+    empanada_id = crear_menu("Empanada Porciones", 1500.0, receta={"Harina Porciones": 80.0, "Queso Porciones": 50.0})
+    pizza_id = crear_menu("Pizza Porciones", 6000.0, receta={"Harina Porciones": 300.0, "Queso Porciones": 200.0})
+
+    porciones = MotorConsumo.porciones_posibles(db)
+    assert (porciones[empanada_id], porciones[pizza_id]) == (6, 1)
+
+    # Sin cambios se responde desde la caché; un cambio de stock no reconstruye la matriz
+    matrices, recalculos = porciones_menus.matrices_construidas, porciones_menus.recalculos
+    with ContadorConsultas(motor) as consultas:
+        assert MotorConsumo.porciones_posibles(db) == porciones
+    assert consultas.total == 1 and porciones_menus.recalculos == recalculos
+
+    IngredienteCRUD.actualizar_stock(db, queso_id, -200.0)
+    porciones = MotorConsumo.porciones_posibles(db)
+    assert (porciones[empanada_id], porciones[pizza_id]) == (2, 0)
+    assert porciones_menus.matrices_construidas == matrices
+
+    MenuCRUD.actualizar_menu(db, pizza_id, receta={"Harina Porciones": 300.0})
+    porciones = MotorConsumo.porciones_posibles(db)
+    assert porciones[pizza_id] == 3 and porciones_menus.matrices_construidas == matrices + 1
+    print("✓ Caché invalidada por cambios de stock y de recetas")
+
+    # Los menús creados sin receta aparecen sin límite y los eliminados desaparecen
+    agua_id = crear_menu("Agua Porciones", 800.0)
+    porciones = MotorConsumo.porciones_posibles(db)
+    assert agua_id in porciones and porciones[agua_id] is None
+    MenuCRUD.eliminar_menu(db, empanada_id)
+    assert empanada_id not in MotorConsumo.porciones_posibles(db)
+    print("✓ Menú sin receta sin límite de porciones")
+
+
+def test_menus_agotados(motor, db, cliente, crear_ingredientes, crear_menu):
+    """Verifica que los cambios de stock recalculen `agotado` solo en los menús afectados."""
+    print("\n=== TESTING MENÚS AGOTADOS ===")
+
+    from models import Menu
+
+    cliente_id = cliente.id
+    arroz_id = crear_ingredientes({"Arroz Agotados": 300.0, "Pollo Agotados": 1000.0})["Arroz Agotados"]
+    arroz_pollo_id = crear_menu("Arroz con Pollo Agotados", 5000.0,
+                                receta={"Arroz Agotados": 200.0, "Pollo Agotados": 250.0})
+    pollo_id = crear_menu("Pollo Solo Agotados", 4000.0, receta={"Pollo Agotados": 250.0})
+    manual_id = crear_menu("Arroz Solo Agotados", 2000.0, receta={"Arroz Agotados": 50.0})
+    MenuCRUD.actualizar_menu(db, manual_id, disponible=0)
+
+    def agotados():
+        db.expire_all()
+        return {menu_id: db.get(Menu, menu_id).agotado for menu_id in (arroz_pollo_id, pollo_id, manual_id)}
+
+    assert set(agotados().values()) == {0}
+
+    # El pedido deja 100 g de arroz: solo el menú que necesita 200 g se agota
+    with ContadorConsultas(motor) as consultas:
+        PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": arroz_pollo_id, "cantidad": 1}])
+    assert agotados() == {arroz_pollo_id: 1, pollo_id: 0, manual_id: 0}
+    con_scan = planes_con_scan(motor, consultas.sentencias, consultas.parametros)
+    assert not con_scan, con_scan
+    print(f"✓ Pedido en {consultas.total} sentencias, sin recorrer el catálogo")
+
+    disponibles = {menu.id for menu in MenuCRUD.obtener_menus_disponibles(db)}
+    assert arroz_pollo_id not in disponibles and pollo_id in disponibles and manual_id not in disponibles
+    # Un menú agotado se rechaza con el mensaje de stock insuficiente de siempre
+    with pytest.raises(Exception, match="Stock insuficiente para 'Arroz Agotados'. Disponible: 100.0"):
+        PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": arroz_pollo_id, "cantidad": 1}])
+
+    # Sin cambios de estado no se escribe ningún menú
+    with ContadorConsultas(motor) as consultas:
+        IngredienteCRUD.actualizar_stock(db, arroz_id, -10.0)
+    assert not any(s.startswith("UPDATE \"Menus\"") for s in consultas.sentencias)
+
+    # Al reponer vuelve a estar disponible; el menú deshabilitado a mano sigue deshabilitado
+    IngredienteCRUD.actualizar_ingrediente(db, arroz_id, stock=500.0)
+    assert set(agotados().values()) == {0}
+    assert db.get(Menu, manual_id).disponible == 0
+    assert arroz_pollo_id in {menu.id for menu in MenuCRUD.obtener_menus_disponibles(db)}
+    print("✓ Reposición restablece los menús y respeta la deshabilitación manual")
+
+
+def test_validacion_recetas_por_lotes(motor, db, crear_ingredientes):
+    """Verifica la validación de recetas en una consulta, con todos los errores juntos."""
+    print("\n=== TESTING VALIDACIÓN DE RECETAS POR LOTES ===")
+
+    from models import Menu
+
+    crear_ingredientes({f"Insumo Lotes {i}": 100.0 for i in range(20)})
+
+    # Nombres con otras mayúsculas y espacios: una sola consulta sobre el índice
+    receta = {f"  insumo   LOTES {i} ": 1.0 for i in range(10)}
+    with ContadorConsultas(motor) as consultas:
+        menu = MenuCRUD.crear_menu(db, "Menú Lotes", "", 1000.0, receta=receta)
+    consultas_ingredientes = [s for s in consultas.sentencias
+                              if s.startswith("SELECT") and 'FROM "Ingredientes"' in s]
+    assert len(consultas_ingredientes) == 1, consultas_ingredientes
+    assert not planes_con_scan(motor, consultas.sentencias, consultas.parametros)
+    assert sorted(MenuCRUD.obtener_menu_por_id(db, menu.id).receta) == sorted(
+        f"Insumo Lotes {i}" for i in range(10))
+    print("✓ Receta resuelta sin distinguir mayúsculas en 1 consulta")
+
+    # Todos los problemas en un solo error, también al actualizar
+    mala = {"Insumo Lotes 1": -1.0, "Inexistente Lotes": 1.0, "insumo lotes 1": 2.0, "Insumo Lotes 2": "abc"}
+    for operacion in (lambda: MenuCRUD.crear_menu(db, "Menú Malo Lotes", "", 1000.0, receta=mala),
+                      lambda: MenuCRUD.actualizar_menu(db, menu.id, receta=mala)):
+        with pytest.raises(Exception) as error:
+            operacion()
+        mensaje = str(error.value)
+        for fragmento in ("mayor que cero", "no existe", "duplicado", "no es un número"):
+            assert fragmento in mensaje, mensaje
+    assert len(MenuCRUD.obtener_menu_por_id(db, menu.id).receta) == 10
+    print("✓ Cuatro errores informados juntos al crear y al actualizar")
+
+    # Creación masiva: 300 menús en una transacción, con una consulta de ingredientes
+    menus = [{"nombre": f"Importado Lotes {i}", "precio": 1000 + i, "categoria": "Lotes",
+              "receta": {f"insumo lotes {i % 20}": 10.0, f"insumo lotes {(i + 1) % 20}": 200.0}}
+             for i in range(300)]
+    with ContadorConsultas(motor) as consultas:
+        creados = MenuCRUD.crear_menus(db, menus)
+    assert len(creados) == 300
+    consultas_ingredientes = [s for s in consultas.sentencias
+                              if s.startswith("SELECT") and 'FROM "Ingredientes"' in s]
+    assert len(consultas_ingredientes) == 1
+    # 200 g por porción con 100 g de stock: todos quedan agotados
+    assert db.query(Menu).filter(Menu.categoria == "Lotes", Menu.agotado == 1).count() == 300
+    print(f"✓ 300 menús creados en {consultas.total} sentencias")
+
+    # Errores en varios menús: no se crea ninguno
+    malos = [{"nombre": "Masivo Lotes 1", "precio": 1500, "receta": {"Insumo Lotes 3": 5}},
+             {"nombre": "Masivo Lotes 2", "precio": "gratis", "receta": {"Insumo Lotes 3": 5}},
+             {"nombre": "Masivo Lotes 3", "precio": 1500, "receta": '{"Falta Lotes": 5}'}]
+    with pytest.raises(Exception) as error:
+        MenuCRUD.crear_menus(db, malos)
+    mensaje = str(error.value)
+    assert "Menú 2" in mensaje and "Menú 3" in mensaje and "Menú 1" not in mensaje, mensaje
+    assert db.query(Menu).filter(Menu.nombre.like("Masivo Lotes%")).count() == 0
+    print("✓ Lote con errores rechazado completo, con cada error indicado")
+
+
+def test_catalogo_menus_importacion_exportacion(motor, db, crear_ingredientes, tmp_path):
+    """Verifica la importación por lotes del catálogo de menús y la exportación de ida y vuelta."""
+    print("\n=== TESTING IMPORTACIÓN Y EXPORTACIÓN DE MENÚS ===")
+
+    import json
+    import os
+    import time
+    from models import Menu
+
+    crear_ingredientes({f"Insumo Catálogo {i}": 50.0 for i in range(10)})
+
+    carpeta = str(tmp_path)
+    archivo_csv = os.path.join(carpeta, "catalogo.csv")
+    with open(archivo_csv, "w", encoding="utf-8", newline="") as f:
+        f.write("nombre,descripcion,precio,categoria,disponible,receta\n")
+        for i in range(2000):
+            receta = json.dumps({f"insumo catálogo {i % 10}": 10.0, f"Insumo Catálogo {(i + 3) % 10}": 1.5})
+            f.write(f'Plato Catálogo {i},"Plato, de temporada",{1000 + i},Catálogo,1,"{receta.replace(chr(34), chr(34) * 2)}"\n')
+        f.write("Plato Catálogo Malo 1,,gratis,Catálogo,1,\n")
+        f.write('Plato Catálogo Malo 2,,1000,Catálogo,1,"{""Falta Catálogo"": 1}"\n')
+        f.write('Plato Catálogo Malo 3,,1000,Catálogo,1,"{sin comillas}"\n')
+
+    with ContadorConsultas(motor) as consultas:
+        inicio = time.perf_counter()
+        resultados = MenuCRUD.cargar_desde_archivo(db, archivo_csv, tamano_lote=500)
+        segundos_importacion = time.perf_counter() - inicio
+    assert resultados["exitosos"] == 2000 and resultados["errores"] == 3, resultados["mensajes"]
+    assert os.path.exists(resultados["archivo_errores"])
+    # Cinco lotes: una consulta de ingredientes por lote, ninguna por fila
+    consultas_ingredientes = [s for s in consultas.sentencias
+                              if s.startswith("SELECT") and 'FROM "Ingredientes"' in s]
+    assert len(consultas_ingredientes) == 5 and consultas.total < 60, consultas.total
+    assert not planes_con_scan(motor, consultas.sentencias, consultas.parametros)
+    menu = db.query(Menu).filter(Menu.nombre == "Plato Catálogo 7").one()
+    assert menu.descripcion == "Plato, de temporada" and menu.receta == {
+        "Insumo Catálogo 7": 10.0, "Insumo Catálogo 0": 1.5}
+    print(f"✓ 2000 menús importados en {segundos_importacion:.2f} s y {consultas.total} sentencias")
+
+    # Exportar a JSON lines, cambiar precios y recetas, y volver a importar: actualiza
+    archivo_jsonl = os.path.join(carpeta, "catalogo.jsonl")
+    inicio = time.perf_counter()
+    exportados = MenuCRUD.exportar_a_archivo(db, archivo_jsonl)
+    segundos_exportacion = time.perf_counter() - inicio
+    assert exportados == db.query(Menu).count()
+    modificado = os.path.join(carpeta, "modificado.jsonl")
+    with open(archivo_jsonl, encoding="utf-8") as entrada, open(modificado, "w", encoding="utf-8") as salida:
+        for linea in entrada:
+            datos = json.loads(linea)
+            if datos["nombre"].startswith("Plato Catálogo"):
+                datos["precio"] += 1
+                datos["receta"] = {"Insumo Catálogo 1": 60.0}
+            salida.write(json.dumps(datos) + "\n")
+    menus_antes = db.query(Menu).count()
+    resultados = MenuCRUD.cargar_desde_archivo(db, modificado)
+    assert resultados["errores"] == 0 and db.query(Menu).count() == menus_antes
+    db.expire_all()
+    menu = db.query(Menu).filter(Menu.nombre == "Plato Catálogo 7").one()
+    assert menu.precio == 1008.0 and menu.receta == {"Insumo Catálogo 1": 60.0}
+    # 60 g por porción con 50 g de stock: la receta nueva deja el menú agotado
+    assert menu.agotado == 1
+    print(f"✓ {exportados} menús exportados en {segundos_exportacion:.2f} s y reimportados como actualización")
+
+    # Un CSV exportado se vuelve a leer sin cambios
+    primero, segundo = os.path.join(carpeta, "a.csv"), os.path.join(carpeta, "b.csv")
+    MenuCRUD.exportar_a_archivo(db, primero)
+    assert MenuCRUD.cargar_desde_archivo(db, primero)["errores"] == 0
+    MenuCRUD.exportar_a_archivo(db, segundo)
+    with open(primero, encoding="utf-8") as a, open(segundo, encoding="utf-8") as b:
+        assert a.read() == b.read()
+    print("✓ CSV exportado e importado de ida y vuelta sin diferencias")
+
+
+def test_subrecetas_anidadas(motor, db, cliente, crear_ingredientes, crear_menu):
+    """Verifica el aplanado de subrecetas, la detección de ciclos y su uso en pedidos y reportes."""
+    print("\n=== TESTING SUBRECETAS ANIDADAS ===")
+
+    from sqlalchemy import select
+    from models import Ingrediente, RecetaPlana
+    from consumo import MotorConsumo
+
+    def plana(menu_id):
+        return dict(db.execute(
+            select(Ingrediente.nombre, RecetaPlana.cantidad)
+            .join(Ingrediente, Ingrediente.id == RecetaPlana.ingrediente_id)
+            .where(RecetaPlana.menu_id == menu_id)
+        ).all())
+
+    cliente_id = cliente.id
+    tomate_id = crear_ingredientes({"Tomate Subrecetas": 1000.0, "Harina Subrecetas": 5000.0})["Tomate Subrecetas"]
+    crear_ingredientes({"Aceite Subrecetas": 1000.0}, unidad="ml")
+
+    salsa_id = crear_menu("Salsa Subrecetas", 1.0, disponible=False,
+                          receta={"Tomate Subrecetas": 100.0, "Aceite Subrecetas": 10.0})
+    masa_id = crear_menu("Masa Subrecetas", 1.0, disponible=False, receta={"Harina Subrecetas": 200.0})
+    pizza_id = crear_menu("Pizza Subrecetas", 8000.0, receta={"Aceite Subrecetas": 5.0},
+                          subrecetas={"Salsa Subrecetas": 0.5, "Masa Subrecetas": 1})
+    combo_id = crear_menu("Combo Subrecetas", 15000.0, subrecetas={"Pizza Subrecetas": 2, "Salsa Subrecetas": 1})
+    assert plana(pizza_id) == {"Tomate Subrecetas": 50.0, "Aceite Subrecetas": 10.0, "Harina Subrecetas": 200.0}
+    assert plana(combo_id) == {"Tomate Subrecetas": 200.0, "Aceite Subrecetas": 30.0, "Harina Subrecetas": 400.0}
+    assert MenuCRUD.obtener_menu_por_id(db, combo_id).subrecetas == {"Pizza Subrecetas": 2.0, "Salsa Subrecetas": 1.0}
+
+    # El pedido lee la receta aplanada: mismas sentencias que con un menú sin subrecetas
+    with ContadorConsultas(motor) as consultas:
+        PedidoCRUD.crear_pedido(db, cliente_id, [{"menu_id": combo_id, "cantidad": 2}])
+    assert not any("RecetaSubrecetas" in s for s in consultas.sentencias)
+    db.expire_all()
+    assert db.get(Ingrediente, tomate_id).stock == 600.0
+    consumo = MotorConsumo.consumo_ingredientes(db, menu_id=combo_id)
+    assert consumo["Tomate Subrecetas"] == 400.0 and consumo["Harina Subrecetas"] == 800.0
+    print(f"✓ Pedido de un menú con subrecetas en {consultas.total} sentencias, sin expandir el árbol")
+
+    # Cambiar la salsa actualiza los menús que la usan, a cualquier profundidad
+    MenuCRUD.actualizar_menu(db, salsa_id, receta={"Tomate Subrecetas": 200.0, "Aceite Subrecetas": 10.0})
+    assert plana(pizza_id)["Tomate Subrecetas"] == 100.0 and plana(combo_id)["Tomate Subrecetas"] == 400.0
+
+    # Con 600 g de tomate el combo (400 g por porción) alcanza; bajando el stock se agota por la salsa
+    IngredienteCRUD.actualizar_stock(db, tomate_id, -300.0)
+    disponibles = {menu.id for menu in MenuCRUD.obtener_menus_disponibles(db)}
+    assert combo_id not in disponibles and pizza_id in disponibles
+    print("✓ Cambios en una subreceta llegan a todos los menús que la usan")
+
+    # Ciclos: directos, indirectos y consigo mismo; no se guarda nada
+    for menu_id, subrecetas in ((salsa_id, {"Combo Subrecetas": 1}), (masa_id, {"Masa Subrecetas": 1})):
+        with pytest.raises(Exception, match="ciclo"):
+            MenuCRUD.actualizar_menu(db, menu_id, subrecetas=subrecetas)
+    assert MenuCRUD.obtener_menu_por_id(db, salsa_id).subrecetas is None
+    assert plana(combo_id)["Tomate Subrecetas"] == 400.0
+    with pytest.raises(Exception) as error:
+        MenuCRUD.eliminar_menu(db, salsa_id)
+    assert "Pizza Subrecetas" in str(error.value) and "Combo Subrecetas" in str(error.value)
+    print("✓ Ciclos rechazados y subrecetas en uso protegidas")
+
+
+def test_unidad_de_trabajo(motor, db, otra):
+    """Verifica que una unidad de trabajo confirme una sola vez y deshaga todo ante un error."""
+    print("\n=== TESTING UNIDAD DE TRABAJO ===")
+
+    from database import unidad_de_trabajo
+
+    # Muchas operaciones, un solo commit y un solo incremento de versiones
+    with ContadorConsultas(motor) as consultas:
+        with unidad_de_trabajo(db):
+            with ContadorConsultas(motor) as consultas_clientes:
+                clientes = [ClienteCRUD.crear_cliente(db, f"UT{i:05d}-1", f"Cliente Unidad {i}")
+                            for i in range(50)]
+            # Por cliente: verificar el RUT e insertar; sin commit ni refresh
+            assert consultas_clientes.total == 100 and consultas_clientes.commits == 0
+            ingrediente = IngredienteCRUD.crear_ingrediente(db, "Harina Unidad", 100.0, "gramos")
+            IngredienteCRUD.actualizar_stock(db, ingrediente.id, 20.0)
+            menu = MenuCRUD.crear_menu(db, "Pan Unidad", "", 500.0, receta={"Harina Unidad": 50.0})
+            PedidoCRUD.crear_pedido(db, clientes[0].id, [{"menu_id": menu.id, "cantidad": 2}])
+            # Dentro de la unidad otra sesión todavía no ve nada
+            assert ClienteCRUD.obtener_cliente_por_id(otra, clientes[0].id) is None
+    assert consultas.commits == 1
+    assert len([s for s in consultas.sentencias if "VersionesTablas" in s]) == 1
+    # La operación siguiente vio el stock que dejó la anterior: 100 + 20 - 2 * 50
+    assert IngredienteCRUD.obtener_ingrediente_por_id(otra, ingrediente.id).stock == 20.0
+    print(f"✓ 54 operaciones en 1 commit ({consultas.total} sentencias)")
+
+    # Un error al salir del bloque deshace todo
+    with pytest.raises(Exception, match="(?i)rut"):
+        with unidad_de_trabajo(db):
+            ClienteCRUD.crear_cliente(db, "UT99991-1", "Cliente Unidad Deshecho")
+            IngredienteCRUD.actualizar_stock(db, ingrediente.id, -5.0)
+            ClienteCRUD.crear_cliente(db, "UT00000-1", "Repetido")  # RUT ya usado arriba
+    assert ClienteCRUD.obtener_cliente_por_rut(otra, "UT99991-1") is None
+    assert IngredienteCRUD.obtener_ingrediente_por_id(otra, ingrediente.id).stock == 20.0
+
+    # También si el error se captura dentro del bloque: la unidad no confirma a medias
+    with pytest.raises(Exception, match="unidad de trabajo"):
+        with unidad_de_trabajo(db):
+            cliente = ClienteCRUD.crear_cliente(db, "UT99992-2", "Cliente Unidad Capturado")
+            ClienteCRUD.obtener_cliente_por_id(db, cliente.id)  # No debe quedar en la caché
+            try:
+                PedidoCRUD.crear_pedido(db, cliente.id, [{"menu_id": menu.id, "cantidad": 1}])
+            except Exception:
+                pass  # 20 g de harina no alcanzan para un pan de 50 g
+            ClienteCRUD.crear_cliente(db, "UT99993-3", "Cliente Unidad Posterior")
+    for rut in ("UT99992-2", "UT99993-3"):
+        assert ClienteCRUD.obtener_cliente_por_rut(otra, rut) is None
+    print("✓ Un error deshace la unidad completa, aunque se capture dentro")
+
+    # Una unidad dentro de otra se suma a la exterior; fuera de una unidad todo sigue igual
+    with ContadorConsultas(motor) as consultas:
+        with unidad_de_trabajo(db):
+            ClienteCRUD.crear_cliente(db, "UT99994-4", "Cliente Unidad Externa")
+            with unidad_de_trabajo(db):
+                ClienteCRUD.crear_cliente(db, "UT99995-5", "Cliente Unidad Interna")
+        ClienteCRUD.crear_cliente(db, "UT99996-6", "Cliente Sin Unidad")
+    assert consultas.commits == 2
+    print("✓ Unidades anidadas y operaciones sueltas")
+
+
+if __name__ == "__main__":
+    # Las pruebas usan fixtures de pytest: se ejecutan con pytest, mostrando lo que imprimen
+    sys.exit(pytest.main([__file__, "-s", "-q"]))